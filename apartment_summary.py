@@ -0,0 +1,312 @@
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QLabel, QMessageBox, QPushButton, QVBoxLayout, QWidget
+
+from connection import pooled_connection
+from table_model import TableModel, create_table_view
+from workers import BackgroundTask, start_task
+
+# Сводка по домам: число квартир и их общая площадь, число ремонтов и из них идущих сейчас.
+# Хранится в таблице apartment_summary и обновляется триггерами на flat и current_repair при
+# каждом изменении, поэтому сводка читается за O(домов), без чтения квартир и ремонтов.
+# Триггеры срабатывают один раз на команду (FOR EACH STATEMENT) и берут измененные строки из
+# переходных таблиц, так что COPY и массовое удаление дают одно обновление на дом. Строка
+# сводки нового дома создается триггером на apartment, TRUNCATE квартир или ремонтов обнуляет
+# их счетчики.
+# "Идущие сейчас" ремонты посчитаны на дату active_on из apartment_summary_state: при открытии
+# сводки в новый день пересчитываются только дома, у которых ремонт начался или закончился
+# между прежней датой и сегодняшней (refresh_apartment_summary)
+
+SUMMARY_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS public.apartment_summary (
+        cod_num_hom varchar(20) PRIMARY KEY REFERENCES public.apartment (cod_num_hom) ON DELETE CASCADE,
+        flats integer NOT NULL DEFAULT 0,
+        flats_square numeric NOT NULL DEFAULT 0,
+        repairs integer NOT NULL DEFAULT 0,
+        active_repairs integer NOT NULL DEFAULT 0)""",
+    # Одна строка: дата, на которую посчитаны active_repairs
+    """CREATE TABLE IF NOT EXISTS public.apartment_summary_state (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        active_on date NOT NULL)""",
+]
+
+# Строки квартир без существующего дома (старые данные до внешних ключей) в сводку не попадают
+FLAT_TRIGGER_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.apartment_summary_flat_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE public.apartment_summary AS summary
+        SET flats = summary.flats - changed.flats, flats_square = summary.flats_square - changed.square
+        FROM (SELECT aprtmt_uid, count(*) AS flats, sum(square_flt) AS square
+              FROM old_rows GROUP BY aprtmt_uid) AS changed
+        WHERE summary.cod_num_hom = changed.aprtmt_uid;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO public.apartment_summary AS summary (cod_num_hom, flats, flats_square)
+        SELECT aprtmt_uid, count(*), sum(square_flt) FROM new_rows
+        WHERE aprtmt_uid IN (SELECT cod_num_hom FROM public.apartment)
+        GROUP BY aprtmt_uid
+        ON CONFLICT (cod_num_hom) DO UPDATE
+        SET flats = summary.flats + excluded.flats, flats_square = summary.flats_square + excluded.flats_square;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Дата active_on читается с блокировкой FOR SHARE: пока транзакция с изменением ремонтов не
+# завершена, refresh_apartment_summary не сдвинет дату и не пересчитает дома без ее строк
+REPAIR_TRIGGER_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.apartment_summary_repair_change() RETURNS trigger AS $$
+DECLARE
+    summary_day date;
+BEGIN
+    SELECT active_on INTO summary_day FROM public.apartment_summary_state FOR SHARE;
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE public.apartment_summary AS summary
+        SET repairs = summary.repairs - changed.repairs, active_repairs = summary.active_repairs - changed.active
+        FROM (SELECT cod_num_hom, count(*) AS repairs,
+                     count(*) FILTER (WHERE date_start <= summary_day AND date_end >= summary_day) AS active
+              FROM old_rows GROUP BY cod_num_hom) AS changed
+        WHERE summary.cod_num_hom = changed.cod_num_hom;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO public.apartment_summary AS summary (cod_num_hom, repairs, active_repairs)
+        SELECT cod_num_hom, count(*), count(*) FILTER (WHERE date_start <= summary_day AND date_end >= summary_day)
+        FROM new_rows
+        WHERE cod_num_hom IN (SELECT cod_num_hom FROM public.apartment)
+        GROUP BY cod_num_hom
+        ON CONFLICT (cod_num_hom) DO UPDATE
+        SET repairs = summary.repairs + excluded.repairs,
+            active_repairs = summary.active_repairs + excluded.active_repairs;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Новый дом: строка сводки с уже имеющимися квартирами и ремонтами (старые строки без внешних
+# ключей могут ссылаться на дом, которого еще не было)
+APARTMENT_TRIGGER_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.apartment_summary_apartment_insert() RETURNS trigger AS $$
+DECLARE
+    summary_day date;
+BEGIN
+    SELECT active_on INTO summary_day FROM public.apartment_summary_state FOR SHARE;
+    INSERT INTO public.apartment_summary AS summary (cod_num_hom, flats, flats_square, repairs, active_repairs)
+    SELECT new_rows.cod_num_hom, flats.flats, coalesce(flats.square, 0), repairs.repairs, repairs.active
+    FROM new_rows
+    CROSS JOIN LATERAL (SELECT count(*) AS flats, sum(square_flt) AS square
+                        FROM public.flat WHERE aprtmt_uid = new_rows.cod_num_hom) AS flats
+    CROSS JOIN LATERAL (SELECT count(*) AS repairs,
+                               count(*) FILTER (WHERE date_start <= summary_day AND date_end >= summary_day) AS active
+                        FROM public.current_repair WHERE cod_num_hom = new_rows.cod_num_hom) AS repairs
+    ON CONFLICT (cod_num_hom) DO UPDATE
+    SET flats = excluded.flats, flats_square = excluded.flats_square,
+        repairs = excluded.repairs, active_repairs = excluded.active_repairs;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# TRUNCATE не заполняет переходные таблицы и не вызывает триггеры DELETE: счетчики очищенной
+# таблицы обнуляются у всех домов
+TRUNCATE_TRIGGER_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.apartment_summary_truncate() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'flat' THEN
+        UPDATE public.apartment_summary SET flats = 0, flats_square = 0
+        WHERE flats <> 0 OR flats_square <> 0;
+    ELSE
+        UPDATE public.apartment_summary SET repairs = 0, active_repairs = 0
+        WHERE repairs <> 0 OR active_repairs <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Ремонт идет в один из дней и не идет в другой, только если он начался или закончился между
+# ними: такие дома находятся по индексам сортировки date_start и date_end (paging.py), а
+# ремонты дома - по индексу внешнего ключа cod_num_hom (schema.py)
+ACTIVITY_CHANGED_SQL = """
+    SELECT cod_num_hom FROM public.current_repair WHERE date_start BETWEEN %(first)s AND %(last)s
+    UNION
+    SELECT cod_num_hom FROM public.current_repair WHERE date_end BETWEEN %(first)s AND %(last)s"""
+
+REFRESH_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.refresh_apartment_summary() RETURNS date AS $$
+DECLARE
+    previous date;
+BEGIN
+    SELECT active_on INTO previous FROM public.apartment_summary_state FOR UPDATE;
+    IF previous = current_date THEN
+        RETURN previous;
+    END IF;
+    UPDATE public.apartment_summary AS summary
+    SET active_repairs = (SELECT count(*) FROM public.current_repair AS repair
+                          WHERE repair.cod_num_hom = summary.cod_num_hom
+                            AND repair.date_start <= current_date AND repair.date_end >= current_date)
+    WHERE summary.cod_num_hom IN (""" + ACTIVITY_CHANGED_SQL % {
+    'first': 'least(previous, current_date)', 'last': 'greatest(previous, current_date)'} + """);
+    UPDATE public.apartment_summary_state SET active_on = current_date;
+    RETURN current_date;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Заполнение по уже имеющимся строкам (выполняется после создания триггеров в той же
+# транзакции: изменения, сделанные другими рабочими местами, ждут ее завершения). Имеющиеся
+# строки сводки пересчитываются, идущие ремонты - на дату active_on
+FILL_SQL = [
+    "INSERT INTO public.apartment_summary_state (active_on) VALUES (current_date) ON CONFLICT DO NOTHING",
+    """INSERT INTO public.apartment_summary AS summary (cod_num_hom, flats, flats_square, repairs, active_repairs)
+    SELECT apartment.cod_num_hom, coalesce(flats.flats, 0), coalesce(flats.square, 0),
+           coalesce(repairs.repairs, 0), coalesce(repairs.active, 0)
+    FROM public.apartment
+    LEFT JOIN (SELECT aprtmt_uid, count(*) AS flats, sum(square_flt) AS square
+               FROM public.flat GROUP BY aprtmt_uid) AS flats ON flats.aprtmt_uid = apartment.cod_num_hom
+    LEFT JOIN (SELECT cod_num_hom, count(*) AS repairs,
+                      count(*) FILTER (WHERE date_start <= state.active_on AND date_end >= state.active_on) AS active
+               FROM public.current_repair, public.apartment_summary_state AS state
+               GROUP BY cod_num_hom) AS repairs
+           ON repairs.cod_num_hom = apartment.cod_num_hom
+    ON CONFLICT (cod_num_hom) DO UPDATE
+    SET flats = excluded.flats, flats_square = excluded.flats_square,
+        repairs = excluded.repairs, active_repairs = excluded.active_repairs
+    WHERE (summary.flats, summary.flats_square, summary.repairs, summary.active_repairs)
+          IS DISTINCT FROM (excluded.flats, excluded.flats_square, excluded.repairs, excluded.active_repairs)""",
+]
+
+# Таблица и функция обновления сводки, которую вызывают ее триггеры
+SUMMARY_TRIGGERS = [
+    ('flat', 'apartment_summary_flat_change'),
+    ('current_repair', 'apartment_summary_repair_change'),
+]
+# Таблицы, после TRUNCATE которых обнуляются их счетчики сводки
+SUMMARY_TRUNCATE_TABLES = [table for table, _ in SUMMARY_TRIGGERS]
+_TRANSITION_TABLES = {
+    'INSERT': 'NEW TABLE AS new_rows',
+    'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'OLD TABLE AS old_rows',
+}
+
+# Строки сводки в порядке кодов домов; заселенность - доля квартир дома, внесенных в базу
+SUMMARY_QUERY = """
+    SELECT apartment.cod_num_hom, apartment.adress, apartment.num_of_flts, coalesce(summary.flats, 0),
+           coalesce(round(100.0 * coalesce(summary.flats, 0) / nullif(apartment.num_of_flts, 0), 1), 0),
+           coalesce(summary.flats_square, 0), coalesce(summary.repairs, 0), coalesce(summary.active_repairs, 0)
+    FROM public.apartment
+    LEFT JOIN public.apartment_summary AS summary ON summary.cod_num_hom = apartment.cod_num_hom
+    ORDER BY apartment.cod_num_hom"""
+
+SUMMARY_HEADERS = ['Код', 'Адрес', 'Квартир в доме', 'Квартир в базе', 'Заселенность, %', 'Площадь квартир',
+                   'Ремонтов', 'Идет ремонтов']
+
+
+def summary_trigger_sql(table, function):
+    # Переходные таблицы задаются только для триггера на одно событие, поэтому их три
+    statements = []
+    for event, transition in _TRANSITION_TABLES.items():
+        name = f'{table}_summary_{event.lower()}'
+        statements.append(f"DROP TRIGGER IF EXISTS {name} ON public.{table}")
+        statements.append(f"CREATE TRIGGER {name} AFTER {event} ON public.{table} REFERENCING {transition} "
+                          f"FOR EACH STATEMENT EXECUTE FUNCTION public.{function}()")
+    return statements
+
+
+def summary_truncate_trigger_sql(table):
+    name = f'{table}_summary_truncate'
+    return [f"DROP TRIGGER IF EXISTS {name} ON public.{table}",
+            f"CREATE TRIGGER {name} AFTER TRUNCATE ON public.{table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION public.apartment_summary_truncate()"]
+
+
+def apartment_trigger_sql():
+    return ["DROP TRIGGER IF EXISTS apartment_summary_insert ON public.apartment",
+            "CREATE TRIGGER apartment_summary_insert AFTER INSERT ON public.apartment "
+            "REFERENCING NEW TABLE AS new_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION public.apartment_summary_apartment_insert()"]
+
+
+def summary_sql():
+    # Команды изменения схемы для schema.py; повторяемы, повторный запуск пересчитывает сводку
+    statements = SUMMARY_TABLES_SQL + [FLAT_TRIGGER_FUNCTION_SQL, REPAIR_TRIGGER_FUNCTION_SQL,
+                                       APARTMENT_TRIGGER_FUNCTION_SQL, TRUNCATE_TRIGGER_FUNCTION_SQL,
+                                       REFRESH_FUNCTION_SQL]
+    for table, function in SUMMARY_TRIGGERS:
+        statements += summary_trigger_sql(table, function)
+    for table in SUMMARY_TRUNCATE_TABLES:
+        statements += summary_truncate_trigger_sql(table)
+    statements += apartment_trigger_sql()
+    return statements + FILL_SQL + ["ANALYZE public.apartment_summary"]
+
+
+def refresh_summary(task=None):
+    # Сдвигает дату идущих ремонтов на сегодня; возвращает дату, на которую посчитана сводка
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT public.refresh_apartment_summary()")
+        active_on = cursor.fetchone()[0]
+        connection.commit()
+        cursor.close()
+    return active_on
+
+
+class ApartmentSummaryWindow(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Сводка по многоквартирным домам")
+        self.resize(1280, 720)
+        self.refresh_task = None
+        # Дата, на которую посчитаны идущие ремонты
+        self.active_on = None
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        self.model = TableModel(SUMMARY_HEADERS)
+        self.table = create_table_view(self.model)
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        layout.addWidget(self.table)
+
+        self.lbl_state = QLabel("Загрузка данных...")
+        layout.addWidget(self.lbl_state)
+
+        btn_refresh = QPushButton("Обновить данные")
+        btn_refresh.clicked.connect(self.refresh_data)
+        layout.addWidget(btn_refresh)
+
+        self.setLayout(layout)
+
+        QTimer.singleShot(0, self.refresh_data)
+
+    def refresh_data(self):
+        # Сначала в фоне пересчитываются идущие ремонты (если наступил новый день), затем
+        # загружаются строки сводки
+        self.lbl_state.setText("Загрузка данных...")
+        self.refresh_task = BackgroundTask(refresh_summary)
+        self.refresh_task.signals.finished.connect(self.load_rows)
+        self.refresh_task.signals.failed.connect(self.show_load_error)
+        start_task(self.refresh_task)
+
+    def load_rows(self, active_on):
+        self.refresh_task = None
+        self.active_on = active_on
+        self.model.load(SUMMARY_QUERY)
+
+    def on_loading_changed(self, loading):
+        if loading or self.active_on is None:
+            self.lbl_state.setText("Загрузка данных...")
+        else:
+            self.lbl_state.setText(f"Идущие ремонты на {self.active_on:%d.%m.%Y}")
+
+    def show_load_error(self, error):
+        self.lbl_state.setText("")
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
+
+    def closeEvent(self, event):
+        self.model.close_stream()
+        super().closeEvent(event)
@@ -1,8 +1,17 @@
 import psycopg2
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QMessageBox, QDialog
-from connection import connect_to_database
-from error import (correct_cod_aprtmt, contains_only_cor_text, has_correct_length, is_empty,
-                   contains_only_numb, is_cor_date)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QDialog
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from apartment_summary import ApartmentSummaryWindow
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 class ApartmentWindow(QWidget):
     def __init__(self):
@@ -15,11 +24,33 @@ class ApartmentWindow(QWidget):
         layout = QVBoxLayout()
 
         # Создаем таблицу для отображения данных
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(['Код', 'Адрес', 'Год постройки', 'Этажность', 'Кол-во квартир', 'Площадь'])
+        self.model = TableModel(['Код', 'Адрес', 'Год постройки', 'Этажность', 'Кол-во квартир', 'Площадь'])
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('apartment')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'apartment', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('apartment', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'apartment', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопка для обновления данных в таблице
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -40,37 +71,60 @@ class ApartmentWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'apartment', self.refresh_data))
+        layout.addWidget(btn_import)
+
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'apartment', self.model))
+        layout.addWidget(btn_export)
+
+        # Кнопка для просмотра сводки по домам: квартиры, заселенность, ремонты
+        btn_summary = QPushButton("Сводка по домам")
+        btn_summary.clicked.connect(self.show_summary)
+        layout.addWidget(btn_summary)
+
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
+
         self.setLayout(layout)
 
-        # Обновляем данные при открытии окна
-        self.refresh_data()
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
     def refresh_data(self):
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            # Получаем данные из таблицы 'apartment'
-            cursor.execute("SELECT * FROM public.apartment")
-            rows = cursor.fetchall()
-
-            # Очищаем таблицу перед обновлением данных
-            self.table.setRowCount(0)
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Заполняем таблицу данными
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+    def show_summary(self):
+        # Окно сводки открывается заново при каждом нажатии и загружает актуальные строки
+        self.summary_window = ApartmentSummaryWindow()
+        self.summary_window.show()
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
 
-        except (Exception, psycopg2.Error) as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         # Окно для ввода новой записи
@@ -123,86 +177,44 @@ class ApartmentWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, cod_num_hom, adress, year, num_of_flrs, num_of_flts, square, dialog):
-        # Валидация данных
-        if is_empty(cod_num_hom):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен кадастровый номер номера дома.')
-            return
-        if not correct_cod_aprtmt(cod_num_hom):
-            QMessageBox.warning(self, 'Ошибка', 'Кадастровый номер должен содержать только цифры и :.')
-            return
-        if not has_correct_length(cod_num_hom, 20, ):
-            QMessageBox.warning(self, 'Ошибка', 'Неверная длина: кадастровый номер должен быть не более 20 символов.')
-            return
-
-        if is_empty(adress):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен адрес.')
-            return
-        if not contains_only_cor_text(adress):
-            QMessageBox.warning(self, 'Ошибка', 'Адрес содержит недопустимые символы.')
-            return
-        if not has_correct_length(adress, 125):
-            QMessageBox.warning(self, 'Ошибка', 'Адрес слишком длинный.')
-            return
-
-        if is_empty(year):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен год постройки.')
-            return
-        if not is_cor_date(year):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата.')
-            return
-
-
-        if is_empty(num_of_flrs):
-            QMessageBox.warning(self, 'Ошибка', 'Не введена этажность.')
-            return
-        if not contains_only_numb(num_of_flrs):
-            QMessageBox.warning(self, 'Ошибка', 'Этажность должна содержать только цифры.')
-            return
-        if not has_correct_length(num_of_flrs, 4):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большое количество этажей.')
-            return
-
-        if is_empty(num_of_flts):
-            QMessageBox.warning(self, 'Ошибка', 'Не введено количество квартир.')
-            return
-        if not contains_only_numb(num_of_flts):
-            QMessageBox.warning(self, 'Ошибка', 'Количество квартир должно содержать только цифры.')
-            return
-        if not has_correct_length(num_of_flts, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большое количество квартир.')
-            return
-
-        if is_empty(square):
-            QMessageBox.warning(self, 'Ошибка', 'Не введена площадь.')
-            return
-        if not contains_only_numb(square, True):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь должна содержать только цифры.')
-            return
-        if not has_correct_length(square, 8):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большая площадь.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('apartment', {
+            'cod_num_hom': cod_num_hom, 'adress': adress, 'year': year, 'num_of_flrs': num_of_flrs,
+            'num_of_flts': num_of_flts, 'square': square})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
         # Вставка данных в базу
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            cursor.execute("SELECT * FROM public.apartment WHERE cod_num_hom = %s", (cod_num_hom,))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'МКД с этим кадастровым номером уже есть в базе данных')
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((cod_num_hom, adress, year, num_of_flrs, num_of_flts, square))
+                dialog.close()
                 return
 
-            # Вставка новой записи
-            cursor.execute("""
-                INSERT INTO public.apartment (cod_num_hom, adress, year, num_of_flrs, num_of_flts, square)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (cod_num_hom, adress, year, num_of_flrs, num_of_flts, square))
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+
+                cursor.execute("SELECT * FROM public.apartment WHERE cod_num_hom = %s", (cod_num_hom,))
+                if cursor.fetchone() is not None:
+                    QMessageBox.warning(self, 'Ошибка', 'МКД с этим кадастровым номером уже есть в базе данных')
+                    return
+
+                # Вставка новой записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    INSERT INTO public.apartment (cod_num_hom, adress, year, num_of_flrs, num_of_flts, square)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING *
+                """, (cod_num_hom, adress, year, num_of_flrs, num_of_flts, square))
+                row = cursor.fetchone()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
 
-            self.refresh_data()
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('apartment', cod_num_hom)
+            self.model.insert_row(row)
             dialog.close()
 
             QMessageBox.information(self, 'Успех', 'Запись успешно добавлена')
@@ -211,44 +223,57 @@ class ApartmentWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи в базу данных:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        cod_num_hom = self.table.item(selected_row, 0).text()
+        keys = [self.model.text(selected_row, 0) for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с кодом {keys[0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение', f'Вы уверены, что хотите удалить запись с кодом {cod_num_hom}?',
+        reply = QMessageBox.question(self, 'Подтверждение', question,
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                      QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM public.apartment WHERE cod_num_hom = %s", (cod_num_hom,))
-                connection.commit()
-                cursor.close()
-                connection.close()
-
-                self.refresh_data()
-
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(origin_sql(self.live_updates.origin) + "DELETE FROM public.apartment WHERE cod_num_hom IN %s", (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Ключи справочника в кеше больше не актуальны
+                for key in keys:
+                    reference_cache.invalidate('apartment', key)
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows([(key,) for key in keys])
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи из базы данных:\n{str(error)}')
 
     def edit_record(self):
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
-        cod_num_hom = self.table.item(selected_row, 0).text()
-        adress = self.table.item(selected_row, 1).text()
-        year = self.table.item(selected_row, 2).text()
-        num_of_flrs = self.table.item(selected_row, 3).text()
-        num_of_flts = self.table.item(selected_row, 4).text()
-        square = self.table.item(selected_row, 5).text()
+        cod_num_hom = self.model.text(selected_row, 0)
+        adress = self.model.text(selected_row, 1)
+        year = self.model.text(selected_row, 2)
+        num_of_flrs = self.model.text(selected_row, 3)
+        num_of_flts = self.model.text(selected_row, 4)
+        square = self.model.text(selected_row, 5)
 
         # Окно для редактирования записи
         dialog = QDialog(self)
@@ -298,70 +323,45 @@ class ApartmentWindow(QWidget):
         dialog.exec()
 
     def update_record(self, cod_num_hom, adress, year, num_of_flrs, num_of_flts, square, dialog):
-        # Валидация данных перед обновлением
-        if is_empty(adress):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен адрес.')
-            return
-        if not contains_only_cor_text(adress):
-            QMessageBox.warning(self, 'Ошибка', 'Адрес содержит недопустимые символы.')
-            return
-        if not has_correct_length(adress, 125):
-            QMessageBox.warning(self, 'Ошибка', 'Адрес слишком длинный.')
-            return
-
-        if is_empty(year):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен год постройки.')
-            return
-        if not is_cor_date(year):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата.')
-            return
-
-        if is_empty(num_of_flrs):
-            QMessageBox.warning(self, 'Ошибка', 'Не введена этажность.')
-            return
-        if not contains_only_numb(num_of_flrs):
-            QMessageBox.warning(self, 'Ошибка', 'Этажность должна содержать только цифры.')
-            return
-        if not has_correct_length(num_of_flrs, 4):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большое количество этажей.')
-            return
-
-        if is_empty(num_of_flts):
-            QMessageBox.warning(self, 'Ошибка', 'Не введено количество квартир.')
-            return
-        if not contains_only_numb(num_of_flts):
-            QMessageBox.warning(self, 'Ошибка', 'Количество квартир должно содержать только цифры.')
-            return
-        if not has_correct_length(num_of_flts, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большое количество квартир.')
-            return
-
-        if is_empty(square):
-            QMessageBox.warning(self, 'Ошибка', 'Не введена площадь.')
-            return
-        if not contains_only_numb(square, True):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь должна содержать только цифры.')
-            return
-        if not has_correct_length(square, 8):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком большая площадь.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('apartment', {
+            'adress': adress, 'year': year, 'num_of_flrs': num_of_flrs, 'num_of_flts': num_of_flts,
+            'square': square})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
         # Обновление записи в базе данных
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((cod_num_hom, adress, year, num_of_flrs, num_of_flts, square))
+                dialog.close()
+                return
+
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            cursor.execute("""
-                UPDATE public.apartment
-                SET adress = %s, year = %s, num_of_flrs = %s, num_of_flts = %s, square = %s
-                WHERE cod_num_hom = %s
-            """, (adress, year, num_of_flrs, num_of_flts, square, cod_num_hom))
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    UPDATE public.apartment
+                    SET adress = %s, year = %s, num_of_flrs = %s, num_of_flts = %s, square = %s
+                    WHERE cod_num_hom = %s
+                    RETURNING *
+                """, (adress, year, num_of_flrs, num_of_flts, square, cod_num_hom))
+                row = cursor.fetchone()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
 
-            self.refresh_data()
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('apartment', cod_num_hom)
+            if row is None:
+                # Строку удалили после загрузки таблицы
+                self.model.remove_rows([(cod_num_hom,)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
+            self.model.update_row(row)
             dialog.close()
 
             QMessageBox.information(self, 'Успех', 'Запись успешно изменена')
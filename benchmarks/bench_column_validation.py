@@ -0,0 +1,85 @@
+# Проверка столбца целиком (check_column) против вызова функций error.py для каждого значения.
+# Списки проверяются на NumPy, если он установлен; столбцы Arrow - только если установлен pyarrow.
+# Запуск из корня проекта: python benchmarks/bench_column_validation.py [кол-во значений]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import error
+from error import TABLE_SPECS, check_column, contains_only_numb, correct_cod_aprtmt, has_correct_length, is_cor_date
+from error import is_empty
+
+# Сколько раз повторять каждый замер
+REPEAT = 3
+
+FIELDS = {
+    'owner_uid': TABLE_SPECS['flat'][1],
+    'aprtmt_uid': TABLE_SPECS['flat'][2],
+    'square_flt': TABLE_SPECS['flat'][5],
+    'date_start': TABLE_SPECS['current_repair'][4],
+}
+
+
+def make_column(name, count):
+    # Каждое двадцатое значение с ошибкой
+    if name == 'owner_uid':
+        values = [f'{i % 10 ** 10:010d}' for i in range(count)]
+    elif name == 'aprtmt_uid':
+        values = [f'77:01:{i // 100:010d}' for i in range(count)]
+    elif name == 'square_flt':
+        values = [f'{i % 200 + 20}.{i % 10}' for i in range(count)]
+    else:
+        values = [f'20{i % 25:02d}-{i % 12 + 1:02d}-{i % 31 + 1:02d}' for i in range(count)]
+    for i in range(0, count, 20):
+        values[i] = 'x' + values[i]
+    return values
+
+
+def per_value(name, values):
+    # Так проверяются поля окна: по одному значению
+    if name == 'owner_uid':
+        return [not is_empty(v) and contains_only_numb(v) and has_correct_length(v, 10, True) for v in values]
+    if name == 'aprtmt_uid':
+        return [not is_empty(v) and correct_cod_aprtmt(v) and has_correct_length(v, 20) for v in values]
+    if name == 'square_flt':
+        return [not is_empty(v) and contains_only_numb(v, True) and has_correct_length(v, 7) for v in values]
+    return [not is_empty(v) and is_cor_date(v) for v in values]
+
+
+def timed(function):
+    # Лучшее время из REPEAT запусков: единичный замер сильно зависит от загрузки машины
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f'Значений в столбце: {count}')
+    # pyarrow загружается при первой проверке столбца; загрузка не входит в замер
+    error._load_vector_modules()
+    for name, field in FIELDS.items():
+        values = make_column(name, count)
+        baseline, expected = timed(lambda: per_value(name, values))
+        line = f'{name:<12} по одному {count / baseline:12,.0f} зн/с'
+
+        elapsed, (mask, _) = timed(lambda: check_column(field, values))
+        assert mask == expected
+        line += f'   список {count / elapsed:12,.0f} зн/с (x{baseline / elapsed:4.1f})'
+
+        if error.pa is not None:
+            array = error.pa.array(values)
+            elapsed, (mask, _) = timed(lambda: check_column(field, array))
+            assert mask.to_pylist() == expected
+            line += f'   Arrow {count / elapsed:12,.0f} зн/с (x{baseline / elapsed:4.1f})'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
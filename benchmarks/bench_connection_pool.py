@@ -0,0 +1,62 @@
+# Замер задержки одной операции с пулом соединений и без него.
+# Запуск из корня проекта: python benchmarks/bench_connection_pool.py [кол-во операций]
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from connection import DB_PARAMS, pooled_connection, close_pool
+
+QUERY = "SELECT * FROM public.apartment LIMIT 1"
+
+
+def without_pool():
+    # Так работали окна раньше: новое соединение на каждое действие
+    connection = psycopg2.connect(**DB_PARAMS)
+    cursor = connection.cursor()
+    cursor.execute(QUERY)
+    cursor.fetchall()
+    cursor.close()
+    connection.close()
+
+
+def with_pool():
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(QUERY)
+        cursor.fetchall()
+        cursor.close()
+
+
+def measure(operation, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'{name:<12} среднее {statistics.mean(timings):8.2f} мс   медиана {statistics.median(timings):8.2f} мс   '
+          f'p95 {p95:8.2f} мс')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # Прогрев: первое соединение пула и кеши сервера
+    with_pool()
+
+    report('без пула', measure(without_pool, count))
+    report('с пулом', measure(with_pool, count))
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Скорость проверки пачек файла импорта flat: в одном процессе (как в import_csv) и в пуле
+# процессов import_pipeline.py с разным их числом. База данных не нужна: COPY не выполняется.
+# Запуск из корня проекта: python benchmarks/bench_import_pipeline.py [кол-во строк]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_import import BATCH_SIZE, _check_batches
+from import_pipeline import DEFAULT_WORKERS, parallel_checker
+
+
+def make_batches(count):
+    # Строки файла импорта квартир, каждая десятая с ошибкой
+    batch = []
+    for i in range(count):
+        row = [f'77:01:{i:012d}', f'{i % 10 ** 10:010d}', f'77:01:{i // 100:010d}', str(i % 500 + 1),
+               str(i % 25 + 1), ' 54.30']
+        if i % 10 == 0:
+            row[i % 6] = 'x!'
+        batch.append((i + 1, row))
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def measure(name, checker, batches, count, baseline=None):
+    start = time.perf_counter()
+    rejected = sum(len(errors) for _, errors, _, _ in checker('flat', iter(batches)))
+    elapsed = time.perf_counter() - start
+    speedup = f'   x{baseline / elapsed:4.1f}' if baseline else ''
+    print(f'{name:<22} {elapsed:7.3f} с   {count / elapsed:12,.0f} строк/с   ошибок {rejected}{speedup}')
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f'Проверка {count} строк flat, ядер: {os.cpu_count()}')
+    batches = list(make_batches(count))
+    baseline = measure('один процесс', _check_batches, batches, count)
+    workers = 1
+    while workers <= max(DEFAULT_WORKERS, 2):
+        measure(f'процессов: {workers}', parallel_checker(workers), batches, count, baseline)
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Фильтр по загруженным строкам (local_index.py): время построения индекса, время фильтра на
+# каждое нажатие клавиши и обновления индекса при изменении строки. Таблица apartment.
+# Запуск из корня проекта: python benchmarks/bench_local_filter.py [кол-во строк]
+import os
+import random
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from error import TABLE_SPECS, is_cor_date
+from table_model import TableModel
+
+HEADERS = ['Код', 'Адрес', 'Год постройки', 'Этажность', 'Кол-во квартир', 'Площадь']
+STREETS = ['Ленина', 'Гагарина', 'Мира', 'Советская', 'Пушкина', 'Лесная', 'Садовая', 'Школьная',
+           'Молодежная', 'Набережная', 'Заречная', 'Октябрьская', 'Полевая', 'Центральная', 'Луговая']
+CITIES = ['Москва', 'Казань', 'Тверь', 'Омск', 'Пермь', 'Самара', 'Уфа', 'Томск', 'Курск', 'Орел']
+
+
+def make_rows(count):
+    generator = random.Random(1)
+    rows = []
+    for i in range(count):
+        address = (f'г. {generator.choice(CITIES)}, ул. {generator.choice(STREETS)} {generator.randint(1, 300)}, '
+                   f'корп. {generator.randint(1, 9)}')
+        rows.append((f'77:01:{i:012d}', address, date(1950 + i % 70, i % 12 + 1, i % 28 + 1),
+                     i % 25 + 1, i % 500 + 1, Decimal(f'{1000 + i % 9000}.50')))
+    return rows
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(count)
+    model = TableModel(HEADERS)
+    model.enable_local_index(TABLE_SPECS['apartment'])
+    print(f'Строк: {count}')
+    print(f'Построение индекса: {timed(lambda: model.set_rows(rows)):.0f} мс')
+
+    cases = [
+        ('адрес, по буквам', 'adress', ['л', 'ле', 'лен', 'лени', 'ленин', 'ленина', 'ленина 1', 'ленина 12']),
+        ('адрес, слово внутри', 'adress', ['нина', 'тверь', 'корп. 7']),
+        ('код, по началу', 'cod_num_hom', ['77:01:0000001', '77:01:00000012', '77:01:000000123']),
+        ('площадь, диапазон', 'square', ['1000..1100', '5000..', '..1010']),
+        ('год, диапазон', 'year', ['2000-01-01..2000-12-31', '1960', '=1955-06-06']),
+    ]
+    # strptime компилирует свои шаблоны при первом вызове в процессе; в приложении это
+    # происходит раньше, при проверке введенных дат
+    is_cor_date('2000-01-01')
+    worst = 0
+    for name, column, inputs in cases:
+        times = []
+        for text in inputs:
+            times.append(timed(lambda: model.set_local_filter({column: text})))
+            times[-1] = (times[-1], model.rowCount())
+        worst = max(worst, max(elapsed for elapsed, _ in times))
+        print(f'{name:<22} ' + '   '.join(f'{elapsed:5.1f} мс ({shown})' for elapsed, shown in times))
+
+    model.set_local_filter({'adress': 'ленина'})
+    changed = list(rows[10])
+    changed[1] = 'г. Тверь, ул. Ленина 1, корп. 1'
+    update = timed(lambda: model.update_row(changed))
+    insert = timed(lambda: model.insert_row((f'77:02:{0:012d}', 'ул. Ленина 5', date(2020, 1, 1), 5, 50,
+                                             Decimal('900.00'))))
+    remove = timed(lambda: model.remove_rows([(changed[0],)]))
+    print(f'Изменение строки: {update:.2f} мс, добавление: {insert:.2f} мс, удаление: {remove:.2f} мс')
+    print(f'Самое долгое нажатие: {worst:.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Время получения страницы таблицы по ее номеру: постраничная загрузка paging.PageStream
+# (продолжение с последней строки) против LIMIT/OFFSET. Нужна база данных с заполненной таблицей
+# и индексы из paging.py (python paging.py).
+# Запуск из корня проекта: python benchmarks/bench_paging.py [таблица] [столбец сортировки]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection import close_pool, pooled_connection
+from paging import PAGE_SIZE, PageStream, _order_by, order_columns
+
+# Номера страниц, время которых выводится
+REPORTED_PAGES = (1, 10, 50, 100, 200)
+
+
+def offset_page(query, order, page):
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT * FROM ({query}) AS page ORDER BY {order} LIMIT {PAGE_SIZE} OFFSET {page * PAGE_SIZE}")
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def main():
+    table = sys.argv[1] if len(sys.argv) > 1 else 'apartment'
+    column = sys.argv[2] if len(sys.argv) > 2 else None
+    query = f"SELECT * FROM public.{table}"
+    order = _order_by(order_columns(table, column), False)
+    print(f'Таблица {table}, порядок: {order}, строк в странице: {PAGE_SIZE}')
+
+    stream = PageStream(query, None, table, column)
+    page = 0
+    while not stream.exhausted and page < REPORTED_PAGES[-1]:
+        start = time.perf_counter()
+        stream.fetch()
+        keyset = (time.perf_counter() - start) * 1000
+        page += 1
+        if page in REPORTED_PAGES:
+            start = time.perf_counter()
+            offset_page(query, order, page - 1)
+            offset = (time.perf_counter() - start) * 1000
+            print(f'страница {page:>4}: по последней строке {keyset:7.1f} мс   OFFSET {offset:7.1f} мс')
+    close_pool()
+
+
+if __name__ == '__main__':
+    main()
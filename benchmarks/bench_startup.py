@@ -0,0 +1,116 @@
+# Время запуска приложения: импорт модулей (python -X importtime), время до первой отрисовки
+# главного окна с момента запуска процесса и время от нажатия кнопки до отрисовки окна таблицы.
+# База данных не нужна: строки окна загружаются в фоне уже после отрисовки.
+# Запуск из корня проекта: python benchmarks/bench_startup.py [--json] [повторов]
+# С --json результат выводится одной строкой JSON (для сравнения между прогонами)
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Окно таблицы, открытие которого измеряется
+MEASURED_WINDOW = ('apartment_window', 'ApartmentWindow')
+# Сколько самых долгих модулей показывать
+TOP_IMPORTS = 8
+
+
+def child():
+    # Выполняется в отдельном процессе: печатает время (с) от своего запуска до отрисовки
+    # главного окна и от открытия окна таблицы до его отрисовки
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    class FirstPaint(QObject):
+        def __init__(self, widget, done):
+            super().__init__(widget)
+            self.done = done
+            widget.installEventFilter(self)
+
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Type.Paint and self.done is not None:
+                done, self.done = self.done, None
+                QTimer.singleShot(0, done)
+            return False
+
+    app = QApplication(sys.argv)
+    from main_window import MainWindow
+    main_window = MainWindow()
+    result = {}
+
+    def window_painted(started):
+        result['window'] = time.perf_counter() - started
+        print(json.dumps(result), flush=True)
+        for window in main_window.windows.values():
+            window.close()
+        app.quit()
+
+    def main_painted():
+        result['first_paint'] = time.perf_counter() - float(os.environ['BENCH_STARTED'])
+        started = time.perf_counter()
+        window = main_window.show_window(*MEASURED_WINDOW)
+        FirstPaint(window, lambda: window_painted(started))
+
+    FirstPaint(main_window, main_painted)
+    main_window.show()
+    app.exec()
+
+
+def measure_paint():
+    # Время запуска процесса отсчитывается по часам родителя: perf_counter общий для процессов
+    environment = dict(os.environ, BENCH_STARTED=repr(time.perf_counter()))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT, env=environment,
+                            capture_output=True, text=True, timeout=60).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_imports(statement):
+    # Общее время импорта (мс) и самые долгие модули по собственному времени
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60).stderr
+    own = []
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        own.append((int(self_us) / 1000, name.strip()))
+        if not name.startswith('  '):
+            total += int(cumulative_us) / 1000
+    return total, sorted(own, reverse=True)[:TOP_IMPORTS]
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if argument != '--json']
+    repeats = int(arguments[0]) if arguments else 5
+    launcher_ms, launcher_top = measure_imports('import main_window')
+    window_ms, window_top = measure_imports(f'import main_window, {MEASURED_WINDOW[0]}')
+    paints = [measure_paint() for _ in range(repeats)]
+    first_paint = min(paint['first_paint'] for paint in paints) * 1000
+    window_paint = min(paint['window'] for paint in paints) * 1000
+
+    if '--json' in sys.argv:
+        print(json.dumps({'import_main_window_ms': round(launcher_ms, 1),
+                          'import_with_window_ms': round(window_ms, 1),
+                          'first_paint_ms': round(first_paint, 1),
+                          'window_paint_ms': round(window_paint, 1)}))
+        return
+    print(f'Импорт main_window: {launcher_ms:.0f} мс')
+    for own_ms, name in launcher_top:
+        print(f'    {own_ms:7.1f} мс  {name}')
+    print(f'Импорт main_window и {MEASURED_WINDOW[0]}: {window_ms:.0f} мс')
+    for own_ms, name in window_top:
+        print(f'    {own_ms:7.1f} мс  {name}')
+    print(f'От запуска процесса до отрисовки главного окна: {first_paint:.0f} мс (лучшее из {repeats})')
+    print(f'От нажатия кнопки до отрисовки окна {MEASURED_WINDOW[1]}: {window_paint:.0f} мс')
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        main()
@@ -0,0 +1,78 @@
+# Сравнение загрузки строк в QTableWidget и в TableModel: время и пиковая память (RSS).
+# Каждый замер выполняется в отдельном процессе, чтобы пик памяти не накапливался.
+# Запуск из корня проекта: python benchmarks/bench_table_model.py [кол-во строк ...]
+import os
+import resource
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+HEADERS = ['Код квартиры', 'Id Владелеца', 'Код многоквартирного дома', 'Номер', 'Этаж', 'Площадь']
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_rows(count):
+    # Строки того же вида, что возвращает курсор для таблицы flat
+    return [(f'77:01:{i:012d}', f'{i % 10 ** 10:010d}', f'77:01:{i // 100:010d}', i % 500 + 1, i % 25 + 1,
+             Decimal('54.30')) for i in range(count)]
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux возвращается в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(case, count):
+    from PyQt6.QtWidgets import QApplication, QTableWidget, QTableWidgetItem
+    from table_model import TableModel, create_table_view
+
+    app = QApplication(sys.argv)
+    rows = make_rows(count)
+    base_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    if case == 'widget':
+        table = QTableWidget()
+        table.setColumnCount(len(HEADERS))
+        table.setHorizontalHeaderLabels(HEADERS)
+        for row_index, row_data in enumerate(rows):
+            table.insertRow(row_index)
+            for col_index, col_data in enumerate(row_data):
+                table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+    else:
+        model = TableModel(HEADERS)
+        table = create_table_view(model)
+        model.set_rows(rows)
+    table.resizeColumnsToContents()
+    table.show()
+    app.processEvents()
+    elapsed = time.perf_counter() - start
+
+    print(f'{elapsed:.3f} {peak_rss_mb() - base_rss:.1f}')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--case':
+        run_case(sys.argv[2], int(sys.argv[3]))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f'{"строк":>10} {"вариант":>12} {"время, с":>10} {"прирост RSS, МБ":>16}')
+    for count in sizes:
+        for case in ('model', 'widget'):
+            result = subprocess.run([sys.executable, __file__, '--case', case, str(count)],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f'{count:>10} {case:>12} ошибка: {result.stderr.strip().splitlines()[-1:]}')
+                continue
+            elapsed, rss = result.stdout.split()
+            print(f'{count:>10} {case:>12} {float(elapsed):>10.3f} {float(rss):>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
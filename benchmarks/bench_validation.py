@@ -0,0 +1,126 @@
+# Сравнение скорости проверки строк таблицы flat: прежняя цепочка if с re.match по строковым
+# шаблонам, та же цепочка на функциях error.py, validate_record и validate_batch.
+# Запуск из корня проекта: python benchmarks/bench_validation.py [кол-во строк]
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import error
+from error import validate_batch, validate_record
+from tables import TABLE_COLUMNS
+
+
+# Прежние версии функций error.py: шаблон передается строкой при каждом вызове
+def legacy_contains_only_numb(text, double=None):
+    if double is not None:
+        return re.match(r'^-?\d+(\.\d+)?$', text) is not None
+    else:
+        return re.match(r'^\d+$', text) is not None
+
+
+def legacy_correct_cod_aprtmt(cod):
+    return re.match(r'^[0-9:]+$', cod) is not None
+
+
+def legacy_is_cor_date(date_text):
+    if not re.match(r"^\d{4}-\d{2}-\d{2}$", date_text):
+        return False
+    try:
+        datetime.strptime(date_text, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def make_rows(count):
+    # Строки файла импорта квартир, каждая десятая с ошибкой
+    rows = []
+    for i in range(count):
+        row = [f'77:01:{i:012d}', f'{i % 10 ** 10:010d}', f'77:01:{i // 100:010d}', str(i % 500 + 1),
+               str(i % 25 + 1), '54.30']
+        if i % 10 == 0:
+            row[i % 6] = 'x!' if i % 20 else ''
+        rows.append(row)
+    return rows
+
+
+def chain(row, is_empty, contains_only_numb, correct_cod_aprtmt, has_correct_length):
+    # Так проверяли поля окна: до первой ошибки
+    cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt = row
+    if is_empty(cod_flt) or not correct_cod_aprtmt(cod_flt) or not has_correct_length(cod_flt, 20):
+        return False
+    if is_empty(owner_uid) or not contains_only_numb(owner_uid) or not has_correct_length(owner_uid, 10, True):
+        return False
+    if is_empty(aprtmt_uid) or not correct_cod_aprtmt(aprtmt_uid) or not has_correct_length(aprtmt_uid, 20):
+        return False
+    if is_empty(nom_flt) or not contains_only_numb(nom_flt) or not has_correct_length(nom_flt, 5):
+        return False
+    if is_empty(floor_flt) or not contains_only_numb(floor_flt) or not has_correct_length(floor_flt, 5):
+        return False
+    if is_empty(square_flt) or not contains_only_numb(square_flt, True) or not has_correct_length(square_flt, 7):
+        return False
+    return True
+
+
+def legacy_chain(rows):
+    return sum(not chain(row, error.is_empty, legacy_contains_only_numb, legacy_correct_cod_aprtmt,
+                         error.has_correct_length) for row in rows)
+
+
+def current_chain(rows):
+    return sum(not chain(row, error.is_empty, error.contains_only_numb, error.correct_cod_aprtmt,
+                         error.has_correct_length) for row in rows)
+
+
+def per_record(rows):
+    columns = TABLE_COLUMNS['flat']
+    return sum(bool(validate_record('flat', dict(zip(columns, row)))) for row in rows)
+
+
+def batch(rows):
+    return len(validate_batch('flat', rows))
+
+
+def dates(count):
+    return [f'20{i % 30:02d}-{i % 12 + 1:02d}-{i % 31 + 1:02d}' for i in range(count)]
+
+
+def legacy_dates(values):
+    return sum(not legacy_is_cor_date(value) for value in values)
+
+
+def spec_dates(values):
+    check = error.TABLE_SPECS['current_repair'][4].check
+    return sum(check(value) is not None for value in values)
+
+
+def measure(name, function, data, baseline=None):
+    start = time.perf_counter()
+    invalid = function(data)
+    elapsed = time.perf_counter() - start
+    speedup = f'   x{baseline / elapsed:5.1f}' if baseline else ''
+    print(f'{name:<26} {elapsed:7.3f} с   {len(data) / elapsed:12,.0f} строк/с   ошибок {invalid}{speedup}')
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(count)
+    print(f'Проверка {count} строк flat')
+    baseline = measure('цепочка if, re.match', legacy_chain, rows)
+    measure('цепочка if, error.py', current_chain, rows, baseline)
+    measure('validate_record', per_record, rows, baseline)
+    measure('validate_batch', batch, rows, baseline)
+
+    values = dates(count)
+    print(f'\nПроверка {count} дат')
+    baseline = measure('is_cor_date (strptime)', legacy_dates, values)
+    measure('Field DATE', spec_dates, values, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+# Замеры окон таблиц целиком, без участия пользователя (платформа Qt offscreen): refresh_data,
+# insert_record, update_record и delete_record каждого окна против настоящей базы. Выводятся
+# перцентили задержек, пропускная способность и пиковая память (RSS) процесса окна.
+# Нужна база с заполненными таблицами (python benchmarks/generate_data.py). Записи, которые
+# добавляет замер, имеют ключи, начинающиеся с нулей (в сгенерированных данных таких нет), и
+# удаляются после замера.
+# Каждое окно замеряется в отдельном процессе, чтобы пик памяти не накапливался.
+# Запуск из корня проекта: python benchmarks/bench_windows.py [кол-во операций] [--json]
+# С --json результат выводится одной строкой JSON (для сравнения между прогонами)
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Таблица, модуль и класс окна
+WINDOWS = [
+    ('apartment', 'apartment_window', 'ApartmentWindow'),
+    ('flat', 'flat_window', 'FlatWindow'),
+    ('owner', 'owner_window', 'OwnerWindow'),
+    ('builder', 'builder_window', 'BuilderWindow'),
+    ('repair_work', 'repair_work_window', 'RepairWorkWindow'),
+    ('current_repair', 'current_repair_window', 'CurrentRepairWindow'),
+]
+DEFAULT_OPERATIONS = 50
+# Сколько раз замерять refresh_data
+REFRESH_REPEATS = 10
+# Сколько строк догружать прокруткой после refresh_data при замере пропускной способности
+SCROLL_ROWS = 100_000
+# Сколько секунд ждать ответа сервера на одну операцию
+WAIT_TIMEOUT = 120
+# Работа, на которую ссылаются добавляемые замером текущие ремонты (ключ меньше
+# сгенерированных, поэтому строки замера показываются в начале первой страницы)
+BENCH_REPAIR_WORK = '000000000000'
+
+
+def bench_row(table, index, references, changed=False):
+    # Значения полей добавляемой записи (как их вводит пользователь). changed - значения для
+    # update_record: ключ тот же, остальные поля другие
+    suffix = ', изм.' if changed else ''
+    number = str(index % 900 + (101 if changed else 1))
+    if table == 'apartment':
+        return (f'00:00:{index:07d}', f'г. Москва, ул. Замерная, д. {number}{suffix}', '2001-02-03', '9',
+                number, '1234.50')
+    if table == 'flat':
+        return (f'00:00:{index:07d}:1', references['owner'], references['apartment'][0], number, '3', '54.30')
+    if table == 'owner':
+        return f'0{index:09d}', f'Замеров Тест Тестович{suffix}', '79000000000'
+    if table == 'builder':
+        return f'00{index:010d}', f'ООО Замер-{number}', '79000000000', f'г. Москва, ул. Замерная, д. {number}'
+    if table == 'repair_work':
+        return f'00{index + 1:010d}', f'Замерная работа {number}'
+    return (BENCH_REPAIR_WORK, references['builder'], references['apartment'][index], f'Замерная работа {number}',
+            '2020-01-01', '2020-02-01' if changed else '2020-03-01')
+
+
+def bench_key(table, index, references):
+    from tables import TABLE_COLUMNS, TABLE_KEYS
+    row = bench_row(table, index, references)
+    return tuple(row[TABLE_COLUMNS[table].index(column)] for column in TABLE_KEYS[table])
+
+
+def latency_stats(samples):
+    # Задержки (с) -> перцентили в мс и операций в секунду
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def percentile(share):
+        return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': round(percentile(0.5), 2), 'p90_ms': round(percentile(0.9), 2),
+            'p99_ms': round(percentile(0.99), 2), 'max_ms': round(ordered[-1] * 1000, 2),
+            'ops_per_s': round(len(ordered) / total, 1) if total > 0 else None}
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux возвращается в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_references(cursor, operations):
+    # Существующие ключи, на которые ссылаются добавляемые замером квартиры и текущие ремонты
+    cursor.execute(f"SELECT cod_num_hom FROM public.apartment ORDER BY cod_num_hom LIMIT {int(operations)}")
+    apartments = [key for key, in cursor.fetchall()]
+    cursor.execute("SELECT uid FROM public.owner ORDER BY uid LIMIT 1")
+    owner = cursor.fetchone()
+    cursor.execute("SELECT inn_org FROM public.builder ORDER BY inn_org LIMIT 1")
+    builder = cursor.fetchone()
+    if len(apartments) < operations or owner is None or builder is None:
+        raise RuntimeError('Таблицы не заполнены: запустите python benchmarks/generate_data.py')
+    return {'apartment': apartments, 'owner': owner[0], 'builder': builder[0]}
+
+
+def remove_bench_rows(cursor, table, operations, references):
+    from tables import key_filter
+    condition, params = key_filter(table, [bench_key(table, index, references) for index in range(operations)])
+    cursor.execute(f"DELETE FROM public.{table} WHERE {condition}", params)
+
+
+def child(table, module_name, class_name, operations):
+    # Выполняется в отдельном процессе: замеряет одно окно и печатает результат JSON
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEventLoop, QTimer
+    from PyQt6.QtWidgets import QApplication, QDialog, QMessageBox
+    from connection import close_pool, pooled_connection
+    from main_window import window_class
+
+    app = QApplication(sys.argv)
+    # Сообщения окон не показываются: подтверждения принимаются, ошибки запоминаются
+    errors = []
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.Yes)
+    QMessageBox.warning = staticmethod(lambda parent, title, text, *args, **kwargs:
+                                       errors.append(text) or QMessageBox.StandardButton.Ok)
+
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        references = load_references(cursor, operations)
+        if table == 'current_repair':
+            cursor.execute("INSERT INTO public.repair_work (cod_rep_work, type_of_work) VALUES (%s, %s) "
+                           "ON CONFLICT DO NOTHING", (BENCH_REPAIR_WORK, 'Замерная работа'))
+        remove_bench_rows(cursor, table, operations, references)
+        connection.commit()
+        cursor.close()
+
+    base_rss = peak_rss_mb()
+    window = window_class(module_name, class_name)()
+    model = window.model
+    failures = []
+    model.load_failed.connect(failures.append)
+
+    loads = []
+    model.loaded.connect(lambda: loads.append(time.perf_counter()))
+
+    def wait_until(done):
+        # Обрабатывает события, пока не выполнится условие: строки приходят сигналами из фонового потока
+        loop = QEventLoop()
+        signals = (model.loaded, model.loading_changed, model.load_failed)
+        for signal in signals:
+            signal.connect(loop.quit)
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(loop.quit)
+        timer.start(WAIT_TIMEOUT * 1000)
+        try:
+            while not done() and not failures and timer.isActive():
+                loop.exec()
+        finally:
+            for signal in signals:
+                signal.disconnect(loop.quit)
+        if failures:
+            raise RuntimeError(failures[-1])
+        if not done():
+            raise RuntimeError(f'Нет ответа сервера за {WAIT_TIMEOUT} с')
+
+    # Первая загрузка запускается самим окном после показа
+    window.show()
+    wait_until(lambda: loads)
+
+    result = {}
+    samples = []
+    for _ in range(REFRESH_REPEATS):
+        loaded_before = len(loads)
+        start = time.perf_counter()
+        window.refresh_data()
+        wait_until(lambda: len(loads) > loaded_before)
+        samples.append(time.perf_counter() - start)
+    result['refresh'] = latency_stats(samples)
+
+    # Догрузка страниц, как при прокрутке таблицы до конца
+    start = time.perf_counter()
+    first = model.rowCount()
+    while model.rowCount() < SCROLL_ROWS and model.canFetchMore():
+        model.fetchMore()
+        wait_until(lambda: not model.is_loading())
+    elapsed = time.perf_counter() - start
+    scrolled = model.rowCount() - first
+    result['scroll'] = {'rows': scrolled, 'seconds': round(elapsed, 3),
+                        'rows_per_s': round(scrolled / elapsed) if elapsed > 0 else None}
+
+    dialog = QDialog(window)
+    for operation in ('insert', 'update', 'delete'):
+        samples = []
+        errors_before = len(errors)
+        for index in range(operations):
+            if operation == 'delete':
+                # Удаляется выделенная строка, как при нажатии "Удалить запись"
+                row_index = model.find_row(bench_key(table, index, references))
+                if row_index == -1:
+                    errors.append(f'Строка {index} не показана в таблице')
+                    continue
+                window.table.clearSelection()
+                window.table.selectRow(row_index)
+                start = time.perf_counter()
+                window.delete_record()
+            else:
+                row = bench_row(table, index, references, changed=operation == 'update')
+                start = time.perf_counter()
+                getattr(window, f'{operation}_record')(*row, dialog)
+            samples.append(time.perf_counter() - start)
+            # Отложенные сигналы (уведомления, перерисовка) обрабатываются между операциями
+            app.processEvents()
+        result[operation] = latency_stats(samples) if samples else {'count': 0}
+        result[operation]['errors'] = len(errors) - errors_before
+
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    result['window_rss_mb'] = round(peak_rss_mb() - base_rss, 1)
+    result['messages'] = errors[:5]
+
+    window.close()
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        remove_bench_rows(cursor, table, operations, references)
+        if table == 'current_repair':
+            cursor.execute("DELETE FROM public.repair_work WHERE cod_rep_work = %s", (BENCH_REPAIR_WORK,))
+        connection.commit()
+        cursor.close()
+    close_pool()
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def table_sizes():
+    # Оценка числа строк из статистики (count(*) по большим таблицам слишком долгий)
+    from connection import close_pool, pooled_connection
+    from tables import TABLE_COLUMNS
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT relname, reltuples::bigint FROM pg_class "
+                       "WHERE relnamespace = 'public'::regnamespace AND relname = ANY (%s)", (list(TABLE_COLUMNS),))
+        sizes = dict(cursor.fetchall())
+        cursor.close()
+    close_pool()
+    return sizes
+
+
+def measure_window(table, module_name, class_name, operations):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', table, module_name, class_name,
+                                str(operations)], cwd=ROOT, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        message = completed.stderr.strip().splitlines()
+        return {'error': message[-1] if message else f'код завершения {completed.returncode}'}
+    return json.loads(lines[-1])
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if argument != '--json']
+    operations = int(arguments[0]) if arguments else DEFAULT_OPERATIONS
+    report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'operations': operations,
+              'table_rows': table_sizes(), 'windows': {}}
+    for table, module_name, class_name in WINDOWS:
+        report['windows'][table] = measure_window(table, module_name, class_name, operations)
+
+    if '--json' in sys.argv:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print('Строк в таблицах: ' + ', '.join(f'{table} {rows:,}' for table, rows in report['table_rows'].items()))
+    for table, result in report['windows'].items():
+        if 'error' in result:
+            print(f'{table}: ошибка: {result["error"]}')
+            continue
+        print(f'{table}: пик памяти {result["peak_rss_mb"]:.0f} МБ (окно {result["window_rss_mb"]:+.0f} МБ), '
+              f'прокрутка {result["scroll"]["rows"]:,} строк, {result["scroll"]["rows_per_s"] or 0:,} строк/с')
+        for operation in ('refresh', 'insert', 'update', 'delete'):
+            stats = result[operation]
+            if not stats['count']:
+                print(f'    {operation:<8} не выполнялось')
+                continue
+            print(f'    {operation:<8} p50 {stats["p50_ms"]:8.1f} мс  p90 {stats["p90_ms"]:8.1f} мс  '
+                  f'p99 {stats["p99_ms"]:8.1f} мс  {stats["ops_per_s"]:8.1f} оп/с'
+                  + (f'  ошибок {stats["errors"]}' if stats.get('errors') else ''))
+        for message in result['messages']:
+            print(f'    ! {message}')
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        table, module_name, class_name, operations = sys.argv[sys.argv.index('--child') + 1:][:4]
+        child(table, module_name, class_name, int(operations))
+    else:
+        main()
@@ -0,0 +1,247 @@
+# Генератор тестовых данных для всех шести таблиц: правдоподобные значения, проходящие проверки
+# error.py, и согласованные ссылки (квартиры ссылаются на существующие дома и владельцев,
+# ремонты - на существующие работы, организации и дома, количество квартир дома совпадает с
+# числом его квартир). Объем задается числом квартир (от 1 000 до 10 000 000), остальные
+# таблицы масштабируются от него. При одном и том же seed данные одинаковы.
+# Строки загружаются в базу через COPY одной транзакцией; перед загрузкой схема обновляется
+# (schema.py). Заполненные таблицы очищаются только с --replace.
+# Запуск из корня проекта: python benchmarks/generate_data.py [кол-во квартир] [seed] [--replace]
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection import close_pool, pooled_connection
+from notifications import SKIP_NOTIFY_SETTING, notify_bulk_change
+from schema import migrate
+from tables import TABLE_COLUMNS
+
+MIN_FLATS = 1_000
+MAX_FLATS = 10_000_000
+DEFAULT_FLATS = 100_000
+DEFAULT_SEED = 2024
+# Квартир в доме
+FLATS_PER_HOUSE = (20, 120)
+# Этажность домов
+HOUSE_FLOORS = (5, 9, 12, 14, 16, 17, 22, 25)
+# Владельцев на квартиру (часть владельцев владеет несколькими квартирами)
+OWNERS_PER_FLAT = 0.8
+# Квартир на одну строительную организацию
+FLATS_PER_BUILDER = 20_000
+# Ремонтов на дом
+REPAIRS_PER_HOUSE = (0, 4)
+# Сколько строк собирать в один кусок текста для COPY
+COPY_CHUNK_ROWS = 10_000
+# Порядок загрузки: справочники раньше ссылающихся на них таблиц
+LOAD_ORDER = ('apartment', 'owner', 'builder', 'repair_work', 'flat', 'current_repair')
+
+CITIES = ['Москва', 'Зеленоград', 'Троицк', 'Щербинка', 'Московский']
+STREETS = ['Ленина', 'Гагарина', 'Садовая', 'Школьная', 'Лесная', 'Советская', 'Молодежная', 'Центральная',
+           'Новая', 'Полевая', 'Набережная', 'Мира', 'Строителей', 'Профсоюзная', 'Вернадского', 'Тверская']
+SURNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+            'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров']
+NAMES = [('Александр', 'Александрович', 'Александровна'), ('Сергей', 'Сергеевич', 'Сергеевна'),
+         ('Дмитрий', 'Дмитриевич', 'Дмитриевна'), ('Андрей', 'Андреевич', 'Андреевна'),
+         ('Алексей', 'Алексеевич', 'Алексеевна'), ('Иван', 'Иванович', 'Ивановна'),
+         ('Михаил', 'Михайлович', 'Михайловна'), ('Николай', 'Николаевич', 'Николаевна')]
+FEMALE_NAMES = ['Елена', 'Ольга', 'Наталья', 'Татьяна', 'Ирина', 'Анна', 'Мария', 'Светлана']
+BUILDER_NAMES = ['Стройремонт', 'Капстрой', 'Жилсервис', 'Домострой', 'Ремстройтрест', 'Фасад-Сервис',
+                 'Кровля-М', 'Инженерные системы', 'Лифтремонт', 'Теплосеть-Ремонт']
+WORK_TYPES = ['Ремонт крыши', 'Ремонт фасада', 'Замена лифтового оборудования', 'Ремонт подвальных помещений',
+              'Ремонт системы отопления', 'Ремонт системы холодного водоснабжения',
+              'Ремонт системы горячего водоснабжения', 'Ремонт системы водоотведения',
+              'Ремонт системы электроснабжения', 'Ремонт системы газоснабжения', 'Утепление фасада',
+              'Ремонт фундамента', 'Установка узлов учета', 'Ремонт внутридомовых инженерных систем',
+              'Замена окон в местах общего пользования', 'Ремонт подъездов']
+
+
+def apartment_key(index):
+    return f'77:{index % 12 + 1:02d}:{index + 1:07d}'
+
+
+def owner_key(index):
+    return f'{1_000_000_000 + index}'
+
+
+def builder_key(index):
+    return f'77{index + 1:010d}'
+
+
+def repair_work_key(index):
+    return f'{100_000_000_000 + index + 1}'
+
+
+class DataSet:
+    # Размеры таблиц и генераторы их строк (кортежи текстов в порядке столбцов TABLE_COLUMNS)
+    def __init__(self, flats, seed=DEFAULT_SEED):
+        self.flats = flats
+        self.seed = seed
+        rng = random.Random(seed)
+        # Число квартир и этажность каждого дома: нужны и для строк домов, и для строк квартир
+        self.house_sizes = []
+        self.house_floors = []
+        total = 0
+        while total < flats:
+            size = min(rng.randint(*FLATS_PER_HOUSE), flats - total)
+            self.house_sizes.append(size)
+            self.house_floors.append(rng.choice(HOUSE_FLOORS))
+            total += size
+        self.owners = max(1, int(flats * OWNERS_PER_FLAT))
+        self.builders = max(5, flats // FLATS_PER_BUILDER)
+
+    def counts(self):
+        return {'apartment': len(self.house_sizes), 'owner': self.owners, 'builder': self.builders,
+                'repair_work': len(WORK_TYPES), 'flat': self.flats}
+
+    def rows(self, table):
+        # У каждой таблицы свой поток случайных чисел: строки не зависят от порядка генерации
+        rng = random.Random(f'{self.seed}:{table}')
+        return getattr(self, f'_{table}_rows')(rng)
+
+    def _apartment_rows(self, rng):
+        for index, (size, floors) in enumerate(zip(self.house_sizes, self.house_floors)):
+            built = date(1950, 1, 1) + timedelta(days=rng.randrange(73 * 365))
+            yield (apartment_key(index), _address(rng), built.isoformat(), str(floors), str(size),
+                   f'{size * rng.uniform(45, 70):.2f}')
+
+    def _owner_rows(self, rng):
+        for index in range(self.owners):
+            surname = rng.choice(SURNAMES)
+            name, male_patronymic, female_patronymic = rng.choice(NAMES)
+            if rng.random() < 0.5:
+                fio = f'{surname}а {rng.choice(FEMALE_NAMES)} {female_patronymic}'
+            else:
+                fio = f'{surname} {name} {male_patronymic}'
+            yield owner_key(index), fio, _phone(rng)
+
+    def _builder_rows(self, rng):
+        for index in range(self.builders):
+            yield (builder_key(index), f'ООО {rng.choice(BUILDER_NAMES)}-{index + 1}', _phone(rng),
+                   _address(rng))
+
+    def _repair_work_rows(self, rng):
+        for index, work_type in enumerate(WORK_TYPES):
+            yield repair_work_key(index), work_type
+
+    def _flat_rows(self, rng):
+        for house, (size, floors) in enumerate(zip(self.house_sizes, self.house_floors)):
+            key = apartment_key(house)
+            for number in range(1, size + 1):
+                yield (f'{key}:{number}', owner_key(rng.randrange(self.owners)), key, str(number),
+                       str((number - 1) * floors // size + 1), f'{rng.uniform(25, 120):.2f}')
+
+    def _current_repair_rows(self, rng):
+        for house in range(len(self.house_sizes)):
+            key = apartment_key(house)
+            for work in rng.sample(range(len(WORK_TYPES)), rng.randint(*REPAIRS_PER_HOUSE)):
+                start = date(2015, 1, 1) + timedelta(days=rng.randrange(10 * 365))
+                end = start + timedelta(days=rng.randint(14, 180))
+                yield (repair_work_key(work), builder_key(rng.randrange(self.builders)), key, WORK_TYPES[work],
+                       start.isoformat(), end.isoformat())
+
+
+def _address(rng):
+    return f'г. {rng.choice(CITIES)}, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 150)}'
+
+
+def _phone(rng):
+    return f'79{rng.randrange(10 ** 9):09d}'
+
+
+class _CopySource:
+    # Файл для COPY ... FROM STDIN: psycopg2 читает его через read(), строки генерируются
+    # кусками по мере чтения и целиком в памяти не собираются
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self._position = 0
+        self.count = 0
+
+    def read(self, size=-1):
+        # Кусок выдается частями с текущей позиции, без копирования остатка при каждом чтении
+        if self._position == len(self._buffer) and not self._fill():
+            return ''
+        if size < 0:
+            size = len(self._buffer)
+        data = self._buffer[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+    def _fill(self):
+        lines = []
+        for row in self._rows:
+            # Значения не содержат табуляций, переводов строк и обратной косой черты
+            lines.append('\t'.join(row))
+            if len(lines) == COPY_CHUNK_ROWS:
+                break
+        if not lines:
+            return False
+        self.count += len(lines)
+        self._buffer = '\n'.join(lines) + '\n'
+        self._position = 0
+        return True
+
+
+def load(connection, data_set, replace=False, progress=print):
+    # Загружает все таблицы одной транзакцией; возвращает {таблица: (строк, секунд)}
+    migrate(connection)
+    cursor = connection.cursor()
+    result = {}
+    try:
+        cursor.execute("SELECT " + ' OR '.join(f"EXISTS (SELECT 1 FROM public.{table})" for table in LOAD_ORDER))
+        if cursor.fetchone()[0] and not replace:
+            raise RuntimeError('Таблицы уже заполнены, для их очистки запустите с --replace')
+        # Построчные уведомления не нужны: после загрузки отправляется одно на таблицу
+        cursor.execute(f"SET LOCAL {SKIP_NOTIFY_SETTING} = 'on'")
+        if replace:
+            # Сводку по домам заполнят триггеры при загрузке квартир и ремонтов
+            cursor.execute(f"TRUNCATE public.apartment_summary, {', '.join(f'public.{table}' for table in LOAD_ORDER)}")
+        for table in LOAD_ORDER:
+            start = time.perf_counter()
+            source = _CopySource(data_set.rows(table))
+            cursor.copy_expert(f"COPY public.{table} ({', '.join(TABLE_COLUMNS[table])}) FROM STDIN", source)
+            result[table] = (source.count, time.perf_counter() - start)
+            if progress is not None:
+                progress(f'{table:<15} {source.count:>12,} строк  {result[table][1]:8.1f} с')
+        connection.commit()
+        for table in LOAD_ORDER:
+            cursor.execute(f"ANALYZE public.{table}")
+            notify_bulk_change(cursor, table)
+        connection.commit()
+        return result
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if argument != '--replace']
+    flats = int(arguments[0]) if arguments else DEFAULT_FLATS
+    seed = int(arguments[1]) if len(arguments) > 1 else DEFAULT_SEED
+    if not MIN_FLATS <= flats <= MAX_FLATS:
+        sys.exit(f'Количество квартир должно быть от {MIN_FLATS:,} до {MAX_FLATS:,}')
+
+    data_set = DataSet(flats, seed)
+    print(f'Квартир: {flats:,}, seed {seed}, ожидается строк: '
+          + ', '.join(f'{table} {count:,}' for table, count in data_set.counts().items()))
+    start = time.perf_counter()
+    try:
+        with pooled_connection() as connection:
+            load(connection, data_set, replace='--replace' in sys.argv)
+    except RuntimeError as error:
+        sys.exit(str(error))
+    finally:
+        close_pool()
+    print(f'Загрузка завершена за {time.perf_counter() - start:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
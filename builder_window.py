@@ -1,11 +1,20 @@
 import re
 import psycopg2
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit,
+    QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit,
     QMessageBox, QDialog
 )
-from connection import connect_to_database
-from error import contains_only_numb, contains_only_cor_text, has_correct_length, is_empty
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 
 class BuilderWindow(QWidget):
@@ -18,11 +27,33 @@ class BuilderWindow(QWidget):
     def initUI(self):
         layout = QVBoxLayout()
 
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['INN организации', 'Название организации', 'Телефон', 'Адрес'])
+        self.model = TableModel(['INN организации', 'Название организации', 'Телефон', 'Адрес'])
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('builder')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'builder', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('builder', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'builder', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопки управления
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -40,31 +71,50 @@ class BuilderWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'builder', self.refresh_data))
+        layout.addWidget(btn_import)
+
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'builder', self.model))
+        layout.addWidget(btn_export)
+
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
+
         self.setLayout(layout)
-        self.refresh_data()
+
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
     def refresh_data(self):
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM public.builder")
-            rows = cursor.fetchall()
-
-            self.table.setRowCount(0)
-
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных:\n{error}')
 
-        except (Exception, psycopg2.Error) as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         dialog = QDialog(self)
@@ -104,67 +154,45 @@ class BuilderWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, inn_org, name_of_org, ph_numb, adress, dialog):
-        # Валидация полей
-        if is_empty(inn_org):
-            QMessageBox.warning(self, 'Ошибка', "Не введён INN организации.")
-            return
-        if not contains_only_numb(inn_org):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: INN должен состоять только из цифр.")
-            return
-        if not has_correct_length(inn_org, 12, True):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: INN должен состоять из 12 цифр.")
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('builder', {
+            'inn_org': inn_org, 'name_of_org': name_of_org, 'ph_numb': ph_numb, 'adress': adress})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
-        if is_empty(name_of_org):
-            QMessageBox.warning(self, 'Ошибка', "Не введено название организации.")
-            return
-        if not contains_only_cor_text(name_of_org):
-            QMessageBox.warning(self, 'Ошибка',
-                                "Некорректные символы: название органирзации содержит некорректные символы.")
-            return
-        if not has_correct_length(name_of_org, 50):
-            QMessageBox.warning(self, 'Ошибка',
-                                "Неверная длина: название организации не должно быть длиннее 50 симоволов.")
-            return
-        if is_empty(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', "Не введён номер телефона.")
-            return
-        if not contains_only_numb(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: телефон должен состоять только из цифр.")
-            return
-        if not has_correct_length(ph_numb, 11, True):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: телефон должен состоять из 10 цифр.")
-            return
-        if is_empty(adress):
-            QMessageBox.warning(self, 'Ошибка', "Не введён адрес.")
-            return
-        if not contains_only_cor_text(adress):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: адрес содержит некорректные символы.")
-            return
-        if not has_correct_length(adress, 125, ):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: адрес не должно быть длиннее 125 симоволов.")
-            return
-        try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
 
-            # Проверка уникальности UID
-            cursor.execute("SELECT * FROM public.builder WHERE inn_org = %s", (inn_org,))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Организация с этим INN уже есть в базе данных')
+        try:
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((inn_org, name_of_org, ph_numb, adress))
+                dialog.close()
                 return
 
-            # Вставка записи
-            cursor.execute("""
-                INSERT INTO public.builder (inn_org, name_of_org, ph_numb, adress)
-                VALUES (%s, %s, %s, %s)
-            """, (inn_org, name_of_org, ph_numb, adress))
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+
+                # Проверка уникальности UID
+                cursor.execute("SELECT * FROM public.builder WHERE inn_org = %s", (inn_org,))
+                if cursor.fetchone() is not None:
+                    QMessageBox.warning(self, 'Ошибка', 'Организация с этим INN уже есть в базе данных')
+                    return
+
+                # Вставка записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    INSERT INTO public.builder (inn_org, name_of_org, ph_numb, adress)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING *
+                """, (inn_org, name_of_org, ph_numb, adress))
+                row = cursor.fetchone()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
+
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('builder', inn_org)
 
             # Обновление данных и закрытие диалога
-            self.refresh_data()
+            self.model.insert_row(row)
             dialog.close()
 
             QMessageBox.information(self, 'Успех', 'Запись успешно добавлена')
@@ -173,43 +201,55 @@ class BuilderWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        inn_org = self.table.item(selected_row, 0).text()
+        keys = [self.model.text(selected_row, 0) for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с INN {keys[0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение',
-                                     f'Вы уверены, что хотите удалить запись с INN {inn_org}?',
+        reply = QMessageBox.question(self, 'Подтверждение', question,
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                      QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM public.builder WHERE inn_org = %s", (inn_org,))
-                connection.commit()
-                cursor.close()
-                connection.close()
-
-                self.refresh_data()
-
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(origin_sql(self.live_updates.origin) + "DELETE FROM public.builder WHERE inn_org IN %s", (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Ключи справочника в кеше больше не актуальны
+                for key in keys:
+                    reference_cache.invalidate('builder', key)
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows([(key,) for key in keys])
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи:\n{str(error)}')
 
     def edit_record(self):
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
-        inn_org = self.table.item(selected_row, 0).text()
-        name_of_org = self.table.item(selected_row, 1).text()
-        ph_numb = self.table.item(selected_row, 2).text()
-        adress = self.table.item(selected_row, 3).text()
+        inn_org = self.model.text(selected_row, 0)
+        name_of_org = self.model.text(selected_row, 1)
+        ph_numb = self.model.text(selected_row, 2)
+        adress = self.model.text(selected_row, 3)
 
         dialog = QDialog(self)
         dialog.setWindowTitle("Изменить запись")
@@ -248,51 +288,43 @@ class BuilderWindow(QWidget):
         dialog.exec()
 
     def update_record(self, inn_org, name_of_org, ph_numb, adress, dialog):
-        if is_empty(name_of_org):
-            QMessageBox.warning(self, 'Ошибка', "Не введено название организации.")
-            return
-        if not contains_only_cor_text(name_of_org):
-            QMessageBox.warning(self, 'Ошибка',
-                                "Некорректные символы: название органирзации содержит некорректные символы.")
-            return
-        if not has_correct_length(name_of_org, 50):
-            QMessageBox.warning(self, 'Ошибка',
-                                "Неверная длина: название организации не должно быть длиннее 50 симоволов.")
-            return
-        if is_empty(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', "Не введён номер телефона.")
-            return
-        if not contains_only_numb(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: телефон должен состоять только из цифр.")
-            return
-        if not has_correct_length(ph_numb, 11, True):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: телефон должен состоять из 10 цифр.")
-            return
-        if is_empty(adress):
-            QMessageBox.warning(self, 'Ошибка', "Не введён адрес.")
-            return
-        if not contains_only_cor_text(adress):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: адрес содержит некорректные символы.")
-            return
-        if not has_correct_length(adress, 125):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: адрес не должно быть длиннее 125 симоволов.")
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('builder', {
+            'name_of_org': name_of_org, 'ph_numb': ph_numb, 'adress': adress})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((inn_org, name_of_org, ph_numb, adress))
+                dialog.close()
+                return
+
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            cursor.execute("""
-                UPDATE public.builder
-                SET name_of_org = %s, ph_numb = %s, adress = %s
-                WHERE inn_org = %s
-            """, (name_of_org, ph_numb, adress, inn_org))
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    UPDATE public.builder
+                    SET name_of_org = %s, ph_numb = %s, adress = %s
+                    WHERE inn_org = %s
+                    RETURNING *
+                """, (name_of_org, ph_numb, adress, inn_org))
+                row = cursor.fetchone()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
 
-            self.refresh_data()
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('builder', inn_org)
+            if row is None:
+                # Строку удалили после загрузки таблицы
+                self.model.remove_rows([(inn_org,)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
+            self.model.update_row(row)
             dialog.close()
 
             QMessageBox.information(self, 'Успех', 'Запись успешно изменена')
@@ -0,0 +1,118 @@
+import threading
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QFileDialog, QMessageBox, QProgressDialog
+
+from bulk_export import export_to_file, parquet_available
+from bulk_import import import_csv
+from workers import BackgroundTask, start_task
+
+
+def import_csv_dialog(parent, table, on_finished=None):
+    # Выбор CSV-файла и загрузка его в таблицу в фоновом потоке с окном прогресса.
+    # on_finished вызывается, если в таблицу добавлена хотя бы одна строка
+    path, _ = QFileDialog.getOpenFileName(parent, 'Импорт из CSV', '', 'CSV (*.csv);;Все файлы (*)')
+    if not path:
+        return
+    errors_path = path + '.errors.csv'
+
+    progress = QProgressDialog('Подготовка загрузки...', 'Остановить', 0, 0, parent)
+    progress.setWindowTitle('Импорт из CSV')
+    progress.setWindowModality(Qt.WindowModality.WindowModal)
+    progress.setMinimumDuration(0)
+    progress.setAutoClose(False)
+    progress.setAutoReset(False)
+
+    # Остановка проверяется между пачками, а не прерывает запрос: уже загруженные
+    # пачки остаются в базе целиком, и итог показывается как при обычном завершении
+    stop = threading.Event()
+    task = BackgroundTask(_run_import, table, path, errors_path, stop)
+    # Диалог держит ссылку на задачу, пока она не закончится
+    progress.task = task
+    progress.canceled.connect(stop.set)
+    task.signals.progress.connect(lambda state: progress.setLabelText(
+        'Обработано строк: {}\nДобавлено: {}, отклонено: {}\nСкорость: {:.0f} строк/с'.format(*state)))
+
+    def finished(result):
+        progress.close()
+        text = (f'Обработано строк: {result.rows}\nДобавлено: {result.inserted}\n'
+                f'Отклонено: {result.rejected}\nСкорость: {result.rows_per_sec():.0f} строк/с')
+        if result.cancelled:
+            text = 'Загрузка остановлена, уже загруженные строки сохранены.\n\n' + text
+        if result.errors:
+            first_errors = '\n'.join(f'Строка {line_no}: {message}' for line_no, message in result.errors[:10])
+            text += f'\n\nПервые ошибки:\n{first_errors}\n\nВсе ошибки записаны в файл:\n{errors_path}'
+            QMessageBox.warning(parent, 'Импорт из CSV', text)
+        else:
+            QMessageBox.information(parent, 'Импорт из CSV', text)
+        if result.inserted and on_finished is not None:
+            on_finished()
+
+    def failed(error):
+        progress.close()
+        QMessageBox.warning(parent, 'Ошибка', f'Ошибка при загрузке файла в базу данных:\n{error}')
+        if on_finished is not None:
+            on_finished()
+
+    task.signals.finished.connect(finished)
+    task.signals.failed.connect(failed)
+    progress.show()
+    start_task(task)
+
+
+def _run_import(task, table, path, errors_path, stop):
+    # Выполняется в фоновом потоке
+    def report(result):
+        task.signals.progress.emit((result.rows, result.inserted, result.rejected, result.rows_per_sec()))
+
+    return import_csv(table, path, errors_path=errors_path, progress=report, is_cancelled=stop.is_set)
+
+
+def export_dialog(parent, table, model):
+    # Выгрузка в CSV или Parquet тех же строк, что выбраны запросом окна (с его фильтрами),
+    # а не только уже загруженных в модель
+    file_types = 'CSV (*.csv)'
+    if parquet_available():
+        file_types += ';;Parquet (*.parquet)'
+    path, file_type = QFileDialog.getSaveFileName(parent, 'Экспорт', f'{table}.csv', file_types)
+    if not path:
+        return
+    if file_type.startswith('Parquet') and not path.lower().endswith('.parquet'):
+        path += '.parquet'
+    query, params = model.current_query()
+
+    progress = QProgressDialog('Подготовка выгрузки...', 'Отменить', 0, 0, parent)
+    progress.setWindowTitle('Экспорт')
+    progress.setWindowModality(Qt.WindowModality.WindowModal)
+    progress.setMinimumDuration(0)
+    progress.setAutoClose(False)
+    progress.setAutoReset(False)
+
+    task = BackgroundTask(_run_export, query, params, path)
+    progress.task = task
+    progress.canceled.connect(task.cancel)
+    task.signals.progress.connect(lambda state: progress.setLabelText(
+        'Выгружено строк: {}\nСкорость: {:.0f} строк/с'.format(*state)))
+
+    def finished(result):
+        progress.close()
+        QMessageBox.information(parent, 'Экспорт', f'Выгружено строк: {result.rows}\nФайл: {result.path}\n'
+                                                   f'Скорость: {result.rows_per_sec():.0f} строк/с')
+
+    def failed(error):
+        progress.close()
+        QMessageBox.warning(parent, 'Ошибка', f'Ошибка при выгрузке данных:\n{error}')
+
+    task.signals.finished.connect(finished)
+    task.signals.failed.connect(failed)
+    task.signals.cancelled.connect(progress.close)
+    progress.show()
+    start_task(task)
+
+
+def _run_export(task, query, params, path):
+    # Выполняется в фоновом потоке
+    def report(result):
+        task.signals.progress.emit((result.rows, result.rows_per_sec()))
+
+    return export_to_file(query, params, path, progress=report, watch=task.watch)
@@ -0,0 +1,207 @@
+import importlib.util
+import os
+import sys
+import time
+
+from psycopg2 import extensions
+
+from connection import RowStream, pooled_connection
+from tables import TABLE_COLUMNS
+
+# pyarrow нужен только для выгрузки в Parquet и загружается при первой такой выгрузке
+# (_load_pyarrow): его импорт занимает заметную часть запуска приложения
+pa = None
+pq = None
+
+# Сколько строк забирать с сервера и записывать одной группой строк Parquet
+PARQUET_BATCH_ROWS = 50000
+# Как часто (в строках) сообщать о ходе выгрузки в CSV
+PROGRESS_EVERY = 10000
+# OID типов PostgreSQL, которые пишутся в Parquet своим типом; остальные - строкой
+INTEGER_OIDS = (20, 21, 23)
+FLOAT_OIDS = (700, 701)
+NUMERIC_OID = 1700
+DATE_OID = 1082
+BOOL_OID = 16
+
+
+def parquet_available():
+    # Без импорта самого pyarrow: достаточно, что он установлен
+    return pq is not None or importlib.util.find_spec('pyarrow') is not None
+
+
+def _load_pyarrow():
+    global pa, pq
+    if pq is None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            # Parquet необязателен: без pyarrow доступна только выгрузка в CSV
+            pa = None
+            pq = None
+    return pq is not None
+
+
+class ExportResult:
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.elapsed = 0.0
+
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _CountingFile:
+    # Файл для COPY ... TO STDOUT: psycopg2 передает в write() по одной строке таблицы
+    def __init__(self, target, result, start, progress):
+        self._target = target
+        self._result = result
+        self._start = start
+        self._progress = progress
+        # Первой приходит строка заголовка
+        self._written = -1
+
+    def write(self, data):
+        self._target.write(data)
+        self._written += 1
+        if self._written > 0 and self._written % PROGRESS_EVERY == 0:
+            self._result.rows = self._written
+            self._result.elapsed = time.perf_counter() - self._start
+            if self._progress is not None:
+                self._progress(self._result)
+
+    def rows(self):
+        return max(self._written, 0)
+
+
+def export_to_file(query, params, path, progress=None, watch=None):
+    # Формат выбирается по расширению файла
+    if path.lower().endswith('.parquet'):
+        return export_parquet(query, params, path, progress, watch)
+    return export_csv(query, params, path, progress, watch)
+
+
+def export_csv(query, params, path, progress=None, watch=None):
+    # Сервер сам формирует CSV (COPY ... TO STDOUT), строки сразу пишутся в файл.
+    # watch(cancellable) получает соединение, чтобы выгрузку можно было прервать.
+    result = ExportResult(path)
+    start = time.perf_counter()
+    try:
+        with pooled_connection() as connection, open(path, 'w', newline='', encoding='utf-8') as target:
+            if watch is not None:
+                watch(connection)
+            try:
+                cursor = connection.cursor()
+                counter = _CountingFile(target, result, start, progress)
+                sql = cursor.mogrify(query, params).decode()
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", counter)
+                cursor.close()
+            finally:
+                if watch is not None:
+                    watch(None)
+    except BaseException:
+        _remove(path)
+        raise
+    result.rows = counter.rows()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def export_parquet(query, params, path, progress=None, watch=None):
+    # Строки читаются серверным курсором порциями по PARQUET_BATCH_ROWS,
+    # каждая порция записывается отдельной группой строк
+    if not _load_pyarrow():
+        raise RuntimeError('Для выгрузки в Parquet нужен пакет pyarrow')
+    result = ExportResult(path)
+    start = time.perf_counter()
+    stream = RowStream(query, params, itersize=PARQUET_BATCH_ROWS)
+    if watch is not None:
+        watch(stream)
+    writer = None
+    try:
+        while not stream.exhausted:
+            rows = stream.fetch()
+            if writer is None and stream.description():
+                schema = _parquet_schema(stream.description())
+                writer = pq.ParquetWriter(path, schema)
+            if rows:
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(_column_values(column, field), type=field.type)
+                     for column, field in zip(columns, schema)], schema=schema))
+            result.rows += len(rows)
+            result.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(result)
+        # Прерванный поток закрывается и отдает пустую порцию, как дочитанный до конца
+        if stream.cancelled:
+            raise extensions.QueryCanceledError('Выгрузка прервана')
+        if writer is None:
+            raise RuntimeError('Не удалось определить столбцы результата запроса')
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        _remove(path)
+        raise
+    finally:
+        stream.close()
+        if watch is not None:
+            watch(None)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _parquet_schema(description):
+    # Типы столбцов берутся из описания курсора, а не из значений: следующие порции могут
+    # содержать числа с большим числом знаков или значения там, где в первой были только NULL.
+    # numeric без указанного масштаба (как square) или точнее decimal128 пишется строкой без потери точности
+    fields = []
+    for column in description:
+        if column.type_code in INTEGER_OIDS:
+            column_type = pa.int64()
+        elif column.type_code in FLOAT_OIDS:
+            column_type = pa.float64()
+        elif column.type_code == NUMERIC_OID and column.scale is not None and column.precision <= 38:
+            column_type = pa.decimal128(38, column.scale)
+        elif column.type_code == DATE_OID:
+            column_type = pa.date32()
+        elif column.type_code == BOOL_OID:
+            column_type = pa.bool_()
+        else:
+            column_type = pa.string()
+        fields.append(pa.field(column.name, column_type))
+    return pa.schema(fields)
+
+
+def _column_values(column, field):
+    # Значения столбцов, записываемых строкой, приводятся к тексту
+    if pa.types.is_string(field.type):
+        return [None if value is None else str(value) for value in column]
+    return column
+
+
+def _remove(path):
+    # Недописанный файл не оставляем
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _print_progress(result):
+    print(f'\rВыгружено строк: {result.rows}, {result.rows_per_sec():.0f} строк/с', end='', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # Выгрузка без интерфейса: python bulk_export.py <таблица> <файл.csv|файл.parquet>
+    if len(sys.argv) != 3 or sys.argv[1] not in TABLE_COLUMNS:
+        print(f'Использование: python bulk_export.py <{"|".join(TABLE_COLUMNS)}> <файл.csv|файл.parquet>')
+        sys.exit(2)
+    table_name, file_path = sys.argv[1], sys.argv[2]
+    export_result = export_to_file(f"SELECT * FROM public.{table_name}", None, file_path, progress=_print_progress)
+    print(file=sys.stderr)
+    print(f'Выгружено строк: {export_result.rows} в {file_path}, время: {export_result.elapsed:.1f} с '
+          f'({export_result.rows_per_sec():.0f} строк/с)')
@@ -0,0 +1,283 @@
+import csv
+import io
+import sys
+import time
+
+import psycopg2
+
+from connection import pooled_connection
+from error import TABLE_SPECS, validate_batch
+from notifications import SKIP_NOTIFY_SETTING, notify_bulk_change
+from reference_cache import REFERENCE_TABLES, reference_cache
+from tables import TABLE_COLUMNS, TABLE_KEYS
+
+# Сколько строк файла проверять и загружать за одну транзакцию
+BATCH_SIZE = 10000
+# Сколько первых ошибок хранить в результате для показа в окне (полный список пишется в файл)
+MAX_REPORTED_ERRORS = 100
+
+# Проверки строки промежуточной таблицы s перед переносом: условие отказа и текст ошибки.
+# Те же проверки, что выполняют окна при добавлении одной записи
+MERGE_CHECKS = {
+    'flat': [
+        ("NOT EXISTS (SELECT 1 FROM public.owner AS o WHERE o.uid = s.owner_uid)",
+         'Владелеца квартиры с этим UID нет базе данных'),
+        ("NOT EXISTS (SELECT 1 FROM public.apartment AS a WHERE a.cod_num_hom = s.aprtmt_uid)",
+         'МКД с этим кадастровым номером нет в базе данных'),
+        ("s.nom_flt::numeric > (SELECT a.num_of_flts FROM public.apartment AS a "
+         "WHERE a.cod_num_hom = s.aprtmt_uid)::numeric",
+         'Номер квартиры превышает общее количество квартир в доме.'),
+        ("s.floor_flt::numeric > (SELECT a.num_of_flrs FROM public.apartment AS a "
+         "WHERE a.cod_num_hom = s.aprtmt_uid)::numeric",
+         'Этаж превышает количество этажей в доме.'),
+        ("s.square_flt::numeric > (SELECT a.square FROM public.apartment AS a "
+         "WHERE a.cod_num_hom = s.aprtmt_uid)::numeric",
+         'Площадь квартиры превышает площадь многоквартирного дома.'),
+    ],
+    'current_repair': [
+        ("NOT EXISTS (SELECT 1 FROM public.apartment AS a WHERE a.cod_num_hom = s.cod_num_hom)",
+         'МКД с этим кадастровым номером нет в базе данных'),
+        ("NOT EXISTS (SELECT 1 FROM public.repair_work AS r WHERE r.cod_rep_work = s.cod_rep_work)",
+         'Ремонтной работы с этим кодом нет в базе данных'),
+        ("NOT EXISTS (SELECT 1 FROM public.builder AS b WHERE b.inn_org = s.inn_org)",
+         'Строительной организации с таким ИНН нет в базе данных'),
+    ],
+}
+
+
+class ImportResult:
+    def __init__(self):
+        # Сколько строк файла обработано, добавлено в базу и отклонено
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.cancelled = False
+        # Первые MAX_REPORTED_ERRORS ошибок: (номер строки файла, текст)
+        self.errors = []
+
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def import_csv(table, path, errors_path=None, progress=None, is_cancelled=None, batch_size=BATCH_SIZE,
+               delimiter=',', checker=None):
+    # Загрузка CSV-файла в таблицу. Файл читается потоком, пачками по batch_size строк:
+    # строки проверяются правилами TABLE_SPECS из error.py, годные копируются через COPY во временную
+    # таблицу и переносятся в основную одним запросом. Каждая пачка - отдельная транзакция,
+    # поэтому при отмене или ошибке уже загруженные пачки остаются в базе.
+    # progress(result) вызывается после каждой пачки.
+    # checker(table, batches) проверяет пачки и выдает по порядку результаты check_batch вместе с
+    # размером пачки; по умолчанию - в этом же процессе (параллельная проверка - import_pipeline.py)
+    result = ImportResult()
+    start = time.perf_counter()
+    errors_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    errors_writer = csv.writer(errors_file) if errors_file else None
+
+    def report(line_no, message):
+        result.rejected += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append((line_no, message))
+        if errors_writer is not None:
+            errors_writer.writerow((line_no, message))
+
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as source, pooled_connection() as connection:
+            reader = csv.reader(source, delimiter=delimiter)
+            cursor = connection.cursor()
+            staging = _prepare_staging(cursor, table)
+            connection.commit()
+            checked = (checker or _check_batches)(table, _read_batches(reader, table, batch_size))
+            try:
+                for size, errors, count, text in checked:
+                    if is_cancelled is not None and is_cancelled():
+                        result.cancelled = True
+                        break
+                    for line_no, message in errors:
+                        report(line_no, message)
+                    if count:
+                        loaded = _copy_batch(cursor, staging, table, text, count, report)
+                        result.inserted += loaded - _merge_batch(cursor, staging, table, report)
+                    connection.commit()
+
+                    result.rows += size
+                    result.elapsed = time.perf_counter() - start
+                    if progress is not None:
+                        progress(result)
+            finally:
+                checked.close()
+                _finish(connection, cursor, table, result.inserted > 0)
+    finally:
+        if errors_file is not None:
+            errors_file.close()
+
+    if table in REFERENCE_TABLES and result.inserted:
+        reference_cache.invalidate(table)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _read_batches(reader, table, batch_size):
+    columns = TABLE_COLUMNS[table]
+    order = None
+    first = True
+    batch = []
+    for values in reader:
+        if not values:
+            continue
+        if first:
+            first = False
+            # Строка с именами столбцов задает их порядок в файле
+            names = [value.strip().lower() for value in values]
+            if sorted(names) == sorted(columns):
+                order = [names.index(column) for column in columns]
+                continue
+        if order is not None and len(values) == len(order):
+            values = [values[index] for index in order]
+        batch.append((reader.line_num, values))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prepare_staging(cursor, table):
+    # Построчные уведомления об изменениях не нужны: после загрузки отправляется одно общее
+    cursor.execute(f"SET {SKIP_NOTIFY_SETTING} = 'on'")
+    # Временная таблица живет до конца сеанса, строки из нее удаляются при каждом COMMIT
+    staging = f'import_staging_{table}'
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+                   f"(line_no bigint, LIKE public.{table}, reject_reason text) ON COMMIT DELETE ROWS")
+    return staging
+
+
+def _finish(connection, cursor, table, changed):
+    # Соединение возвращается в пул, поэтому настройку сеанса нужно сбросить. RESET отменяется
+    # вместе с транзакцией, и если она не завершилась, соединение закрывается: с отключенными
+    # уведомлениями оно не должно попасть в пул, пул заменит его новым
+    try:
+        connection.rollback()
+        cursor.execute(f"RESET {SKIP_NOTIFY_SETTING}")
+        if changed:
+            notify_bulk_change(cursor, table)
+        connection.commit()
+        cursor.close()
+    except psycopg2.Error:
+        connection.close()
+
+
+def _check_batches(table, batches):
+    for batch in batches:
+        yield (len(batch),) + check_batch(table, batch)
+
+
+def check_batch(table, batch):
+    # Проверка пачки правилами TABLE_SPECS из error.py за один проход. Значения очищаются от
+    # пробелов по краям. Возвращает ошибки [(номер строки файла, текст)], число верных строк
+    # и сами верные строки в виде CSV для COPY (номер строки файла - первый столбец).
+    # Не обращается к базе, поэтому может выполняться в другом процессе (import_pipeline.py)
+    batch = [(line_no, list(map(str.strip, values))) for line_no, values in batch]
+    invalid = dict(validate_batch(table, [values for _, values in batch]))
+    errors = []
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for index, (line_no, values) in enumerate(batch):
+        if index in invalid:
+            errors.append((line_no, ' '.join(invalid[index])))
+        else:
+            writer.writerow([line_no] + values)
+    return errors, len(batch) - len(errors), buffer.getvalue()
+
+
+def _copy_batch(cursor, staging, table, text, count, report):
+    # text - count строк в виде CSV из check_batch. Возвращает число строк, попавших во временную таблицу
+    columns = ', '.join(('line_no',) + TABLE_COLUMNS[table])
+    cursor.execute("SAVEPOINT import_batch")
+    try:
+        cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", io.StringIO(text))
+        cursor.execute("RELEASE SAVEPOINT import_batch")
+        return count
+    except psycopg2.DataError:
+        cursor.execute("ROLLBACK TO SAVEPOINT import_batch")
+
+    # Какое-то значение не приводится к типу столбца: находим такие строки по одной
+    loaded = 0
+    placeholders = ', '.join(['%s'] * (len(TABLE_COLUMNS[table]) + 1))
+    for values in csv.reader(io.StringIO(text)):
+        line_no = int(values[0])
+        cursor.execute("SAVEPOINT import_row")
+        try:
+            cursor.execute(f"INSERT INTO {staging} ({columns}) VALUES ({placeholders})", values)
+        except psycopg2.DataError as error:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_row")
+            report(line_no, error.diag.message_primary or str(error))
+            continue
+        cursor.execute("RELEASE SAVEPOINT import_row")
+        loaded += 1
+    cursor.execute("RELEASE SAVEPOINT import_batch")
+    return loaded
+
+
+def _merge_batch(cursor, staging, table, report):
+    # Переносит проверенные строки в основную таблицу, возвращает число отклоненных
+    columns = ', '.join(TABLE_COLUMNS[table])
+    keys = TABLE_KEYS[table]
+    key_match = ' AND '.join(f't.{key} = s.{key}' for key in keys)
+    partition = ', '.join(f's.{key}' for key in keys)
+    checks = [(f"EXISTS (SELECT 1 FROM public.{table} AS t WHERE {key_match})",
+               'Запись с таким ключом уже есть в базе данных'),
+              (f"row_number() OVER (PARTITION BY {partition} ORDER BY s.line_no) > 1",
+               'Ключ повторяется в файле')] + MERGE_CHECKS.get(table, [])
+
+    # Причину отказа записываем прямо во временную таблицу, одним запросом на пачку
+    cursor.execute(f"""
+        WITH checked AS (
+            SELECT s.line_no, CASE {' '.join(f'WHEN {condition} THEN %s' for condition, _ in checks)} END AS reason
+            FROM {staging} AS s
+        )
+        UPDATE {staging} AS s SET reject_reason = checked.reason
+        FROM checked
+        WHERE s.line_no = checked.line_no AND checked.reason IS NOT NULL
+        RETURNING s.line_no, s.reject_reason
+    """, [message for _, message in checks])
+    rejected = cursor.fetchall()
+
+    # Строки, которые успел добавить другой оператор, отсекает ON CONFLICT
+    cursor.execute(f"""
+        WITH inserted AS (
+            INSERT INTO public.{table} ({columns})
+            SELECT {columns} FROM {staging} WHERE reject_reason IS NULL
+            ON CONFLICT DO NOTHING
+            RETURNING {', '.join(keys)}
+        )
+        SELECT s.line_no, %s FROM {staging} AS s
+        WHERE s.reject_reason IS NULL
+          AND NOT EXISTS (SELECT 1 FROM inserted AS t WHERE {key_match})
+    """, ('Запись с таким ключом уже есть в базе данных',))
+    rejected += cursor.fetchall()
+
+    for line_no, message in sorted(rejected):
+        report(line_no, message)
+    return len(rejected)
+
+
+def _print_progress(result):
+    print(f'\rОбработано строк: {result.rows}, добавлено: {result.inserted}, '
+          f'отклонено: {result.rejected}, {result.rows_per_sec():.0f} строк/с', end='', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # Загрузка без интерфейса: python bulk_import.py <таблица> <файл.csv>
+    if len(sys.argv) != 3 or sys.argv[1] not in TABLE_SPECS:
+        print(f'Использование: python bulk_import.py <{"|".join(TABLE_SPECS)}> <файл.csv>')
+        sys.exit(2)
+    table_name, csv_path = sys.argv[1], sys.argv[2]
+    import_result = import_csv(table_name, csv_path, errors_path=csv_path + '.errors.csv',
+                               progress=_print_progress)
+    print(file=sys.stderr)
+    print(f'Добавлено строк: {import_result.inserted}, отклонено: {import_result.rejected}, '
+          f'время: {import_result.elapsed:.1f} с ({import_result.rows_per_sec():.0f} строк/с)')
+    if import_result.rejected:
+        print(f'Ошибки записаны в {csv_path}.errors.csv')
+    sys.exit(1 if import_result.rejected else 0)
@@ -1,15 +1,202 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions, pool
 from PyQt6.QtWidgets import QMessageBox
+from query_log import TimedCursor
+
+# Параметры подключения к базе данных
+DB_PARAMS = {
+    'host': "localhost",
+    'database': "db_for_reg_oper",
+    'user': "postgres",
+    'password': "postgresql",
+}
+
+# Размеры пула соединений: сколько держать открытыми всегда и сколько максимум
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+# Сколько секунд ждать свободного соединения, если все заняты
+POOL_ACQUIRE_TIMEOUT = 30
+# Соединение, простоявшее без дела дольше этого времени (сек), проверяется запросом SELECT 1
+HEALTH_CHECK_INTERVAL = 30
+# Сколько строк за один раз забирать с сервера при потоковой загрузке таблиц
+STREAM_ITERSIZE = 2000
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_MAX_SIZE)
+# Время последнего возврата соединения в пул, по id соединения
+_last_used = {}
+_stream_ids = itertools.count(1)
+
 
 # Подключение к базе данных
 def connect_to_database():
     try:
-        connection = psycopg2.connect(
-            host="localhost",
-            database="db_for_reg_oper",
-            user="postgres",
-            password="postgresql"
-        )
+        connection = psycopg2.connect(**DB_PARAMS)
         return connection
     except (Exception, psycopg2.Error) as error:
         QMessageBox.warning(None, 'Ошибка', f'Ошибка при подключении к базе данных:\n{str(error)}')
+
+
+def get_pool():
+    # Пул создается один раз на процесс при первом обращении
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Запросы через соединения пула замеряются (query_log.py)
+            _pool = pool.ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, cursor_factory=TimedCursor, **DB_PARAMS)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def _is_alive(connection):
+    if connection.closed:
+        return False
+    if connection.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    # Недавно использованное соединение считаем живым без лишнего запроса к серверу
+    if time.monotonic() - _last_used.get(id(connection), 0) < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(db_pool):
+    connection = db_pool.getconn()
+    while not _is_alive(connection):
+        # Разорванное соединение закрываем и берем новое
+        _forget(connection)
+        db_pool.putconn(connection, close=True)
+        connection = db_pool.getconn()
+    return connection
+
+
+def _forget(connection):
+    _last_used.pop(id(connection), None)
+
+
+def _release(db_pool, connection):
+    if not connection.closed and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        # Незавершенную транзакцию откатываем, чтобы не вернуть в пул "грязное" соединение
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            pass
+    broken = bool(connection.closed) or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE
+    if broken:
+        _forget(connection)
+    else:
+        _last_used[id(connection)] = time.monotonic()
+    db_pool.putconn(connection, close=broken)
+
+
+def acquire_connection():
+    # Соединение нужно обязательно вернуть через release_connection()
+    if not _pool_slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+        raise pool.PoolError('Нет свободных соединений с базой данных')
+    try:
+        return _checkout(get_pool())
+    except Exception:
+        _pool_slots.release()
+        raise
+
+
+def release_connection(connection):
+    try:
+        _release(get_pool(), connection)
+    finally:
+        _pool_slots.release()
+
+
+# Соединение из общего пула: with pooled_connection() as connection: ...
+@contextmanager
+def pooled_connection():
+    connection = acquire_connection()
+    try:
+        yield connection
+    finally:
+        release_connection(connection)
+
+
+class RowStream:
+    # Построчная выдача результата запроса через именованный (серверный) курсор.
+    # Соединение занято, пока поток не дочитан до конца или не закрыт.
+    def __init__(self, query, params=None, itersize=STREAM_ITERSIZE):
+        self.query = query
+        self.itersize = itersize
+        self.exhausted = False
+        self.cancelled = False
+        self._description = []
+        self._lock = threading.Lock()
+        self._connection = acquire_connection()
+        try:
+            self._cursor = self._connection.cursor(name=f'row_stream_{next(_stream_ids)}')
+            self._cursor.itersize = itersize
+            self._cursor.execute(query, params)
+        except Exception:
+            release_connection(self._connection)
+            self._connection = None
+            raise
+
+    def fetch(self, count=None):
+        if self.cancelled:
+            self.close()
+        if self.exhausted:
+            return []
+        count = count or self.itersize
+        try:
+            rows = self._cursor.fetchmany(count)
+        except Exception:
+            self.close()
+            raise
+        if not self._description:
+            self._description = list(self._cursor.description or ())
+        if len(rows) < count:
+            self.close()
+        return rows
+
+    def columns(self):
+        # Имена столбцов результата (известны после первого fetch)
+        return [column.name for column in self._description]
+
+    def description(self):
+        # Описание столбцов курсора (имя, OID типа, точность, масштаб); известно после первого fetch
+        return self._description
+
+    def cancel(self):
+        # Можно вызывать из другого потока: прерывает выполняющийся на сервере запрос
+        with self._lock:
+            self.cancelled = True
+            if self._connection is not None and not self._connection.closed:
+                self._connection.cancel()
+
+    def close(self):
+        with self._lock:
+            self.exhausted = True
+            if self._connection is None:
+                return
+            try:
+                self._cursor.close()
+            except psycopg2.Error:
+                pass
+            release_connection(self._connection)
+            self._connection = None
@@ -1,8 +1,16 @@
 import psycopg2
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QMessageBox, QDialog
-from connection import connect_to_database
-from error import (correct_cod_aprtmt, contains_only_cor_text, has_correct_length, is_empty,
-                   contains_only_numb, is_cor_date)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QDialog
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 class CurrentRepairWindow(QWidget):
     def __init__(self):
@@ -15,11 +23,34 @@ class CurrentRepairWindow(QWidget):
         layout = QVBoxLayout()
 
         # Создаем таблицу для отображения данных
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(['Код работы', 'ИНН организации', 'Код номера дома', 'Наименование работы', 'Дата начала', 'Дата окончания'])
+        self.model = TableModel(['Код работы', 'ИНН организации', 'Код номера дома', 'Наименование работы', 'Дата начала', 'Дата окончания'],
+                                key_columns=(0, 1, 2))
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('current_repair')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'current_repair', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('current_repair', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'current_repair', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопка для обновления данных в таблице
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -40,36 +71,50 @@ class CurrentRepairWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'current_repair', self.refresh_data))
+        layout.addWidget(btn_import)
+
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'current_repair', self.model))
+        layout.addWidget(btn_export)
+
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
+
         self.setLayout(layout)
 
-        # Обновляем данные при открытии окна
-        self.refresh_data()
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
     def refresh_data(self):
-        # Подключаемся к базе данных и получаем данные
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM public.current_repair")
-            rows = cursor.fetchall()
-
-            # Очищаем таблицу перед обновлением данных
-            self.table.setRowCount(0)
-
-            # Заполняем таблицу данными
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
 
-        except psycopg2.Error as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         # Окно для ввода новой записи
@@ -126,96 +171,74 @@ class CurrentRepairWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end, dialog):
-        if is_empty(cod_rep_work):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы не может быть пустым.')
-            return
-        if not contains_only_numb(cod_rep_work):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы должен содержать только цифры.')
-            return
-        if not has_correct_length(cod_rep_work, 12, True):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы должен быть длиной 12 символов.')
-            return
-
-        if is_empty(inn_org):
-            QMessageBox.warning(self, 'Ошибка', "Не введён INN организации.")
-            return
-        if not contains_only_numb(inn_org):
-            QMessageBox.warning(self, 'Ошибка', "Некорректные символы: INN должен состоять только из цифр.")
-            return
-        if not has_correct_length(inn_org, 12, True):
-            QMessageBox.warning(self, 'Ошибка', "Неверная длина: INN должен состоять из 12 цифр.")
-            return
-
-        if is_empty(cod_num_hom):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен кадастровый номер номера дома.')
-            return
-        if not correct_cod_aprtmt(cod_num_hom):
-            QMessageBox.warning(self, 'Ошибка', 'Кадастровый номер должен содержать только цифры и :.')
-            return
-        if not has_correct_length(cod_num_hom, 20, ):
-            QMessageBox.warning(self, 'Ошибка', 'Неверная длина: кадастровый номер должен быть не более 20 символов.')
-            return
-
-        if is_empty(name_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы не может быть пустым.')
-            return
-        if not contains_only_cor_text(name_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы содержит некорректные символы.')
-            return
-        if not has_correct_length(name_of_work, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы должен быть длиной не более 50 символов.')
-
-        if is_empty(date_start):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен дата начала ремонтных работ.')
-            return
-        if not is_cor_date(date_start):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата начала ремонтных работ.')
-            return
-
-        if is_empty(date_end):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен дата окончания ремонтных работ.')
-            return
-        if not is_cor_date(date_end):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата окончания ремонтных работ.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('current_repair', {
+            'cod_rep_work': cod_rep_work, 'inn_org': inn_org, 'cod_num_hom': cod_num_hom,
+            'name_of_work': name_of_work, 'date_start': date_start, 'date_end': date_end})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            cursor.execute("SELECT * FROM public.current_repair WHERE cod_rep_work = %s AND inn_org = %s AND cod_num_hom = %s",
-                           (cod_rep_work, inn_org, cod_num_hom))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Текущий ремонт с этим UID уже существует')
+            # Внешние ссылки сначала проверяем по кешу справочников
+            error_text = self.check_references(cod_rep_work, inn_org, cod_num_hom)
+            if error_text is not None:
+                QMessageBox.warning(self, 'Ошибка', error_text)
                 return
 
-            cursor.execute("SELECT * FROM public.apartment WHERE cod_num_hom = %s", (cod_num_hom,))
-            if cursor.fetchone() is None:
-                QMessageBox.warning(self, 'Ошибка', 'МКД с этим кадастровым номером нет в базе данных')
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end))
+                dialog.close()
                 return
 
-            cursor.execute("SELECT * FROM public.repair_work WHERE cod_rep_work = %s", (cod_rep_work,))
-            if cursor.fetchone() is None:
-                QMessageBox.warning(self, 'Ошибка', 'Ремонтной работы с этим кодом нет в базе данных')
-                return
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            cursor.execute("SELECT * FROM public.builder WHERE inn_org = %s", (inn_org,))
-            if cursor.fetchone() is None:
-                QMessageBox.warning(self, 'Ошибка', 'Строительной организации с таким ИНН нет в базе данных')
-                return
+                # Проверка ключа, внешних ссылок и вставка выполняются одним атомарным запросом.
+                # FOR KEY SHARE не дает удалить найденные дом, работу и организацию до конца
+                # транзакции, а ON CONFLICT защищает от одновременной вставки того же ремонта
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    WITH apartment AS (
+                        SELECT 1 FROM public.apartment WHERE cod_num_hom = %(cod_num_hom)s FOR KEY SHARE
+                    ), repair_work AS (
+                        SELECT 1 FROM public.repair_work WHERE cod_rep_work = %(cod_rep_work)s FOR KEY SHARE
+                    ), builder AS (
+                        SELECT 1 FROM public.builder WHERE inn_org = %(inn_org)s FOR KEY SHARE
+                    ), checks AS (
+                        SELECT EXISTS (SELECT 1 FROM public.current_repair
+                                       WHERE cod_rep_work = %(cod_rep_work)s AND inn_org = %(inn_org)s
+                                         AND cod_num_hom = %(cod_num_hom)s) AS repair_exists,
+                               EXISTS (SELECT 1 FROM apartment) AS apartment_exists,
+                               EXISTS (SELECT 1 FROM repair_work) AS repair_work_exists,
+                               EXISTS (SELECT 1 FROM builder) AS builder_exists
+                    ), inserted AS (
+                        INSERT INTO public.current_repair (cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end)
+                        SELECT %(cod_rep_work)s, %(inn_org)s, %(cod_num_hom)s, %(name_of_work)s, %(date_start)s, %(date_end)s
+                        FROM checks
+                        WHERE NOT repair_exists AND apartment_exists AND repair_work_exists AND builder_exists
+                        ON CONFLICT DO NOTHING
+                        RETURNING *
+                    )
+                    SELECT checks.*, inserted.* FROM checks LEFT JOIN inserted ON true
+                """, {'cod_rep_work': cod_rep_work, 'inn_org': inn_org, 'cod_num_hom': cod_num_hom,
+                      'name_of_work': name_of_work, 'date_start': date_start, 'date_end': date_end})
+                result = cursor.fetchone()
+                row = result[4:] if result[4] is not None else None
 
-            # Выполняем SQL-запрос для добавления записи
-            cursor.execute("""
-                INSERT INTO public.current_repair (cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end))
+                connection.commit()
+                cursor.close()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+            if row is None:
+                # Кеш мог устареть: следующая проверка возьмет эти ключи из базы
+                reference_cache.invalidate('apartment', cod_num_hom)
+                reference_cache.invalidate('repair_work', cod_rep_work)
+                reference_cache.invalidate('builder', inn_org)
+                QMessageBox.warning(self, 'Ошибка', self.check_error(result))
+                return
 
-            # Обновляем данные в таблице
-            self.refresh_data()
+            # Добавляем в таблицу только новую строку
+            self.model.insert_row(row)
 
             # Закрываем окно добавления записи
             dialog.close()
@@ -226,51 +249,59 @@ class CurrentRepairWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи в базу данных:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        cod_rep_work = self.table.item(selected_row, 0).text()
-        inn_org = self.table.item(selected_row, 1).text()
-        cod_num_hom = self.table.item(selected_row, 2).text()
+        # Ключ текущего ремонта составной: код работы, ИНН организации, кадастровый номер МКД
+        keys = [(self.model.text(selected_row, 0), self.model.text(selected_row, 1), self.model.text(selected_row, 2))
+                for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с кодом работы {keys[0][0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение',
-                                     f'Вы уверены, что хотите удалить запись с кодом работы {cod_rep_work}?',
+        reply = QMessageBox.question(self, 'Подтверждение', question,
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute(
-                    "DELETE FROM public.current_repair WHERE cod_rep_work = %s AND inn_org = %s AND cod_num_hom = %s",
-                    (cod_rep_work, inn_org, cod_num_hom))
-                connection.commit()
-                cursor.close()
-                connection.close()
-
-                # Обновляем данные в таблице
-                self.refresh_data()
-
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(
+                        origin_sql(self.live_updates.origin)
+                        + "DELETE FROM public.current_repair WHERE (cod_rep_work, inn_org, cod_num_hom) IN %s",
+                        (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows(keys)
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи из базы данных:\n{str(error)}')
 
     def edit_record(self):
         # Получаем выбранную строку
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
         # Получаем данные выбранной строки
-        cod_rep_work = self.table.item(selected_row, 0).text()
-        inn_org = self.table.item(selected_row, 1).text()
-        cod_num_hom = self.table.item(selected_row, 2).text()
-        name_of_work = self.table.item(selected_row, 3).text()
-        date_start = self.table.item(selected_row, 4).text()
-        date_end = self.table.item(selected_row, 5).text()
+        cod_rep_work = self.model.text(selected_row, 0)
+        inn_org = self.model.text(selected_row, 1)
+        cod_num_hom = self.model.text(selected_row, 2)
+        name_of_work = self.model.text(selected_row, 3)
+        date_start = self.model.text(selected_row, 4)
+        date_end = self.model.text(selected_row, 5)
 
         # Окно для редактирования записи
         dialog = QDialog(self)
@@ -329,45 +360,44 @@ class CurrentRepairWindow(QWidget):
         dialog.exec()
 
     def update_record(self, cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end, dialog):
-        if is_empty(name_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы не может быть пустым.')
-            return
-        if not contains_only_cor_text(name_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы содержит некорректные символы.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('current_repair', {
+            'name_of_work': name_of_work, 'date_start': date_start, 'date_end': date_end})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
-        if not has_correct_length(name_of_work, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Наименование работы должен быть длиной не более 50 символов.')
 
-        if is_empty(date_start):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен дата начала ремонтных работ.')
-            return
-        if not is_cor_date(date_start):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата начала ремонтных работ.')
-            return
-
-        if is_empty(date_end):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен дата окончания ремонтных работ.')
-            return
-        if not is_cor_date(date_end):
-            QMessageBox.warning(self, 'Ошибка', 'Некорректная дата окончания ремонтных работ.')
-            return
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((cod_rep_work, inn_org, cod_num_hom, name_of_work, date_start, date_end))
+                dialog.close()
+                return
 
-            # Выполняем SQL-запрос для изменения записи
-            cursor.execute("""
-                UPDATE public.current_repair
-                SET  name_of_work = %s, date_start = %s, date_end = %s
-                WHERE cod_rep_work = %s AND inn_org = %s AND cod_num_hom = %s
-            """, (name_of_work, date_start, date_end, cod_rep_work, inn_org, cod_num_hom))
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                # Выполняем SQL-запрос для изменения записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    UPDATE public.current_repair
+                    SET  name_of_work = %s, date_start = %s, date_end = %s
+                    WHERE cod_rep_work = %s AND inn_org = %s AND cod_num_hom = %s
+                    RETURNING *
+                """, (name_of_work, date_start, date_end, cod_rep_work, inn_org, cod_num_hom))
+                row = cursor.fetchone()
 
-            # Обновляем данные в таблице
-            self.refresh_data()
+                connection.commit()
+                cursor.close()
+
+            if row is None:
+                # Строку удалили после загрузки таблицы
+                self.model.remove_rows([(cod_rep_work, inn_org, cod_num_hom)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
+
+            # Обновляем в таблице только измененную строку
+            self.model.update_row(row)
 
             # Закрываем окно редактирования записи
             dialog.close()
@@ -376,3 +406,30 @@ class CurrentRepairWindow(QWidget):
 
         except (Exception, psycopg2.Error) as error:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при изменении записи в базе данных:\n{str(error)}')
+
+    @staticmethod
+    def check_error(result):
+        # Текст ошибки по флагам проверок из запроса добавления текущего ремонта
+        repair_exists, apartment_exists, repair_work_exists, builder_exists = result[:4]
+        if repair_exists:
+            return 'Текущий ремонт с этим UID уже существует'
+        if not apartment_exists:
+            return 'МКД с этим кадастровым номером нет в базе данных'
+        if not repair_work_exists:
+            return 'Ремонтной работы с этим кодом нет в базе данных'
+        if not builder_exists:
+            return 'Строительной организации с таким ИНН нет в базе данных'
+        # Все проверки пройдены, но строку успел добавить другой оператор (ON CONFLICT)
+        return 'Текущий ремонт с этим UID уже существует'
+
+    @staticmethod
+    def check_references(cod_rep_work, inn_org, cod_num_hom):
+        # Проверка по кешу справочников, если их ключи уже загружены: в базу идем, только если
+        # ключа нет в кеше. Пока кеш не загружен, проверку выполнит запрос записи по своим флагам
+        checks = (('apartment', cod_num_hom, 'МКД с этим кадастровым номером нет в базе данных'),
+                  ('repair_work', cod_rep_work, 'Ремонтной работы с этим кодом нет в базе данных'),
+                  ('builder', inn_org, 'Строительной организации с таким ИНН нет в базе данных'))
+        for table, key, error_text in checks:
+            if reference_cache.loaded(table) and not reference_cache.contains(table, key):
+                return error_text
+        return None
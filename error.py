@@ -1,16 +1,35 @@
+import operator
 import re
-from datetime import datetime
+from collections.abc import Mapping, Sequence
+from datetime import date, datetime
+from itertools import compress
+
+# pyarrow и numpy нужны только для проверки столбцов целиком и загружаются при первой такой
+# проверке (_load_vector_modules): их импорт занимает заметную часть запуска приложения
+pa = None
+pc = None
+np = None
+_vector_modules_loaded = False
+
+# Шаблоны компилируются один раз при загрузке модуля
+_NUMB_RE = re.compile(r'^\d+$')
+_DOUBLE_RE = re.compile(r'^-?\d+(\.\d+)?$')
+_BAD_TEXT_RE = re.compile(r'[!@#\$%\^&\*\(\)_\+=\[\]{};:"\\|<>\?/~]')
+_COD_RE = re.compile(r'^[0-9:]+$')
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# Для разбора даты без strptime; fullmatch, как и strptime, не допускает перевода строки в конце
+_DATE_PARTS_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
 
 
 def contains_only_numb(text, double=None):
     if double is not None:
-        return re.match(r'^-?\d+(\.\d+)?$', text) is not None
+        return _DOUBLE_RE.match(text) is not None
     else:
-        return re.match(r'^\d+$', text) is not None
+        return _NUMB_RE.match(text) is not None
 
 
 def contains_only_cor_text(text):
-    return not re.search(r'[!@#\$%\^&\*\(\)_\+=\[\]{};:"\\|<>\?/~]', text) is not None
+    return not _BAD_TEXT_RE.search(text) is not None
 
 
 def is_empty(text):
@@ -26,12 +45,12 @@ def has_correct_length( text, length, type=None):
 
 
 def correct_cod_aprtmt(cod):
-    return re.match(r'^[0-9:]+$', cod) is not None
+    return _COD_RE.match(cod) is not None
 
 
 def is_cor_date(date_text):
     # Проверяем формат "ГГГГ-ММ-ДД"
-    if not re.match(r"^\d{4}-\d{2}-\d{2}$", date_text):
+    if not _DATE_RE.match(date_text):
         return False
 
     # Теперь проверяем, соответствует ли дата реальной дате
@@ -40,4 +59,624 @@ def is_cor_date(date_text):
     except ValueError:
         return False  # Если не удалось преобразовать в реальную дату, значит дата недействительна
 
-    return True
\ No newline at end of file
+    return True
+
+
+# Декларативная проверка записей. Для каждого столбца таблицы задается вид значения,
+# ограничение длины и тексты ошибок; правила поля собираются в одну функцию check(value).
+
+# Виды значений столбцов
+ANY = 'any'
+NUMB = 'numb'
+DOUBLE = 'double'
+TEXT = 'text'
+COD = 'cod'
+DATE = 'date'
+
+
+def _is_date(text):
+    # То же, что is_cor_date, но без strptime: день и месяц проверяет конструктор date
+    match = _DATE_PARTS_RE.fullmatch(text)
+    if match is None:
+        return False
+    try:
+        date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return False
+    return True
+
+
+def _is_cor_text(text):
+    return _BAD_TEXT_RE.search(text) is None
+
+
+# Функция проверки формата для каждого вида значения (None - формат не проверяется)
+_FORMAT_CHECKS = {
+    ANY: None,
+    NUMB: _NUMB_RE.match,
+    DOUBLE: _DOUBLE_RE.match,
+    TEXT: _is_cor_text,
+    COD: _COD_RE.match,
+    DATE: _is_date,
+}
+
+
+# Разделитель значений при проверке строки целиком одним шаблоном
+_ROW_SEPARATOR = '\x00'
+
+# Один символ значения каждого вида в шаблоне строки целиком (разделитель в значениях не допускается)
+_ROW_CHAR_CLASSES = {
+    ANY: r'[^\x00]',
+    NUMB: r'\d',
+    TEXT: r'[^!@#\$%\^&\*\(\)_\+=\[\]{};:"\\|<>\?/~\x00]',
+    COD: r'[0-9:]',
+}
+
+
+# Коды ошибок при проверке столбца целиком
+COLUMN_OK = 0
+COLUMN_EMPTY = 1
+COLUMN_FORMAT = 2
+COLUMN_LENGTH = 3
+
+
+class Field:
+    # Правила одного столбца. length - наибольшая длина (или точная при exact=True).
+    # empty, invalid, too_long - тексты ошибок для пустого значения, неверного формата и длины
+    def __init__(self, name, kind, length=None, exact=False, empty=None, invalid=None, too_long=None):
+        self.name = name
+        self.kind = kind
+        self.length = length
+        self.exact = exact
+        self.empty = empty
+        self.invalid = invalid
+        self.too_long = too_long
+        self.check = self._compile()
+        # Шаблон одного значения целиком, для проверки столбца (см. check_column)
+        self.pattern = re.compile(self.row_pattern())
+
+    def message(self, code):
+        # Текст ошибки по коду из check_column
+        return {COLUMN_EMPTY: self.empty, COLUMN_FORMAT: self.invalid, COLUMN_LENGTH: self.too_long}.get(code)
+
+    def error_code(self, value):
+        if not value:
+            return COLUMN_EMPTY
+        valid = _FORMAT_CHECKS[self.kind]
+        if valid is not None and not valid(value):
+            return COLUMN_FORMAT
+        if self.length is not None and (len(value) != self.length if self.exact else len(value) > self.length):
+            return COLUMN_LENGTH
+        return COLUMN_OK
+
+    def row_pattern(self):
+        # Часть шаблона строки целиком. Шаблон принимает только верные значения, но может
+        # отвергнуть верное (например, с разделителем) - тогда значение проверит check()
+        if self.kind == DATE:
+            return r'(\d{4})-(\d{2})-(\d{2})'
+        if self.kind == DOUBLE:
+            pattern = r'-?\d+(?:\.\d+)?'
+            if self.length is not None:
+                count = f'{{{self.length}}}' if self.exact else f'{{1,{self.length}}}'
+                pattern = rf'(?=[^\x00]{count}(?:\x00|\Z)){pattern}'
+            return pattern
+        if self.length is None:
+            count = '+'
+        else:
+            count = f'{{{self.length}}}' if self.exact else f'{{1,{self.length}}}'
+        return _ROW_CHAR_CLASSES[self.kind] + count
+
+    def _compile(self):
+        # Возвращает функцию, которая по значению дает текст первой ошибки или None
+        valid = _FORMAT_CHECKS[self.kind]
+        length, exact = self.length, self.exact
+        empty, invalid, too_long = self.empty, self.invalid, self.too_long
+
+        if length is None:
+            def check(value):
+                if not value:
+                    return empty
+                if valid is not None and not valid(value):
+                    return invalid
+                return None
+        elif exact:
+            def check(value):
+                if not value:
+                    return empty
+                if valid is not None and not valid(value):
+                    return invalid
+                if len(value) != length:
+                    return too_long
+                return None
+        else:
+            def check(value):
+                if not value:
+                    return empty
+                if valid is not None and not valid(value):
+                    return invalid
+                if len(value) > length:
+                    return too_long
+                return None
+        return check
+
+
+# Правила столбцов каждой таблицы в порядке столбцов таблицы
+TABLE_SPECS = {
+    'apartment': (
+        Field('cod_num_hom', COD, 20,
+              empty='Не введен кадастровый номер номера дома.',
+              invalid='Кадастровый номер должен содержать только цифры и :.',
+              too_long='Неверная длина: кадастровый номер должен быть не более 20 символов.'),
+        Field('adress', TEXT, 125,
+              empty='Не введен адрес.',
+              invalid='Адрес содержит недопустимые символы.',
+              too_long='Адрес слишком длинный.'),
+        Field('year', DATE,
+              empty='Не введен год постройки.',
+              invalid='Некорректная дата.'),
+        Field('num_of_flrs', NUMB, 4,
+              empty='Не введена этажность.',
+              invalid='Этажность должна содержать только цифры.',
+              too_long='Слишком большое количество этажей.'),
+        Field('num_of_flts', NUMB, 5,
+              empty='Не введено количество квартир.',
+              invalid='Количество квартир должно содержать только цифры.',
+              too_long='Слишком большое количество квартир.'),
+        Field('square', DOUBLE, 8,
+              empty='Не введена площадь.',
+              invalid='Площадь должна содержать только цифры.',
+              too_long='Слишком большая площадь.'),
+    ),
+    'flat': (
+        Field('cod_flt', COD, 20,
+              empty='Не введен кадастровый номер номера квартиры.',
+              invalid='Кадастровый номер должен содержать только цифры и :.',
+              too_long='Неверная длина: кадастровый номер должен быть не более 20 символов.'),
+        Field('owner_uid', NUMB, 10, exact=True,
+              empty='Id владельца не может быть пустым.',
+              invalid='Id владельца должен состоять только из цифр.',
+              too_long='Id владельца должен состоять из 10 цифр.'),
+        Field('aprtmt_uid', COD, 20,
+              empty='Код многоквартирного дома не может быть пустым.',
+              invalid='Код многоквартирного дома должен состоять из цифр и :.',
+              too_long='Код многоквартирного дома может состоять не более чем из 20 символов.'),
+        Field('nom_flt', NUMB, 5,
+              empty='Номер квартиры не может быть пустым.',
+              invalid='Номер квартиры должен быть числом.',
+              too_long='Номер квартиры слишком большой.'),
+        Field('floor_flt', NUMB, 5,
+              empty='Номер этажа не может быть пустым.',
+              invalid='Номер этажа должен быть числом.',
+              too_long='Номер этажа слишком большой.'),
+        Field('square_flt', DOUBLE, 7,
+              empty='Площадь квартиры не может не иметь значения.',
+              invalid='Площадь квартиры должна быть числом.',
+              too_long='Площадь квартиры слишком большая.'),
+    ),
+    'owner': (
+        Field('uid', NUMB, 10, exact=True,
+              empty='Не введен UID.',
+              invalid='UID должен содержать только цифры.',
+              too_long='UID должно содержать 10 символов.'),
+        Field('fio', TEXT, 50,
+              empty='Не введено ФИО.',
+              invalid='ФИО содержит некорректные символы.',
+              too_long='Слишком длинное ФИО.'),
+        Field('ph_numb', NUMB, 11, exact=True,
+              empty='Не введен номер телефона.',
+              invalid='Номер телефона должен содержать только цифры.',
+              too_long='Неверная длина номера телефона.'),
+    ),
+    'builder': (
+        Field('inn_org', NUMB, 12, exact=True,
+              empty='Не введён INN организации.',
+              invalid='Некорректные символы: INN должен состоять только из цифр.',
+              too_long='Неверная длина: INN должен состоять из 12 цифр.'),
+        Field('name_of_org', TEXT, 50,
+              empty='Не введено название организации.',
+              invalid='Некорректные символы: название организации содержит некорректные символы.',
+              too_long='Неверная длина: название организации не должно быть длиннее 50 симоволов.'),
+        Field('ph_numb', NUMB, 11, exact=True,
+              empty='Не введён номер телефона.',
+              invalid='Некорректные символы: телефон должен состоять только из цифр.',
+              too_long='Неверная длина: телефон должен состоять из 11 цифр.'),
+        Field('adress', TEXT, 125,
+              empty='Не введён адрес.',
+              invalid='Некорректные символы: адрес содержит некорректные символы.',
+              too_long='Неверная длина: адрес не должно быть длиннее 125 симоволов.'),
+    ),
+    'repair_work': (
+        Field('cod_rep_work', NUMB, 12, exact=True,
+              empty='Код работы не может быть пустым.',
+              invalid='Код работы должен содержать только цифры.',
+              too_long='Код работы должен быть длиной 12 символов.'),
+        Field('type_of_work', TEXT, 50,
+              empty='Тип работы не может быть пустым.',
+              invalid='Тип работы содержит некорректные символы.',
+              too_long='Тип работы должен быть длиной не более 50 символов.'),
+    ),
+    'current_repair': (
+        Field('cod_rep_work', NUMB, 12, exact=True,
+              empty='Код работы не может быть пустым.',
+              invalid='Код работы должен содержать только цифры.',
+              too_long='Код работы должен быть длиной 12 символов.'),
+        Field('inn_org', NUMB, 12, exact=True,
+              empty='Не введён INN организации.',
+              invalid='Некорректные символы: INN должен состоять только из цифр.',
+              too_long='Неверная длина: INN должен состоять из 12 цифр.'),
+        Field('cod_num_hom', COD, 20,
+              empty='Не введен кадастровый номер номера дома.',
+              invalid='Кадастровый номер должен содержать только цифры и :.',
+              too_long='Неверная длина: кадастровый номер должен быть не более 20 символов.'),
+        Field('name_of_work', TEXT, 50,
+              empty='Наименование работы не может быть пустым.',
+              invalid='Наименование работы содержит некорректные символы.',
+              too_long='Наименование работы должен быть длиной не более 50 символов.'),
+        Field('date_start', DATE,
+              empty='Не введен дата начала ремонтных работ.',
+              invalid='Некорректная дата начала ремонтных работ.'),
+        Field('date_end', DATE,
+              empty='Не введен дата окончания ремонтных работ.',
+              invalid='Некорректная дата окончания ремонтных работ.'),
+    ),
+}
+
+
+def _compile_row(fields):
+    # Шаблон всей строки и номера групп, в которых оказываются год/месяц/день столбцов-дат
+    parts = []
+    date_groups = []
+    for field in fields:
+        if field.kind == DATE:
+            date_groups.append(len(date_groups) * 3 + 1)
+        parts.append(field.row_pattern())
+    return re.compile(re.escape(_ROW_SEPARATOR).join(parts)), tuple(date_groups)
+
+
+_ROW_PATTERNS = {table: _compile_row(fields) for table, fields in TABLE_SPECS.items()}
+
+
+def validate_record(table, record):
+    # record - словарь {столбец: значение}; проверяются только переданные столбцы.
+    # Возвращает список всех ошибок (пустой, если запись верна)
+    errors = []
+    for field in TABLE_SPECS[table]:
+        if field.name in record:
+            message = field.check(record[field.name])
+            if message is not None:
+                errors.append(message)
+    return errors
+
+
+def validate_batch(table, rows):
+    # rows - последовательности значений в порядке столбцов таблицы.
+    # Возвращает [(номер строки в rows, [ошибки])] только для неверных строк
+    checks = [field.check for field in TABLE_SPECS[table]]
+    width = len(checks)
+    row_match = _ROW_PATTERNS[table][0].fullmatch
+    date_groups = _ROW_PATTERNS[table][1]
+    join = _ROW_SEPARATOR.join
+    invalid = []
+    for index, row in enumerate(rows):
+        if len(row) != width:
+            invalid.append((index, [f'Ожидалось столбцов: {width}, в строке: {len(row)}']))
+            continue
+        # Быстрый путь: верная строка проверяется одним совпадением шаблона
+        match = row_match(join(row))
+        if match is not None and (not date_groups or _dates_valid(match, date_groups)):
+            continue
+        # Подробная проверка по полям нужна только чтобы перечислить ошибки
+        errors = None
+        for check, value in zip(checks, row):
+            message = check(value)
+            if message is not None:
+                if errors is None:
+                    errors = []
+                errors.append(message)
+        if errors is not None:
+            invalid.append((index, errors))
+    return invalid
+
+
+def _dates_valid(match, date_groups):
+    try:
+        for group in date_groups:
+            date(int(match.group(group)), int(match.group(group + 1)), int(match.group(group + 2)))
+    except ValueError:
+        return False
+    return True
+
+
+# Проверка столбца целиком. Столбец - список строк, массив NumPy или массив Arrow.
+# Результат - маска верных значений и коды ошибок (COLUMN_*) того же вида, что и столбец:
+# для Arrow - массивы Arrow, для NumPy - массивы NumPy, иначе списки.
+# Массивы Arrow проверяются векторными функциями pyarrow (в RE2 \d - только ASCII-цифры, а $ не
+# допускает перевода строки в конце, поэтому это чуть строже проверки по одному значению).
+# Списки с NumPy проверяются как один массив кодов символов, результат совпадает с проверкой
+# по одному значению; без NumPy - шаблоном значения целиком через map(), а даты - по одному
+# разу на каждое различное значение.
+
+# Шаблоны формата в синтаксисе RE2 для pyarrow.compute
+_ARROW_PATTERNS = {
+    NUMB: r'^\d+$',
+    DOUBLE: r'^-?\d+(\.\d+)?$',
+    COD: r'^[0-9:]+$',
+    DATE: r'^\d{4}-\d{2}-\d{2}$',
+}
+_DAYS_IN_MONTH = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+# Сколько символов столбца проверять на NumPy за раз
+COLUMN_CHUNK = 262144
+# Разделитель значений, склеенных в одну строку для проверки на NumPy
+_COLUMN_SEPARATOR = '\x00'
+# Символы, недопустимые в тексте (_BAD_TEXT_RE)
+_BAD_TEXT_CHARS = '!@#$%^&*()_+=[]{};:"\\|<>?/~'
+# Позиции цифр в дате ГГГГ-ММ-ДД
+_DATE_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9]
+
+
+def _load_vector_modules():
+    global pa, pc, np, _vector_modules_loaded
+    if _vector_modules_loaded:
+        return
+    _vector_modules_loaded = True
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        # Без pyarrow проверка столбцов выполняется на чистом Python
+        pa = None
+        pc = None
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+
+def check_column(field, values):
+    _load_vector_modules()
+    if pa is not None and isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return _check_column_arrow(field, values)
+    if np is not None and isinstance(values, np.ndarray):
+        if pa is not None:
+            mask, codes = _check_column_arrow(field, pa.array(values, type=pa.string()))
+            return mask.to_numpy(zero_copy_only=False), codes.to_numpy(zero_copy_only=False)
+        return _check_column_numpy(field, values.tolist())
+    values = values if isinstance(values, list) else list(values)
+    if np is not None:
+        mask, codes = _check_column_numpy(field, values)
+        return mask.tolist(), codes.tolist()
+    return _check_column_python(field, values)
+
+
+def _check_column_python(field, values):
+    if field.kind == DATE:
+        # Дат в реестре немного различных: каждую проверяем один раз
+        valid = {value for value in set(values) if _is_date(value)}
+        mask = list(map(valid.__contains__, values))
+    else:
+        mask = list(map(bool, map(field.pattern.fullmatch, values)))
+    codes = [COLUMN_OK] * len(values)
+    # Коды ошибок считаются только для отвергнутых значений
+    for index in compress(range(len(values)), map(operator.not_, mask)):
+        code = field.error_code(values[index])
+        codes[index] = code
+        # Шаблон строже проверки по одному значению только для значений с разделителем
+        mask[index] = code == COLUMN_OK
+    return mask, codes
+
+
+def _check_column_numpy(field, values):
+    # Значения склеиваются через разделитель в одну строку и проверяются как массив кодов
+    # символов, частями около COLUMN_CHUNK символов: массивы части помещаются в кэш процессора
+    if not values:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int8)
+    text = _COLUMN_SEPARATOR.join(values)
+    is_ascii = text.isascii()
+    if is_ascii:
+        chars = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    else:
+        # Один код на символ: позиции в массиве совпадают с позициями в строке
+        chars = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    codes = []
+    start = 0
+    while start <= len(text):
+        end = text.find(_COLUMN_SEPARATOR, start + COLUMN_CHUNK)
+        end = len(text) if end == -1 else end
+        codes.append(_check_chunk_numpy(field, chars[start:end]))
+        start = end + 1
+    codes = np.concatenate(codes)
+    if len(codes) != len(values):
+        # Разделитель есть в самих значениях
+        mask, codes = _check_column_python(field, values)
+        return np.array(mask, dtype=bool), np.array(codes, dtype=np.int8)
+    if field.kind not in (ANY, TEXT) and (not is_ascii or '\n' in text):
+        # Цифры других алфавитов (\d в re) и перевод строки в конце ($) проверка по одному
+        # значению допускает: такие отвергнутые значения проверяются ею
+        separators = np.flatnonzero(chars == 0)
+        odd = np.flatnonzero((chars > 127) | (chars == 10))
+        for index in np.unique(np.searchsorted(separators, odd)).tolist():
+            if codes[index] != COLUMN_OK:
+                codes[index] = field.error_code(values[index])
+    return codes == COLUMN_OK, codes
+
+
+def _check_chunk_numpy(field, chars):
+    # Коды ошибок значений части. Символы вне основного класса вида (цифры, в коде дома еще
+    # двоеточие) находятся одним проходом; их мало, и дальше проверяются только они
+    kind = field.kind
+    # Вычитание в беззнаковом типе: коды меньше '0' становятся большими
+    if kind == COD:
+        other = chars - 48 > 10
+    elif kind in (NUMB, DOUBLE, DATE):
+        other = chars - 48 > 9
+    else:
+        other = chars == 0
+    special = np.flatnonzero(other)
+    special_chars = chars[special]
+    separators = special[special_chars == 0]
+    count = len(separators) + 1
+    starts = np.concatenate(([0], separators + 1))
+    lengths = np.concatenate((separators, [len(chars)])) - starts
+
+    valid = np.ones(count, dtype=bool)
+    if kind == DATE:
+        valid = _numpy_dates_valid(chars, starts, lengths)
+    elif kind != ANY:
+        if kind == TEXT:
+            table = np.zeros(128, dtype=bool)
+            table[[ord(char) for char in _BAD_TEXT_CHARS]] = True
+            bad = np.flatnonzero(table[chars & 127] & (chars < 128))
+        elif kind == DOUBLE:
+            bad = _numpy_double_errors(chars, other, special, special_chars)
+        else:
+            bad = special[special_chars != 0]
+        valid[np.searchsorted(separators, bad)] = False
+
+    codes = np.zeros(count, dtype=np.int8)
+    if field.length is not None:
+        codes[lengths != field.length if field.exact else lengths > field.length] = COLUMN_LENGTH
+    codes[~valid] = COLUMN_FORMAT
+    codes[lengths == 0] = COLUMN_EMPTY
+    return codes
+
+
+def _numpy_double_errors(chars, other, special, special_chars):
+    # Позиции ошибочных символов числа -?\d+(\.\d+)?: точка только между цифрами и одна,
+    # минус только первым и перед цифрой, других символов нет. other - маска не цифр
+    dot = chars == 46
+    minus = chars == 45
+    # У первого символа нет предыдущего, у последнего - следующего; разделитель тоже не цифра
+    before = np.concatenate(([True], other[:-1]))
+    after = np.concatenate((other[1:], [True]))
+    first = np.concatenate(([True], chars[:-1] == 0))
+    bad = other & ~(dot | minus | (chars == 0)) | dot & (before | after) | minus & (after | ~first)
+    # Вторая точка: между точками нет разделителя (а другие символы там уже ошибка)
+    dots = special_chars == 46
+    return np.concatenate((np.flatnonzero(bad), special[1:][dots[1:] & dots[:-1]]))
+
+
+def _numpy_dates_valid(chars, starts, lengths):
+    # ГГГГ-ММ-ДД и существующий день, как в _arrow_dates_valid
+    valid = np.zeros(len(starts), dtype=bool)
+    rows = np.flatnonzero(lengths == 10)
+    parts = chars[starts[rows, None] + np.arange(10)].astype(np.int32)
+    digits = parts[:, _DATE_DIGITS] - 48
+    shape = ((digits >= 0) & (digits <= 9)).all(axis=1) & (parts[:, 4] == 45) & (parts[:, 7] == 45)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    month_ok = (month >= 1) & (month <= 12)
+    days = np.array(_DAYS_IN_MONTH)[np.where(month_ok, month, 1)]
+    days += (month == 2) & ((year % 4 == 0) & (year % 100 != 0) | (year % 400 == 0))
+    valid[rows] = shape & month_ok & (year >= 1) & (day >= 1) & (day <= days)
+    return valid
+
+
+def _check_column_arrow(field, array):
+    array = pc.fill_null(array, '')
+    length = pc.utf8_length(array)
+    empty = pc.equal(length, 0)
+    if field.kind == DATE:
+        valid = _arrow_dates_valid(array)
+    elif field.kind == TEXT:
+        valid = pc.invert(pc.match_substring_regex(array, _BAD_TEXT_RE.pattern))
+    elif field.kind == ANY:
+        valid = pc.invert(empty)
+    else:
+        valid = pc.match_substring_regex(array, _ARROW_PATTERNS[field.kind])
+    if field.length is None:
+        length_ok = valid
+    elif field.exact:
+        length_ok = pc.equal(length, field.length)
+    else:
+        length_ok = pc.less_equal(length, field.length)
+
+    codes = pc.if_else(empty, COLUMN_EMPTY,
+                       pc.if_else(pc.invert(valid), COLUMN_FORMAT,
+                                  pc.if_else(pc.invert(length_ok), COLUMN_LENGTH, COLUMN_OK)))
+    codes = pc.cast(codes, pa.int8())
+    return pc.equal(codes, COLUMN_OK), codes
+
+
+def _arrow_dates_valid(array):
+    # ГГГГ-ММ-ДД и существующий день: год/месяц/день вырезаются и проверяются арифметикой
+    shape = pc.match_substring_regex(array, _ARROW_PATTERNS[DATE])
+    safe = pc.if_else(shape, array, '2000-01-01')
+    year = pc.cast(pc.utf8_slice_codeunits(safe, 0, 4), pa.int32())
+    month = pc.cast(pc.utf8_slice_codeunits(safe, 5, 7), pa.int32())
+    day = pc.cast(pc.utf8_slice_codeunits(safe, 8, 10), pa.int32())
+
+    month_ok = pc.and_(pc.greater_equal(month, 1), pc.less_equal(month, 12))
+    days = pc.take(pa.array(_DAYS_IN_MONTH, pa.int32()), pc.if_else(month_ok, month, 1))
+    leap = pc.or_(pc.and_(_arrow_divisible(year, 4), pc.invert(_arrow_divisible(year, 100))),
+                  _arrow_divisible(year, 400))
+    days = pc.add(days, pc.cast(pc.and_(pc.equal(month, 2), leap), pa.int32()))
+    return pc.and_(pc.and_(shape, month_ok),
+                   pc.and_(pc.greater_equal(year, 1),
+                           pc.and_(pc.greater_equal(day, 1), pc.less_equal(day, days))))
+
+
+def _arrow_divisible(values, divisor):
+    # В pyarrow.compute нет остатка от деления: целочисленное деление и умножение обратно
+    return pc.equal(pc.multiply(pc.divide(values, divisor), divisor), values)
+
+
+def contains_only_numb_column(values, double=None):
+    return check_column(_DOUBLE_FIELD if double is not None else _NUMB_FIELD, values)[0]
+
+
+def correct_cod_aprtmt_column(values):
+    return check_column(_COD_FIELD, values)[0]
+
+
+def is_cor_date_column(values):
+    return check_column(_DATE_FIELD, values)[0]
+
+
+def has_correct_length_column(values, length, type=None):
+    # Как has_correct_length: пустое значение длину не нарушает
+    _load_vector_modules()
+    if pa is not None and isinstance(values, (pa.Array, pa.ChunkedArray)):
+        lengths = pc.utf8_length(pc.fill_null(values, ''))
+        return pc.equal(lengths, length) if type is not None else pc.less_equal(lengths, length)
+    compare = length.__eq__ if type is not None else length.__ge__
+    mask = list(map(compare, map(len, values.tolist() if np is not None and isinstance(values, np.ndarray)
+                                 else values)))
+    return np.array(mask, dtype=bool) if np is not None and isinstance(values, np.ndarray) else mask
+
+
+def validate_columns(table, columns):
+    # columns - словарь {имя поля: столбец} или последовательность столбцов в порядке TABLE_SPECS.
+    # Возвращает маску верных строк и коды ошибок по каждому столбцу (чтобы получить тексты,
+    # см. Field.message)
+    fields = TABLE_SPECS[table]
+    if isinstance(columns, Mapping):
+        missing = [field.name for field in fields if field.name not in columns]
+        if missing:
+            raise ValueError(f'Нет столбцов: {", ".join(missing)}')
+        columns = [columns[field.name] for field in fields]
+    elif not isinstance(columns, Sequence) or isinstance(columns, (str, bytes)):
+        raise TypeError(f'Столбцы передаются словарем или последовательностью, а не {type(columns).__name__}')
+    if len(columns) != len(fields):
+        raise ValueError(f'Ожидалось столбцов: {len(fields)}, передано: {len(columns)}')
+    masks = []
+    codes = []
+    for field, column in zip(fields, columns):
+        mask, column_codes = check_column(field, column)
+        masks.append(mask)
+        codes.append(column_codes)
+    if pa is not None and isinstance(masks[0], (pa.Array, pa.ChunkedArray)):
+        row_mask = masks[0]
+        for mask in masks[1:]:
+            row_mask = pc.and_(row_mask, mask)
+    elif np is not None and isinstance(masks[0], np.ndarray):
+        row_mask = np.logical_and.reduce(masks)
+    else:
+        row_mask = list(map(all, zip(*masks)))
+    return row_mask, codes
+
+
+_NUMB_FIELD = Field('', NUMB)
+_DOUBLE_FIELD = Field('', DOUBLE)
+_COD_FIELD = Field('', COD)
+_DATE_FIELD = Field('', DATE)
@@ -0,0 +1,238 @@
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QHBoxLayout, QLineEdit, QPushButton, QWidget
+
+from connection import pooled_connection
+from error import ANY, COD, DATE, DOUBLE, NUMB, TABLE_SPECS, TEXT, contains_only_numb, is_cor_date
+
+# Через сколько мс после ввода в поле фильтра отправлять запрос
+FILTER_DELAY_MS = 400
+# Разделитель границ диапазона: "10..20", "2020-01-01..", "..100"
+RANGE_SEPARATOR = '..'
+
+FILTER_HELP = ('Текст - поиск подстроки (в кодах, числах и датах - по началу значения)\n'
+               'текст* - поиск по началу значения\n'
+               '=значение - точное совпадение\n'
+               'от..до, от.., ..до - диапазон')
+
+
+def _like_pattern(text):
+    # Символы % и _ в строке поиска ищутся как есть
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _check_value(field, text):
+    # Значения числовых столбцов и дат проверяются до запроса, иначе сервер вернет ошибку приведения типа
+    if field.kind in (NUMB, DOUBLE) and not contains_only_numb(text, True):
+        raise ValueError(f'Фильтр по столбцу {field.name}: "{text}" не является числом')
+    if field.kind == DATE and not is_cor_date(text):
+        raise ValueError(f'Фильтр по столбцу {field.name}: "{text}" не является датой в формате ГГГГ-ММ-ДД')
+
+
+# Виды условий фильтра (см. parse_filter)
+RANGE = 'range'
+EXACT = 'exact'
+PREFIX = 'prefix'
+SUBSTRING = 'substring'
+
+
+def is_numeric(field):
+    # Количества сравниваются как числа: в базе они могут храниться строками. Идентификаторы
+    # фиксированной длины (ИНН, UID) сравниваются как есть, чтобы не терять ведущие нули
+    return field.kind == DOUBLE or field.kind == NUMB and not field.exact
+
+
+def parse_filter(field, text):
+    # Разбор значения поля фильтра одного столбца: (вид условия, значения) или None, если поле
+    # пустое; ValueError с текстом для пользователя, если значение неверно.
+    # Для RANGE значения - (от, до), отсутствующая граница - None
+    text = text.strip()
+    if not text:
+        return None
+
+    if RANGE_SEPARATOR in text:
+        bounds = tuple(part.strip() or None for part in text.split(RANGE_SEPARATOR, 1))
+        if bounds == (None, None):
+            return None
+        for value in bounds:
+            if value is not None:
+                _check_value(field, value)
+        return RANGE, bounds
+
+    if text.startswith('='):
+        value = text[1:].strip()
+        _check_value(field, value)
+        return EXACT, (value,)
+
+    prefix = text.endswith('*')
+    text = text.rstrip('*')
+    if not text:
+        return None
+    # Коды, числа и даты ищутся по началу значения
+    if prefix or field.kind in (COD, NUMB, DOUBLE, DATE):
+        return PREFIX, (text,)
+    return SUBSTRING, (text,)
+
+
+def column_condition(field, text):
+    # Условие WHERE и параметры для значения поля фильтра одного столбца (None, если поле пустое)
+    parsed = parse_filter(field, text)
+    if parsed is None:
+        return None
+    mode, values = parsed
+    column = field.name
+    compared = f'{column}::numeric' if is_numeric(field) else column
+
+    if mode == RANGE:
+        conditions = []
+        params = []
+        for value, operator in zip(values, ('>=', '<=')):
+            if value is not None:
+                conditions.append(f'{compared} {operator} %s')
+                params.append(value)
+        return ' AND '.join(conditions), params
+    if mode == EXACT:
+        return f'{compared} = %s', [values[0]]
+    if mode == PREFIX:
+        if field.kind in (TEXT, ANY):
+            return f'{column} ILIKE %s', [_like_pattern(values[0]) + '%']
+        return f'{column}::text LIKE %s', [_like_pattern(values[0]) + '%']
+    return f'{column} ILIKE %s', ['%' + _like_pattern(values[0]) + '%']
+
+
+def build_filter(table, values):
+    # values - {столбец: текст поля фильтра}. Возвращает условие WHERE (пустая строка, если
+    # фильтр не задан) и список параметров
+    conditions = []
+    params = []
+    for field in TABLE_SPECS[table]:
+        condition = column_condition(field, values.get(field.name, ''))
+        if condition is not None:
+            conditions.append(condition[0])
+            params += condition[1]
+    return ' AND '.join(conditions), params
+
+
+def filtered_query(table, values):
+    condition, params = build_filter(table, values)
+    query = f"SELECT * FROM public.{table}"
+    if condition:
+        query += f" WHERE {condition}"
+    return query, params
+
+
+def filter_index_sql(table):
+    # Индексы под фильтры: триграммные (pg_trgm) для поиска подстроки в текстовых столбцах,
+    # text_pattern_ops для поиска по началу кодов и идентификаторов и по значению ::numeric
+    # для диапазонов количеств. Диапазоны дат используют индексы сортировки (paging.py)
+    statements = []
+    for field in TABLE_SPECS[table]:
+        if field.kind in (TEXT, ANY):
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{field.name}_trgm "
+                              f"ON public.{table} USING gin ({field.name} gin_trgm_ops)")
+        elif field.kind == COD or field.kind == NUMB and field.exact:
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{field.name}_prefix "
+                              f"ON public.{table} (({field.name}::text) text_pattern_ops)")
+        elif is_numeric(field):
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{field.name}_numeric "
+                              f"ON public.{table} (({field.name}::numeric))")
+    return statements
+
+
+def install_indexes(connection):
+    cursor = connection.cursor()
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in TABLE_SPECS:
+        for statement in filter_index_sql(table):
+            cursor.execute(statement)
+        cursor.execute(f"ANALYZE public.{table}")
+    connection.commit()
+    cursor.close()
+
+
+class FilterBar(QWidget):
+    # Строка полей фильтра над таблицей окна, по одному на столбец. Если таблица загружена
+    # целиком и не слишком велика, строки фильтруются сразу при вводе по индексу модели
+    # (local_index.py). Иначе фильтр выполняется на сервере: окно перечитывает таблицу
+    # запросом query() по сигналу changed
+    changed = pyqtSignal()
+
+    def __init__(self, table, model, parent=None):
+        super().__init__(parent)
+        self.table = table
+        self.model = model
+        model.enable_local_index(TABLE_SPECS[table])
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self._edits = {}
+        for column, field in enumerate(TABLE_SPECS[table]):
+            edit = QLineEdit()
+            edit.setPlaceholderText(model.headerData(column, Qt.Orientation.Horizontal))
+            edit.setToolTip(FILTER_HELP)
+            edit.setClearButtonEnabled(True)
+            edit.textChanged.connect(self._on_text_changed)
+            edit.returnPressed.connect(self._apply)
+            layout.addWidget(edit)
+            self._edits[field.name] = edit
+
+        btn_clear = QPushButton("Сбросить фильтр")
+        btn_clear.clicked.connect(self.clear)
+        layout.addWidget(btn_clear)
+
+        self.setLayout(layout)
+
+        # Запрос отправляется, когда пользователь перестал печатать
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FILTER_DELAY_MS)
+        self._timer.timeout.connect(self._apply)
+        self._applied = self.values()
+
+    def values(self):
+        return {column: edit.text() for column, edit in self._edits.items()}
+
+    def query(self):
+        # Запрос и параметры для загрузки таблицы с текущим фильтром; ValueError, если значение неверно
+        self._applied = self.values()
+        return filtered_query(self.table, self._applied)
+
+    def clear(self):
+        for edit in self._edits.values():
+            edit.blockSignals(True)
+            edit.clear()
+            edit.blockSignals(False)
+        self._apply()
+
+    def _local_available(self):
+        # Загружена вся таблица без фильтра на сервере
+        return self.model.local_filter_available() and not any(value.strip() for value in self._applied.values())
+
+    def _on_text_changed(self):
+        if self._local_available():
+            self._apply_local()
+        else:
+            self._timer.start()
+
+    def _apply(self):
+        self._timer.stop()
+        if self._local_available():
+            self._apply_local()
+        elif self.values() != self._applied:
+            self.changed.emit()
+
+    def _apply_local(self):
+        values = self.values()
+        try:
+            query, params = filtered_query(self.table, values)
+            self.model.set_local_filter(values, query, params)
+        except ValueError:
+            # Значение еще вводится (например, "10.." или "2020-0"): показанные строки не меняем
+            pass
+
+
+if __name__ == '__main__':
+    # Создание индексов для фильтров: python filters.py
+    with pooled_connection() as connection:
+        install_indexes(connection)
+    print('Индексы для фильтров созданы')
@@ -1,7 +1,16 @@
 import psycopg2
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QMessageBox, QDialog
-from connection import connect_to_database
-from error import (correct_cod_aprtmt, has_correct_length, is_empty, contains_only_numb)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QDialog
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 class FlatWindow(QWidget):
     def __init__(self):
@@ -14,11 +23,33 @@ class FlatWindow(QWidget):
         layout = QVBoxLayout()
 
         # Создаем таблицу для отображения данных
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)  # Изменяем количество столбцов
-        self.table.setHorizontalHeaderLabels(['Код квартиры', 'Id Владелеца', 'Код многоквартирного дома', 'Номер', 'Этаж', 'Площадь'])  # Изменяем заголовки столбцов
+        self.model = TableModel(['Код квартиры', 'Id Владелеца', 'Код многоквартирного дома', 'Номер', 'Этаж', 'Площадь'])
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('flat')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'flat', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('flat', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'flat', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопка для обновления данных в таблице
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -39,36 +70,50 @@ class FlatWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'flat', self.refresh_data))
+        layout.addWidget(btn_import)
+
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'flat', self.model))
+        layout.addWidget(btn_export)
+
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
+
         self.setLayout(layout)
 
-        # Обновляем данные при открытии окна
-        self.refresh_data()
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
     def refresh_data(self):
-        # Подключаемся к базе данных и получаем данные
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM public.flat")
-            rows = cursor.fetchall()
-
-            # Очищаем таблицу перед обновлением данных
-            self.table.setRowCount(0)
-
-            # Заполняем таблицу данными
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
 
-        except (Exception, psycopg2.Error) as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         # Окно для ввода новой записи
@@ -125,122 +170,72 @@ class FlatWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt, dialog):
-        if is_empty(cod_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен кадастровый номер номера квартиры.')
-            return
-        if not correct_cod_aprtmt(cod_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Кадастровый номер должен содержать только цифры и :.')
-            return
-        if not has_correct_length(cod_flt, 20):
-            QMessageBox.warning(self, 'Ошибка', 'Неверная длина: кадастровый номер должен быть не более 20 символов.')
-            return
-
-        if is_empty(owner_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца не может быть пустым.')
-            return
-        if not contains_only_numb(owner_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца должен состоять только из цифр.')
-            return
-        if not has_correct_length(owner_uid, 10, True):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца должен состоять из 10 цифр.')
-            return
-
-        if is_empty(aprtmt_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома не может быть пустым.')
-            return
-        if not correct_cod_aprtmt(aprtmt_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома должен состоять из цифр и :.')
-            return
-        if not has_correct_length(aprtmt_uid, 20):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома может состоять не более чем из 20 символов.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('flat', {
+            'cod_flt': cod_flt, 'owner_uid': owner_uid, 'aprtmt_uid': aprtmt_uid, 'nom_flt': nom_flt,
+            'floor_flt': floor_flt, 'square_flt': square_flt})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
-        if is_empty(nom_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры не может быть пустым.')
-            return
-        if not contains_only_numb(nom_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры должен быть числом.')
-            return
-        if not has_correct_length(nom_flt, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры слишком большой.')
-            return
-
-        if is_empty(floor_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа не может быть пустым.')
-            return
-        if not contains_only_numb(floor_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа должен быть числом.')
-            return
-        if not has_correct_length(floor_flt, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа слишком большой.')
-            return
-
-        if is_empty(square_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры не может не иметь значения.')
-            return
-        if not contains_only_numb(square_flt, True):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры должна быть числом.')
-            return
-        if not has_correct_length(square_flt, 7):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры слишком большая.')
-            return
         try:
-            # Подключаемся к базе данных
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            # Проверка уникальности UID
-            cursor.execute("SELECT * FROM public.flat WHERE cod_flt = %s AND owner_uid = %s AND aprtmt_uid = %s",
-                           (cod_flt, owner_uid, aprtmt_uid))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Квартира с этим UID уже существует')
-                return
-
-            cursor.execute("SELECT * FROM public.flat WHERE cod_flt = %s ", (cod_flt,))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Квартира с этим кадастровым номером уже есть в базе данных')
-                return
-
-            cursor.execute("SELECT * FROM public.owner WHERE uid = %s", (owner_uid,))
-            if cursor.fetchone() is None:
-                QMessageBox.warning(self, 'Ошибка', 'Владелеца квартиры с этим UID нет базе данных')
+            # Внешние ссылки и ограничения дома сначала проверяем по кешу справочников
+            error_text = self.check_references(owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt)
+            if error_text is not None:
+                QMessageBox.warning(self, 'Ошибка', error_text)
                 return
 
-            cursor.execute("SELECT * FROM public.apartment WHERE cod_num_hom = %s", (aprtmt_uid,))
-            apartment_record = cursor.fetchone()
-            if apartment_record is None:
-                QMessageBox.warning(self, 'Ошибка', 'МКД с этим кадастровым номером нет в базе данных')
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt))
+                dialog.close()
                 return
 
-            total_floors = apartment_record[3]
-            total_apartments = apartment_record[4]
-            total_square = apartment_record[5]
+            # Подключаемся к базе данных
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            if int(nom_flt) > int(total_apartments):
-                QMessageBox.warning(self, 'Ошибка', 'Номер квартиры превышает общее количество квартир в доме.')
-                return
+                # Проверки и вставка выполняются одним запросом: если хоть одна проверка
+                # не пройдена, строка не вставляется, а флаги показывают причину
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    WITH checks AS (
+                        SELECT EXISTS (SELECT 1 FROM public.flat
+                                       WHERE cod_flt = %(cod_flt)s AND owner_uid = %(owner_uid)s
+                                         AND aprtmt_uid = %(aprtmt_uid)s) AS same_flat,
+                               EXISTS (SELECT 1 FROM public.flat WHERE cod_flt = %(cod_flt)s) AS flat_exists,
+                               EXISTS (SELECT 1 FROM public.owner WHERE uid = %(owner_uid)s) AS owner_exists,
+                               a.cod_num_hom IS NOT NULL AS apartment_exists,
+                               a.num_of_flrs, a.num_of_flts, a.square
+                        FROM (SELECT 1) AS one
+                        LEFT JOIN public.apartment AS a ON a.cod_num_hom = %(aprtmt_uid)s
+                    ), inserted AS (
+                        INSERT INTO public.flat (cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt)
+                        SELECT %(cod_flt)s, %(owner_uid)s, %(aprtmt_uid)s, %(nom_flt)s, %(floor_flt)s, %(square_flt)s
+                        FROM checks
+                        WHERE NOT flat_exists AND owner_exists AND apartment_exists
+                          AND %(nom_flt)s::numeric <= num_of_flts::numeric
+                          AND %(floor_flt)s::numeric <= num_of_flrs::numeric
+                          AND %(square_flt)s::numeric <= square::numeric
+                        RETURNING *
+                    )
+                    SELECT checks.*, inserted.* FROM checks LEFT JOIN inserted ON true
+                """, {'cod_flt': cod_flt, 'owner_uid': owner_uid, 'aprtmt_uid': aprtmt_uid,
+                      'nom_flt': nom_flt, 'floor_flt': floor_flt, 'square_flt': square_flt})
+                result = cursor.fetchone()
+                row = result[7:] if result[7] is not None else None
 
-            if int(floor_flt) > int(total_floors):
-                QMessageBox.warning(self, 'Ошибка', 'Этаж превышает количество этажей в доме.')
-                return
+                connection.commit()
+                cursor.close()
 
-            if float(square_flt) > float(total_square):
-                QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры превышает площадь многоквартирного дома.')
+            if row is None:
+                # Кеш мог устареть: следующая проверка возьмет эти ключи из базы
+                reference_cache.invalidate('owner', owner_uid)
+                reference_cache.invalidate('apartment', aprtmt_uid)
+                QMessageBox.warning(self, 'Ошибка', self.check_error(result, nom_flt, floor_flt, square_flt))
                 return
 
-
-            # Выполняем SQL-запрос для добавления записи
-            cursor.execute("""
-                INSERT INTO public.flat (cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt))
-
-            connection.commit()
-            cursor.close()
-            connection.close()
-
-            # Обновляем данные в таблице
-            self.refresh_data()
+            # Добавляем в таблицу только новую строку
+            self.model.insert_row(row)
 
             # Закрываем окно добавления записи
             dialog.close()
@@ -251,47 +246,55 @@ class FlatWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи в базу данных:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        cod_flt = self.table.item(selected_row, 0).text()
+        keys = [self.model.text(selected_row, 0) for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с кодом {keys[0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение',
-                                     f'Вы уверены, что хотите удалить запись с кодом {cod_flt}?',
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        reply = QMessageBox.question(self, 'Подтверждение', question,
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM public.flat WHERE cod_flt = %s", (cod_flt,))
-                connection.commit()
-                cursor.close()
-                connection.close()
-
-                # Обновляем данные в таблице
-                self.refresh_data()
-
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(origin_sql(self.live_updates.origin) + "DELETE FROM public.flat WHERE cod_flt IN %s", (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows([(key,) for key in keys])
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи из базы данных:\n{str(error)}')
 
     def edit_record(self):
         # Получаем выбранную строку
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
         # Получаем данные выбранной строки
-        cod_flt = self.table.item(selected_row, 0).text()
-        owner_uid = self.table.item(selected_row, 1).text()
-        aprtmt_uid = self.table.item(selected_row, 2).text()
-        nom_flt = self.table.item(selected_row, 3).text()
-        floor_flt = self.table.item(selected_row, 4).text()
-        square_flt = self.table.item(selected_row, 5).text()
+        cod_flt = self.model.text(selected_row, 0)
+        owner_uid = self.model.text(selected_row, 1)
+        aprtmt_uid = self.model.text(selected_row, 2)
+        nom_flt = self.model.text(selected_row, 3)
+        floor_flt = self.model.text(selected_row, 4)
+        square_flt = self.model.text(selected_row, 5)
 
         # Окно для редактирования записи
         dialog = QDialog(self)
@@ -349,96 +352,76 @@ class FlatWindow(QWidget):
         dialog.exec()
 
     def update_record(self, cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt, dialog):
-        if is_empty(owner_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца не может быть пустым.')
-            return
-        if not contains_only_numb(owner_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца должен состоять только из цифр.')
-            return
-        if not has_correct_length(owner_uid, 10, True):
-            QMessageBox.warning(self, 'Ошибка', 'Id владельца должен состоять из 10 цифр.')
-            return
-
-        if is_empty(aprtmt_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома не может быть пустым.')
-            return
-        if not correct_cod_aprtmt(aprtmt_uid):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома должен состоять из цифр и :.')
-            return
-        if not has_correct_length(aprtmt_uid, 20):
-            QMessageBox.warning(self, 'Ошибка', 'Код многоквартирного дома может состоять не более чем из 20 символов.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('flat', {
+            'owner_uid': owner_uid, 'aprtmt_uid': aprtmt_uid, 'nom_flt': nom_flt, 'floor_flt': floor_flt,
+            'square_flt': square_flt})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
-        if is_empty(nom_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры не может быть пустым.')
-            return
-        if not contains_only_numb(nom_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры должен быть числом.')
-            return
-        if not has_correct_length(nom_flt, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Номер квартиры слишком большой.')
-            return
-
-        if is_empty(floor_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа не может быть пустым.')
-            return
-        if not contains_only_numb(floor_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа должен быть числом.')
-            return
-        if not has_correct_length(floor_flt, 5):
-            QMessageBox.warning(self, 'Ошибка', 'Номер этажа слишком большой.')
-            return
-
-        if is_empty(square_flt):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры не может не иметь значения.')
-            return
-        if not contains_only_numb(square_flt, True):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры должна быть числом.')
-            return
-        if not has_correct_length(square_flt, 7):
-            QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры слишком большая.')
-            return
         try:
-            # Подключаемся к базе данных
-            connection = connect_to_database()
-            cursor = connection.cursor()
+            # Внешние ссылки и ограничения дома сначала проверяем по кешу справочников
+            error_text = self.check_references(owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt)
+            if error_text is not None:
+                QMessageBox.warning(self, 'Ошибка', error_text)
+                return
 
-            cursor.execute("SELECT * FROM public.owner WHERE uid = %s", (owner_uid,))
-            if cursor.fetchone() is None:
-                QMessageBox.warning(self, 'Ошибка', 'Владелеца квартиры с этим UID нет базе данных')
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((cod_flt, owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt))
+                dialog.close()
                 return
 
-            cursor.execute("SELECT * FROM public.apartment WHERE cod_num_hom = %s", (aprtmt_uid,))
-            apartment_record = cursor.fetchone()
-            total_floors = apartment_record[3]
-            total_apartments = apartment_record[4]
-            total_square = apartment_record[5]
+            # Подключаемся к базе данных
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            if int(nom_flt) > int(total_apartments):
-                QMessageBox.warning(self, 'Ошибка', 'Номер квартиры превышает общее количество квартир в доме.')
-                return
+                # Проверки и изменение выполняются одним запросом, как и при добавлении
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    WITH checks AS (
+                        SELECT false AS same_flat, false AS flat_exists,
+                               EXISTS (SELECT 1 FROM public.owner WHERE uid = %(owner_uid)s) AS owner_exists,
+                               a.cod_num_hom IS NOT NULL AS apartment_exists,
+                               a.num_of_flrs, a.num_of_flts, a.square
+                        FROM (SELECT 1) AS one
+                        LEFT JOIN public.apartment AS a ON a.cod_num_hom = %(aprtmt_uid)s
+                    ), updated AS (
+                        UPDATE public.flat AS f
+                        SET owner_uid = %(owner_uid)s, aprtmt_uid = %(aprtmt_uid)s, nom_flt = %(nom_flt)s,
+                            floor_flt = %(floor_flt)s, square_flt = %(square_flt)s
+                        FROM checks
+                        WHERE f.cod_flt = %(cod_flt)s AND checks.owner_exists AND checks.apartment_exists
+                          AND %(nom_flt)s::numeric <= checks.num_of_flts::numeric
+                          AND %(floor_flt)s::numeric <= checks.num_of_flrs::numeric
+                          AND %(square_flt)s::numeric <= checks.square::numeric
+                        RETURNING f.*
+                    )
+                    SELECT checks.*, updated.* FROM checks LEFT JOIN updated ON true
+                """, {'cod_flt': cod_flt, 'owner_uid': owner_uid, 'aprtmt_uid': aprtmt_uid,
+                      'nom_flt': nom_flt, 'floor_flt': floor_flt, 'square_flt': square_flt})
+                result = cursor.fetchone()
+                row = result[7:] if result[7] is not None else None
 
-            if int(floor_flt) > int(total_floors):
-                QMessageBox.warning(self, 'Ошибка', 'Этаж превышает количество этажей в доме.')
-                return
+                connection.commit()
+                cursor.close()
 
-            if float(square_flt) > float(total_square):
-                QMessageBox.warning(self, 'Ошибка', 'Площадь квартиры превышает площадь многоквартирного дома.')
+            error_text = self.check_error(result, nom_flt, floor_flt, square_flt)
+            if error_text is not None:
+                reference_cache.invalidate('owner', owner_uid)
+                reference_cache.invalidate('apartment', aprtmt_uid)
+                QMessageBox.warning(self, 'Ошибка', error_text)
                 return
 
-            # Выполняем SQL-запрос для изменения записи
-            cursor.execute("""
-                UPDATE public.flat
-                SET owner_uid = %s, aprtmt_uid = %s, nom_flt = %s, floor_flt = %s, square_flt = %s
-                WHERE cod_flt = %s
-            """, (owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt, cod_flt))
-
-            connection.commit()
-            cursor.close()
-            connection.close()
+            if row is None:
+                # Проверки пройдены, но строки уже нет: ее удалили после загрузки таблицы
+                self.model.remove_rows([(cod_flt,)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
 
-            # Обновляем данные в таблице
-            self.refresh_data()
+            # Обновляем в таблице только измененную строку
+            self.model.update_row(row)
 
             # Закрываем окно редактирования записи
             dialog.close()
@@ -447,3 +430,41 @@ class FlatWindow(QWidget):
 
         except (Exception, psycopg2.Error) as error:
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при изменении записи в базе данных:\n{str(error)}')
+
+    @staticmethod
+    def check_error(result, nom_flt, floor_flt, square_flt):
+        # Текст ошибки по флагам проверок из запроса добавления/изменения квартиры
+        same_flat, flat_exists, owner_exists, apartment_exists, total_floors, total_apartments, total_square = result[:7]
+        if same_flat:
+            return 'Квартира с этим UID уже существует'
+        if flat_exists:
+            return 'Квартира с этим кадастровым номером уже есть в базе данных'
+        if not owner_exists:
+            return 'Владелеца квартиры с этим UID нет базе данных'
+        if not apartment_exists:
+            return 'МКД с этим кадастровым номером нет в базе данных'
+        return FlatWindow.check_limits((total_floors, total_apartments, total_square), nom_flt, floor_flt, square_flt)
+
+    @staticmethod
+    def check_references(owner_uid, aprtmt_uid, nom_flt, floor_flt, square_flt):
+        # Проверка по кешу справочников, если их ключи уже загружены: в базу идем, только если
+        # ключа нет в кеше. Пока кеш не загружен, проверку выполнит запрос записи по своим флагам
+        if reference_cache.loaded('owner') and not reference_cache.contains('owner', owner_uid):
+            return 'Владелеца квартиры с этим UID нет базе данных'
+        if not reference_cache.loaded('apartment'):
+            return None
+        limits = reference_cache.get('apartment', aprtmt_uid)
+        if limits is None:
+            return 'МКД с этим кадастровым номером нет в базе данных'
+        return FlatWindow.check_limits(limits, nom_flt, floor_flt, square_flt)
+
+    @staticmethod
+    def check_limits(limits, nom_flt, floor_flt, square_flt):
+        total_floors, total_apartments, total_square = limits
+        if int(nom_flt) > int(total_apartments):
+            return 'Номер квартиры превышает общее количество квартир в доме.'
+        if int(floor_flt) > int(total_floors):
+            return 'Этаж превышает количество этажей в доме.'
+        if float(square_flt) > float(total_square):
+            return 'Площадь квартиры превышает площадь многоквартирного дома.'
+        return None
@@ -0,0 +1,66 @@
+import collections
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from bulk_import import _print_progress, check_batch, import_csv
+from error import TABLE_SPECS
+
+# Число процессов проверки по умолчанию: по одному на ядро
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Сколько пачек на процесс может быть в работе одновременно. Это ограничивает память:
+# непроверенные и еще не записанные в базу пачки не копятся, пока COPY отстает от проверки
+CHUNKS_PER_WORKER = 2
+
+
+def parallel_checker(workers=None, chunks_in_flight=None):
+    # Проверка пачек для import_csv в нескольких процессах. Чтение файла и COPY остаются в
+    # основном процессе, а проверка и подготовка CSV для COPY (check_batch) идут в пуле процессов;
+    # результаты возвращаются в порядке пачек, поэтому номера строк и ошибки идут по порядку файла
+    workers = workers or DEFAULT_WORKERS
+    limit = chunks_in_flight or workers * CHUNKS_PER_WORKER
+
+    def check(table, batches):
+        return _check_parallel(table, batches, workers, limit)
+    return check
+
+
+def _check_parallel(table, batches, workers, limit):
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for batch in batches:
+            pending.append((len(batch), executor.submit(check_batch, table, batch)))
+            # Следующая пачка читается из файла, только когда освобождается место
+            if len(pending) >= limit:
+                size, future = pending.popleft()
+                yield (size,) + future.result()
+        while pending:
+            size, future = pending.popleft()
+            yield (size,) + future.result()
+    finally:
+        # При отмене или ошибке записи непроверенные пачки не нужны
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def import_csv_parallel(table, path, workers=None, **options):
+    # То же, что import_csv из bulk_import.py, но строки проверяются в workers процессах
+    return import_csv(table, path, checker=parallel_checker(workers), **options)
+
+
+if __name__ == '__main__':
+    # Загрузка без интерфейса: python import_pipeline.py <таблица> <файл.csv> [число процессов]
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in TABLE_SPECS:
+        print(f'Использование: python import_pipeline.py <{"|".join(TABLE_SPECS)}> <файл.csv> [процессов]')
+        sys.exit(2)
+    table_name, csv_path = sys.argv[1], sys.argv[2]
+    worker_count = int(sys.argv[3]) if len(sys.argv) == 4 else DEFAULT_WORKERS
+    import_result = import_csv_parallel(table_name, csv_path, workers=worker_count,
+                                        errors_path=csv_path + '.errors.csv', progress=_print_progress)
+    print(file=sys.stderr)
+    print(f'Процессов проверки: {worker_count}. Добавлено строк: {import_result.inserted}, '
+          f'отклонено: {import_result.rejected}, время: {import_result.elapsed:.1f} с '
+          f'({import_result.rows_per_sec():.0f} строк/с)')
+    if import_result.rejected:
+        print(f'Ошибки записаны в {csv_path}.errors.csv')
+    sys.exit(1 if import_result.rejected else 0)
@@ -0,0 +1,361 @@
+import bisect
+import math
+import re
+from itertools import compress, repeat
+from operator import contains, eq, itemgetter, le
+
+from error import ANY, TEXT
+from filters import PREFIX, RANGE, SUBSTRING, is_numeric, parse_filter
+
+# Слова текстовых значений, по которым строится индекс
+_WORD_RE = re.compile(r'\w+')
+# Если по индексу ожидается больше 1/SCAN_FRACTION всех строк, быстрее проверить значения подряд
+SCAN_FRACTION = 8
+# Меньше любой непустой строки: нижняя граница диапазона, не пропускающая пустые значения
+_LOWEST_TEXT = '\x00'
+
+# Значения по номерам строк хранятся списками, поэтому отбор строк выполняется функциями
+# itemgetter/map/compress без цикла на Python. Отсутствующее значение (NULL или удаленная
+# строка) - пустая строка или NaN: ни одно условие фильтра для них не выполняется.
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _pick(ids, values):
+    # Элементы списка values с номерами ids (номера по возрастанию или range всех строк).
+    # Номера различны, поэтому столько же номеров, сколько элементов, - это все элементы
+    if len(ids) == len(values):
+        return list(values)
+    if not ids:
+        return []
+    if len(ids) == 1:
+        return [values[ids[0]]]
+    return list(itemgetter(*ids)(values))
+
+
+def _in_range(ids, values, low, high):
+    # Номера из ids, для которых low <= значение <= high (None - без границы)
+    if low is not None:
+        flags = list(map(le, repeat(low), values))
+        ids = list(compress(ids, flags))
+        values = list(compress(values, flags))
+    if high is not None:
+        ids = compress(ids, map(le, values, repeat(high)))
+    return list(ids)
+
+
+class _TextColumn:
+    # Текстовый столбец: значения и они же в нижнем регистре, индекс слов (слово -> номера строк).
+    # Подстрока из одного слова находится среди различных слов столбца, которых намного меньше,
+    # чем строк; если совпадений много, значения проверяются подряд
+    def __init__(self):
+        self.texts = []
+        self.lowered = []
+        self._words = {}
+        self._sorted_words = None
+
+    def empty(self):
+        return _TextColumn()
+
+    def add(self, items, size):
+        if len(self.texts) < size:
+            self.texts.extend(repeat('', size - len(self.texts)))
+            self.lowered.extend(repeat('', size - len(self.lowered)))
+        words = self._words
+        find_words = _WORD_RE.findall
+        for row_id, value in items:
+            if value is None:
+                continue
+            text = str(value)
+            lowered = text.lower()
+            self.texts[row_id] = text
+            self.lowered[row_id] = lowered
+            for word in set(find_words(lowered)):
+                ids = words.get(word)
+                if ids is None:
+                    words[word] = {row_id}
+                    self._sorted_words = None
+                else:
+                    ids.add(row_id)
+
+    def remove(self, row_id):
+        for word in set(_WORD_RE.findall(self.lowered[row_id])):
+            ids = self._words[word]
+            ids.discard(row_id)
+            if not ids:
+                del self._words[word]
+                self._sorted_words = None
+        self.texts[row_id] = ''
+        self.lowered[row_id] = ''
+
+    def find(self, mode, values, all_ids):
+        # Номера подходящих строк по возрастанию, all_ids - номера всех строк
+        if mode in (PREFIX, SUBSTRING):
+            text = values[0].lower()
+            words = _WORD_RE.findall(text)
+            if words:
+                if mode == PREFIX:
+                    sets = self._sets_with_prefix(words[0])
+                else:
+                    # Кандидаты берутся по самому редкому из введенных слов
+                    sets = min(([ids for word, ids in self._words.items() if part in word] for part in set(words)),
+                               key=lambda found: sum(map(len, found)))
+                if sum(map(len, sets)) * SCAN_FRACTION < len(all_ids):
+                    candidates = sorted(set().union(*sets))
+                    # Подстрока из одного слова всегда лежит внутри одного слова значения
+                    if mode == SUBSTRING and words == [text]:
+                        return candidates
+                    return self.filter(mode, values, candidates)
+        return self.filter(mode, values, all_ids)
+
+    def filter(self, mode, values, ids):
+        # Номера из ids, значения которых подходят под условие
+        if mode == SUBSTRING:
+            return list(compress(ids, map(contains, _pick(ids, self.lowered), repeat(values[0].lower()))))
+        if mode == PREFIX:
+            return list(compress(ids, map(str.startswith, _pick(ids, self.lowered), repeat(values[0].lower()))))
+        low, high = values if mode == RANGE else (values[0], values[0])
+        return _in_range(ids, _pick(ids, self.texts), low or _LOWEST_TEXT, high)
+
+    def refines(self, mode, values, previous):
+        # Условие не шире предыдущего условия previous (вид, значения) того же столбца
+        if mode == previous[0] == SUBSTRING:
+            return previous[1][0].lower() in values[0].lower()
+        if mode == previous[0] == PREFIX:
+            return values[0].lower().startswith(previous[1][0].lower())
+        return (mode, values) == previous
+
+    def prepare(self):
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._words)
+
+    def _sets_with_prefix(self, prefix):
+        self.prepare()
+        words = self._sorted_words
+        sets = []
+        for position in range(bisect.bisect_left(words, prefix), len(words)):
+            if not words[position].startswith(prefix):
+                break
+            sets.append(self._words[words[position]])
+        return sets
+
+
+class _ValueColumn:
+    # Коды, идентификаторы, даты и числа: значения текстом (для чисел еще и числом) и
+    # отсортированные массивы значений для поиска по началу значения и диапазонов (даты
+    # ГГГГ-ММ-ДД упорядочены как строки). Массивы строятся заново после загрузки пачки строк
+    # (prepare или первый поиск), одиночные изменения вносятся в них на место.
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.texts = []
+        self.numbers = []
+        # имя списка значений -> (значения по возрастанию, номера строк)
+        self._sorted = {}
+
+    def empty(self):
+        return _ValueColumn(self.numeric)
+
+    def add(self, items, size):
+        if len(self.texts) < size:
+            self.texts.extend(repeat('', size - len(self.texts)))
+            self.numbers.extend(repeat(math.nan, size - len(self.numbers)))
+        for row_id, value in items:
+            if value is None:
+                continue
+            self.texts[row_id] = str(value)
+            if self.numeric:
+                self.numbers[row_id] = _to_number(value)
+        if len(items) == 1:
+            row_id = items[0][0]
+            for keys, ids, value in self._sorted_entries(row_id):
+                position = bisect.bisect_right(keys, value)
+                keys.insert(position, value)
+                ids.insert(position, row_id)
+        else:
+            self._sorted = {}
+
+    def remove(self, row_id):
+        for keys, ids, value in self._sorted_entries(row_id):
+            start = bisect.bisect_left(keys, value)
+            position = start + ids[start:bisect.bisect_right(keys, value)].index(row_id)
+            del keys[position]
+            del ids[position]
+        self.texts[row_id] = ''
+        self.numbers[row_id] = math.nan
+
+    def find(self, mode, values, all_ids):
+        if mode == PREFIX:
+            keys, ids = self._sorted_array('texts')
+            prefix = values[0]
+            start = bisect.bisect_left(keys, prefix)
+            # Все значения, начинающиеся с prefix, меньше prefix с увеличенным последним символом
+            end = bisect.bisect_left(keys, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        else:
+            keys, ids = self._sorted_array('numbers' if self.numeric else 'texts')
+            low, high = self._bounds(mode, values)
+            start = bisect.bisect_left(keys, low)
+            end = len(keys) if high is None else bisect.bisect_right(keys, high)
+        if (end - start) * SCAN_FRACTION < len(all_ids):
+            return sorted(ids[start:end])
+        return self.filter(mode, values, all_ids)
+
+    def filter(self, mode, values, ids):
+        if mode == PREFIX:
+            return list(compress(ids, map(str.startswith, _pick(ids, self.texts), repeat(values[0]))))
+        low, high = self._bounds(mode, values)
+        return _in_range(ids, _pick(ids, self.numbers if self.numeric else self.texts), low, high)
+
+    def refines(self, mode, values, previous):
+        if mode == previous[0] == PREFIX:
+            return values[0].startswith(previous[1][0])
+        return (mode, values) == previous
+
+    def _bounds(self, mode, values):
+        low, high = values if mode == RANGE else (values[0], values[0])
+        if self.numeric:
+            return (_to_number(low) if low is not None else -math.inf,
+                    _to_number(high) if high is not None else None)
+        return low or _LOWEST_TEXT, high
+
+    def prepare(self):
+        self._sorted_array('texts')
+        if self.numeric:
+            self._sorted_array('numbers')
+
+    def _sorted_array(self, name):
+        if name not in self._sorted:
+            values = getattr(self, name)
+            # Пустые строки и NaN (не равен сам себе) в массив не попадают
+            present = values if name == 'texts' else map(eq, values, values)
+            ids = sorted(compress(range(len(values)), present), key=values.__getitem__)
+            self._sorted[name] = (list(map(values.__getitem__, ids)), ids)
+        return self._sorted[name]
+
+    def _sorted_entries(self, row_id):
+        # (значения, номера, значение строки) для уже построенных массивов
+        for name, (keys, ids) in self._sorted.items():
+            value = getattr(self, name)[row_id]
+            if value == value and value != '':
+                yield keys, ids, value
+
+
+class LocalIndex:
+    # Индекс загруженных в окно строк для фильтра без запроса к серверу. Условия те же, что у
+    # фильтра на сервере (filters.py). Строки хранятся под постоянными номерами в порядке
+    # добавления, индекс обновляется при каждой вставке, изменении и удалении строки.
+    def __init__(self, fields, key_of):
+        self.fields = tuple(fields)
+        self.key_of = key_of
+        # номер -> строка (None для удаленной), в порядке добавления
+        self.rows = []
+        self._ids = {}
+        self._columns = [_TextColumn() if field.kind in (TEXT, ANY) else _ValueColumn(is_numeric(field))
+                         for field in self.fields]
+        # Последний поиск (условия, номера строк): следующий поиск, уточняющий его (например,
+        # введена еще одна буква), проверяет только уже найденные строки
+        self._last = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_rows(self, rows):
+        added = []
+        for row in rows:
+            key = self.key_of(row)
+            row_id = self._ids.get(key)
+            if row_id is not None:
+                self._set(row_id, row)
+                continue
+            row_id = len(self.rows)
+            self._ids[key] = row_id
+            self.rows.append(row)
+            added.append((row_id, row))
+        if added:
+            self._last = None
+            for position, column in enumerate(self._columns):
+                column.add([(row_id, row[position]) for row_id, row in added], len(self.rows))
+
+    def prepare(self):
+        # Строит отложенные части индекса, чтобы первый поиск после загрузки не ждал их
+        for column in self._columns:
+            column.prepare()
+
+    def update_row(self, row):
+        # Строка с тем же ключом сохраняет свое место
+        row_id = self._ids.get(self.key_of(row))
+        if row_id is None:
+            self.add_rows([row])
+        else:
+            self._set(row_id, row)
+
+    def remove_rows(self, keys):
+        for key in keys:
+            row_id = self._ids.pop(tuple(str(value) for value in key), None)
+            if row_id is None:
+                continue
+            self._last = None
+            self.rows[row_id] = None
+            for column in self._columns:
+                column.remove(row_id)
+
+    def _set(self, row_id, row):
+        self._last = None
+        self.rows[row_id] = row
+        for position, column in enumerate(self._columns):
+            column.remove(row_id)
+            column.add([(row_id, row[position])], len(self.rows))
+
+    def compile(self, values):
+        # Условия фильтра по значениям полей {столбец: текст}: [(номер столбца, вид, значения)].
+        # ValueError, если значение неверно
+        conditions = []
+        for position, field in enumerate(self.fields):
+            parsed = parse_filter(field, values.get(field.name, ''))
+            if parsed is not None:
+                conditions.append((position,) + parsed)
+        return conditions
+
+    def search(self, conditions):
+        # Строки, подходящие под все условия, в порядке добавления
+        if not conditions:
+            self._last = None
+            return list(filter(None, self.rows))
+        ids = None
+        remaining = conditions
+        if self._last is not None and self._refines(conditions, self._last[0]):
+            ids = self._last[1]
+            remaining = [condition for condition in conditions if condition not in self._last[0]]
+        for position, mode, values in remaining:
+            if ids is None:
+                ids = self._columns[position].find(mode, values, self._all_ids())
+            else:
+                ids = self._columns[position].filter(mode, values, ids)
+        self._last = (conditions, ids)
+        return _pick(ids, self.rows)
+
+    def matches(self, conditions, row):
+        # Подходит ли одна строка под условия (строка проверяется без индекса)
+        for position, mode, values in conditions:
+            column = self._columns[position].empty()
+            column.add([(0, row[position])], 1)
+            if not column.filter(mode, values, [0]):
+                return False
+        return True
+
+    def _all_ids(self):
+        if len(self._ids) == len(self.rows):
+            return range(len(self.rows))
+        return list(compress(range(len(self.rows)), self.rows))
+
+    def _refines(self, conditions, previous):
+        current = {position: (mode, values) for position, mode, values in conditions}
+        for position, mode, values in previous:
+            if position not in current or not self._columns[position].refines(*current[position],
+                                                                                (mode, values)):
+                return False
+        return True
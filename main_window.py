@@ -1,16 +1,30 @@
+import importlib
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QPushButton, QWidget
-from apartment_window import ApartmentWindow  # Здесь подключаем окна для каждой таблицы
-from flat_window import FlatWindow
-from owner_window import OwnerWindow
-from builder_window import BuilderWindow
-from repair_work_window import RepairWorkWindow
-from current_repair_window import CurrentRepairWindow
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication, QMainWindow, QMessageBox, QVBoxLayout, QPushButton, QWidget
+
+# Окна таблиц: текст кнопки, модуль и класс окна. Модуль окна (а с ним psycopg2 и остальные
+# зависимости) импортируется при первом открытии окна, а не при запуске приложения
+WINDOWS = [
+    ("Таблица многоквартирных домов", 'apartment_window', 'ApartmentWindow'),
+    ("Таблица квартир", 'flat_window', 'FlatWindow'),
+    ("Таблица владельцев квартир", 'owner_window', 'OwnerWindow'),
+    ("Таблица строительных организаций", 'builder_window', 'BuilderWindow'),
+    ("Таблица ремонтных работ", 'repair_work_window', 'RepairWorkWindow'),
+    ("Таблица текущих ремонтных работ", 'current_repair_window', 'CurrentRepairWindow'),
+]
+
+
+def window_class(module_name, class_name):
+    return getattr(importlib.import_module(module_name), class_name)
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Управление базой данных регионального оператора капитального ремонта")
+        # Открытые окна таблиц по имени модуля
+        self.windows = {}
         self.initUI()
         self.resize(1280, 720)
 
@@ -20,58 +34,45 @@ class MainWindow(QMainWindow):
 
         layout = QVBoxLayout()
 
-        # Кнопка для переключения на окно работы с таблицей apartment
-        btn_apartment = QPushButton("Таблица многоквартирных домов")
-        btn_apartment.clicked.connect(self.show_apartment_window)
-        layout.addWidget(btn_apartment)
-
-        btn_flat = QPushButton("Таблица квартир")
-        btn_flat.clicked.connect(self.show_flat_window)
-        layout.addWidget(btn_flat)
-
-        btn_owner = QPushButton("Таблица владельцев квартир")
-        btn_owner.clicked.connect(self.show_owner_window)
-        layout.addWidget(btn_owner)
-
-        btn_bldr = QPushButton("Таблица строительных организаций")
-        btn_bldr.clicked.connect(self.show_builder_window)
-        layout.addWidget(btn_bldr)
-
-        btn_repair_work = QPushButton("Таблица ремонтных работ")
-        btn_repair_work.clicked.connect(self.show_repair_work_window)
-        layout.addWidget(btn_repair_work)
-
-        btn_current_repair = QPushButton("Таблица текущих ремонтных работ")
-        btn_current_repair.clicked.connect(self.show_current_repair_window)
-        layout.addWidget(btn_current_repair)
+        # Кнопки для переключения на окна работы с таблицами
+        for title, module_name, class_name in WINDOWS:
+            button = QPushButton(title)
+            button.clicked.connect(lambda checked, module_name=module_name, class_name=class_name:
+                                   self.show_window(module_name, class_name))
+            layout.addWidget(button)
 
         self.central_widget.setLayout(layout)
 
-    def show_apartment_window(self):
-        self.apartment_window = ApartmentWindow()
-        self.apartment_window.show()
-
-    def show_flat_window(self):
-        self.flat_window = FlatWindow()
-        self.flat_window.show()
-
-    def show_owner_window(self):
-        self.owner_window = OwnerWindow()
-        self.owner_window.show()
-
-    def show_builder_window(self):
-        self.builder_window = BuilderWindow()
-        self.builder_window.show()
-
-    def show_repair_work_window(self):
-        self.repair_work_window = RepairWorkWindow()
-        self.repair_work_window.show()
-
-    def show_current_repair_window(self):
-        self.current_repair_work_window = CurrentRepairWindow()
-        self.current_repair_work_window.show()
-
-app = QApplication(sys.argv)
-main_window = MainWindow()
-main_window.show()
-sys.exit(app.exec())
+    def check_schema(self):
+        # Изменения схемы применяет администратор (python schema.py), а не каждый запуск
+        # приложения: построение индексов на заполненных таблицах долгое. Здесь только проверка
+        from schema import pending_migrations
+        from workers import BackgroundTask, start_task
+        self.schema_task = BackgroundTask(pending_migrations)
+        self.schema_task.signals.finished.connect(self.warn_pending_migrations)
+        start_task(self.schema_task)
+
+    def warn_pending_migrations(self, names):
+        if names:
+            QMessageBox.warning(self, 'Ошибка', 'Схема базы данных не обновлена (' + ', '.join(names) + ').\n'
+                                'Окна могут работать медленно или с ошибками. '
+                                'Обновите схему командой: python schema.py')
+
+    def show_window(self, module_name, class_name):
+        window = window_class(module_name, class_name)()
+        self.windows[module_name] = window
+        window.show()
+        return window
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    main_window = MainWindow()
+    main_window.show()
+    QTimer.singleShot(0, main_window.check_schema)
+    if '--watchdog' in sys.argv:
+        # Поиск зависаний интерфейса: стеки потока интерфейса во время зависаний пишутся в
+        # stall_watchdog.FOLDED_PATH
+        from stall_watchdog import start_watchdog
+        watchdog = start_watchdog(app)
+    sys.exit(app.exec())
@@ -0,0 +1,263 @@
+import itertools
+import json
+import select
+import threading
+import uuid
+
+import psycopg2
+from PyQt6.QtCore import QObject, QThread, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QApplication
+
+from connection import DB_PARAMS, pooled_connection
+from reference_cache import REFERENCE_TABLES, reference_cache
+from tables import TABLE_KEYS, key_filter
+from workers import BackgroundTask, start_task
+
+# Канал, в который триггеры отправляют уведомления об изменении строк
+CHANNEL = 'table_change'
+# Как часто (сек) поток-слушатель проверяет, не пора ли остановиться
+POLL_INTERVAL = 1.0
+# Пауза (сек) перед повторным подключением слушателя после обрыва
+RECONNECT_DELAY = 5.0
+# Сколько мс копить уведомления, прежде чем запросить измененные строки одним запросом
+PATCH_DELAY_MS = 200
+
+# Сеансовая настройка, отключающая построчные уведомления (массовая загрузка шлет одно общее)
+SKIP_NOTIFY_SETTING = 'reg_oper.skip_notify'
+# Настройка транзакции с меткой окна, сделавшего изменение (передается в уведомлении)
+ORIGIN_SETTING = 'reg_oper.origin'
+
+# Метки окон уникальны между рабочими местами: общая часть на процесс и номер окна
+_process_origin = uuid.uuid4().hex[:12]
+_origin_ids = itertools.count(1)
+
+# Триггерная функция: имена ключевых столбцов передаются ей аргументами триггера
+TRIGGER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION public.notify_table_change() RETURNS trigger AS $$
+DECLARE
+    new_key jsonb := '[]'::jsonb;
+    old_key jsonb := '[]'::jsonb;
+    i integer;
+BEGIN
+    IF current_setting('{SKIP_NOTIFY_SETTING}', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    FOR i IN 0 .. TG_NARGS - 1 LOOP
+        IF TG_OP <> 'DELETE' THEN
+            new_key := new_key || jsonb_build_array(to_jsonb(NEW) ->> TG_ARGV[i]);
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            old_key := old_key || jsonb_build_array(to_jsonb(OLD) ->> TG_ARGV[i]);
+        END IF;
+    END LOOP;
+    PERFORM pg_notify('{CHANNEL}', json_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'key', new_key, 'old_key', old_key,
+        'origin', coalesce(current_setting('{ORIGIN_SETTING}', true), ''))::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def trigger_sql(table):
+    key_args = ', '.join(f"'{column}'" for column in TABLE_KEYS[table])
+    return (f"DROP TRIGGER IF EXISTS {table}_notify_change ON public.{table};\n"
+            f"CREATE TRIGGER {table}_notify_change AFTER INSERT OR UPDATE OR DELETE ON public.{table} "
+            f"FOR EACH ROW EXECUTE FUNCTION public.notify_table_change({key_args})")
+
+
+def notify_bulk_change(cursor, table):
+    # Одно уведомление вместо построчных после массового изменения таблицы
+    cursor.execute("SELECT pg_notify(%s, %s)",
+                   (CHANNEL, json.dumps({'table': table, 'op': 'BULK', 'key': [], 'old_key': [], 'origin': ''})))
+
+
+def new_origin():
+    return f'{_process_origin}:{next(_origin_ids)}'
+
+
+def origin_sql(origin):
+    # Команда, помечающая транзакцию меткой окна; ставится перед текстом изменения и уходит
+    # на сервер в том же execute, без отдельного обращения. Уведомления об изменениях таблицы
+    # окна с его же меткой это окно пропустит, остальные окна (и каскадные изменения других
+    # таблиц) их получат. Метка - из new_origin(), кавычек в ней нет
+    if origin is None:
+        return ''
+    return f"SELECT set_config('{ORIGIN_SETTING}', '{origin}', true);\n"
+
+
+def install_triggers(connection):
+    cursor = connection.cursor()
+    cursor.execute(TRIGGER_FUNCTION_SQL)
+    for table in TABLE_KEYS:
+        cursor.execute(trigger_sql(table))
+    connection.commit()
+    cursor.close()
+
+
+class ChangeListener(QThread):
+    # Слушает канал уведомлений на отдельном соединении (не из пула: LISTEN живет в сессии)
+    # table, op (INSERT/UPDATE/DELETE или BULK после массовой загрузки), новый ключ, старый ключ,
+    # метка окна, сделавшего изменение (пустая, если изменение сделано не окном приложения)
+    table_changed = pyqtSignal(str, str, list, list, str)
+    # Соединение восстановлено после обрыва: уведомления за это время потеряны
+    reconnected = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+        self.wait()
+
+    def run(self):
+        first_connect = True
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(**DB_PARAMS)
+                connection.set_session(autocommit=True)
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {CHANNEL}")
+                cursor.close()
+                if not first_connect:
+                    self.reconnected.emit()
+                first_connect = False
+                self._listen(connection)
+            except psycopg2.Error:
+                self._stopping.wait(RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _listen(self, connection):
+        while not self._stopping.is_set():
+            if select.select([connection], [], [], POLL_INTERVAL) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                try:
+                    payload = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                self.table_changed.emit(payload['table'], payload['op'], payload['key'], payload['old_key'],
+                                        payload.get('origin') or '')
+
+
+_listener = None
+
+
+def change_listener():
+    # Один слушатель на процесс, запускается при первом обращении
+    global _listener
+    if _listener is None:
+        _listener = ChangeListener()
+        _listener.table_changed.connect(_invalidate_cache)
+        _listener.reconnected.connect(reference_cache.clear)
+        QApplication.instance().aboutToQuit.connect(_listener.stop)
+        _listener.start()
+    return _listener
+
+
+def _invalidate_cache(table, op, key, old_key, origin):
+    if table in REFERENCE_TABLES:
+        if op == 'BULK':
+            reference_cache.invalidate(table)
+        for changed_key in (key, old_key):
+            if changed_key:
+                reference_cache.invalidate(table, changed_key[0])
+
+
+class LiveUpdater(QObject):
+    # Переносит в модель окна изменения таблицы, сделанные другими окнами и рабочими местами,
+    # а также каскадные изменения. Записи окна помечаются его меткой origin (origin_sql),
+    # и уведомления о них пропускаются: окно уже показало их само.
+    # Уведомления копятся PATCH_DELAY_MS, затем измененные строки читаются одним запросом.
+    # После массовой загрузки вызывается reload: точечно переносить такие изменения дороже.
+    def __init__(self, model, table, reload=None, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.table = table
+        self.reload = reload
+        self.origin = new_origin()
+        self._changed = set()
+        self._removed = set()
+        # Ссылки на запущенные задачи, чтобы их сигналы дожили до результата
+        self._tasks = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(PATCH_DELAY_MS)
+        self._timer.timeout.connect(self._flush)
+        change_listener().table_changed.connect(self._on_table_changed)
+
+    def stop(self):
+        self._timer.stop()
+        try:
+            change_listener().table_changed.disconnect(self._on_table_changed)
+        except TypeError:
+            pass
+
+    def _on_table_changed(self, table, op, key, old_key, origin):
+        if table != self.table:
+            return
+        if op == 'BULK':
+            if self.reload is not None:
+                self.reload()
+            return
+        if origin == self.origin:
+            return
+        if old_key and old_key != key:
+            self._removed.add(tuple(old_key))
+            self._changed.discard(tuple(old_key))
+        if op != 'DELETE':
+            self._changed.add(tuple(key))
+            self._removed.discard(tuple(key))
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        if self._removed:
+            self.model.remove_rows(self._removed)
+            self._removed = set()
+        if self._changed:
+            query, params = self.model.source_query()
+            task = BackgroundTask(_fetch_rows, self.table, list(self._changed), query, params)
+            task.signals.finished.connect(lambda result, task=task: self._apply_rows(task, result))
+            # Ошибку точечного обновления не показываем: кнопка "Обновить данные" перечитает таблицу
+            task.signals.failed.connect(lambda message, task=task: self._tasks.discard(task))
+            self._tasks.add(task)
+            self._changed = set()
+            start_task(task)
+
+    def _apply_rows(self, task, result):
+        self._tasks.discard(task)
+        keys, rows = result
+        for row in rows:
+            # Несохраненную правку пользователя не затираем, она уйдет в базу при применении
+            if not self.model.is_pending(self.model.key_of(row)):
+                self.model.update_row(row)
+        # Строки, которых уже нет в базе, удалены после уведомления
+        self.model.remove_rows(set(keys) - {self.model.key_of(row) for row in rows})
+
+
+def _fetch_rows(task, table, keys, query=None, params=None):
+    # Выполняется в фоновом потоке. Строки читаются тем же запросом, что показан в окне:
+    # строка, переставшая подходить под фильтр окна, не вернется и будет убрана из таблицы
+    condition, key_params = key_filter(table, keys)
+    if query is None:
+        query = f"SELECT * FROM public.{table}"
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT * FROM ({query}) AS shown WHERE {condition}", list(params or ()) + list(key_params))
+        rows = cursor.fetchall()
+        cursor.close()
+    return keys, rows
+
+
+if __name__ == '__main__':
+    # Установка триггеров уведомлений: python notifications.py
+    with pooled_connection() as connection:
+        install_triggers(connection)
+    print('Триггеры уведомлений установлены')
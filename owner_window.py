@@ -1,8 +1,16 @@
 import psycopg2
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QMessageBox, QDialog
-from connection import connect_to_database
-from error import ( contains_only_cor_text, has_correct_length, is_empty,
-                   contains_only_numb)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QDialog
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 
 class OwnerWindow(QWidget):
@@ -16,11 +24,33 @@ class OwnerWindow(QWidget):
         layout = QVBoxLayout()
 
         # Создаем таблицу для отображения данных
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(['UID', 'ФИО', 'Телефон'])
+        self.model = TableModel(['UID', 'ФИО', 'Телефон'])
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('owner')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'owner', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('owner', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'owner', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопка для обновления данных в таблице
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -41,36 +71,50 @@ class OwnerWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'owner', self.refresh_data))
+        layout.addWidget(btn_import)
+
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'owner', self.model))
+        layout.addWidget(btn_export)
+
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
+
         self.setLayout(layout)
 
-        # Обновляем данные при открытии окна
-        self.refresh_data()
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
     def refresh_data(self):
-        # Подключаемся к базе данных и получаем данные
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM public.owner")
-            rows = cursor.fetchall()
-
-            # Очищаем таблицу перед обновлением данных
-            self.table.setRowCount(0)
-
-            # Заполняем таблицу данными
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
 
-        except (Exception, psycopg2.Error) as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         # Окно для ввода новой записи
@@ -109,58 +153,45 @@ class OwnerWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, uid, fio, ph_numb, dialog):
-        if is_empty(uid):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен UID.')
-            return
-        if not contains_only_numb(uid):
-            QMessageBox.warning(self, 'Ошибка', 'UID должен содержать только цифры.')
-            return
-        if not has_correct_length(uid, 10, True):
-            QMessageBox.warning(self, 'Ошибка', 'UID должно содержать 10 символов.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('owner', {'uid': uid, 'fio': fio, 'ph_numb': ph_numb})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
-        if is_empty(fio):
-            QMessageBox.warning(self, 'Ошибка', 'Не введено ФИО.')
-            return
-        if not contains_only_cor_text(fio):
-            QMessageBox.warning(self, 'Ошибка', 'ФИО содержит некорректные символы.')
-            return
-        if not has_correct_length(fio, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком длинное ФИО.')
-            return
-
-        if is_empty(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен номер телефона.')
-            return
-        if not contains_only_numb(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', 'Номер телефона должен содержать только цифры.')
-            return
-        if not has_correct_length(ph_numb, 11, True):
-            QMessageBox.warning(self, 'Ошибка', 'Неверная длина номера телефона.')
-            return
         try:
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((uid, fio, ph_numb))
+                dialog.close()
+                return
+
             # Подключаемся к базе данных
-            connection = connect_to_database()
-            cursor = connection.cursor()
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
 
-            # Проверка уникальности UID
-            cursor.execute("SELECT * FROM public.owner WHERE uid = %s", (uid,))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Владелец квартиры с этим UID уже есть в базе данных')
-                return
+                # Проверка уникальности UID
+                cursor.execute("SELECT * FROM public.owner WHERE uid = %s", (uid,))
+                if cursor.fetchone() is not None:
+                    QMessageBox.warning(self, 'Ошибка', 'Владелец квартиры с этим UID уже есть в базе данных')
+                    return
 
-            # Выполняем SQL-запрос для добавления записи
-            cursor.execute("""
-                INSERT INTO public.owner (uid, fio, ph_numb)
-                VALUES (%s, %s, %s)
-            """, (uid, fio, ph_numb))
+                # Выполняем SQL-запрос для добавления записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    INSERT INTO public.owner (uid, fio, ph_numb)
+                    VALUES (%s, %s, %s)
+                    RETURNING *
+                """, (uid, fio, ph_numb))
+                row = cursor.fetchone()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                connection.commit()
+                cursor.close()
 
-            # Обновляем данные в таблице
-            self.refresh_data()
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('owner', uid)
+
+            # Добавляем в таблицу только новую строку
+            self.model.insert_row(row)
 
             # Закрываем окно добавления записи
             dialog.close()
@@ -171,44 +202,56 @@ class OwnerWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи в базу данных:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        uid = self.table.item(selected_row, 0).text()
+        keys = [self.model.text(selected_row, 0) for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с UID {keys[0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение',
-                                     f'Вы уверены, что хотите удалить запись с UID {uid}?',
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        reply = QMessageBox.question(self, 'Подтверждение', question,
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM public.owner WHERE uid = %s", (uid,))
-                connection.commit()
-                cursor.close()
-                connection.close()
-
-                # Обновляем данные в таблице
-                self.refresh_data()
-
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(origin_sql(self.live_updates.origin) + "DELETE FROM public.owner WHERE uid IN %s", (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Ключи справочника в кеше больше не актуальны
+                for key in keys:
+                    reference_cache.invalidate('owner', key)
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows([(key,) for key in keys])
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи из базы данных:\n{str(error)}')
 
     def edit_record(self):
         # Получаем выбранную строку
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
         # Получаем данные выбранной строки
-        uid = self.table.item(selected_row, 0).text()
-        fio = self.table.item(selected_row, 1).text()
-        ph_numb = self.table.item(selected_row, 2).text()
+        uid = self.model.text(selected_row, 0)
+        fio = self.model.text(selected_row, 1)
+        ph_numb = self.model.text(selected_row, 2)
 
         # Окно для редактирования записи
         dialog = QDialog(self)
@@ -247,44 +290,47 @@ class OwnerWindow(QWidget):
         dialog.exec()
 
     def update_record(self, uid, fio, ph_numb, dialog):
-
-        if is_empty(fio):
-            QMessageBox.warning(self, 'Ошибка', 'Не введено ФИО.')
-            return
-        if not contains_only_cor_text(fio):
-            QMessageBox.warning(self, 'Ошибка', 'ФИО содержит некорректные символы.')
-            return
-        if not has_correct_length(fio, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Слишком длинное ФИО.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('owner', {'fio': fio, 'ph_numb': ph_numb})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
-        if is_empty(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', 'Не введен номер телефона.')
-            return
-        if not contains_only_numb(ph_numb):
-            QMessageBox.warning(self, 'Ошибка', 'Номер телефона должен содержать только цифры.')
-            return
-        if not has_correct_length(ph_numb, 11, True):
-            QMessageBox.warning(self, 'Ошибка', 'Неверная длина номера телефона.')
-            return
         try:
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((uid, fio, ph_numb))
+                dialog.close()
+                return
+
             # Подключаемся к базе данных
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            # Выполняем SQL-запрос для изменения записи
-            cursor.execute("""
-                UPDATE public.owner
-                SET fio = %s, ph_numb = %s
-                WHERE uid = %s
-            """, (fio, ph_numb, uid))
-
-            connection.commit()
-            cursor.close()
-            connection.close()
-
-            # Обновляем данные в таблице
-            self.refresh_data()
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+
+                # Выполняем SQL-запрос для изменения записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                    UPDATE public.owner
+                    SET fio = %s, ph_numb = %s
+                    WHERE uid = %s
+                    RETURNING *
+                """, (fio, ph_numb, uid))
+                row = cursor.fetchone()
+
+                connection.commit()
+                cursor.close()
+
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('owner', uid)
+
+            if row is None:
+                # Строку удалили после загрузки таблицы
+                self.model.remove_rows([(uid,)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
+
+            # Обновляем в таблице только измененную строку
+            self.model.update_row(row)
 
             # Закрываем окно редактирования записи
             dialog.close()
@@ -0,0 +1,259 @@
+import threading
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QMessageBox, QPushButton, QWidget
+
+from connection import STREAM_ITERSIZE, acquire_connection, pooled_connection, release_connection
+from tables import COLUMN_TYPES, TABLE_COLUMNS, TABLE_KEYS
+
+# Сколько строк запрашивать одной страницей
+PAGE_SIZE = STREAM_ITERSIZE
+# Разделитель частей составного ключа в поле "Перейти к ключу"
+KEY_SEPARATOR = ';'
+
+
+def order_columns(table, column=None):
+    # Столбцы ORDER BY: столбец сортировки, затем первичный ключ, чтобы порядок был однозначным
+    # и страницу можно было продолжить с последней строки. column=None - по первичному ключу
+    keys = TABLE_KEYS[table]
+    if column is None:
+        return keys
+    return (column,) + tuple(key for key in keys if key != column)
+
+
+def _collated(table, column):
+    # Строковые столбцы сравниваются по кодам символов (COLLATE "C"), как строки Python в
+    # TableModel: иначе строка, вставленная в загруженную часть окна, встала бы не туда, куда
+    # ее поставит ORDER BY сервера (правила языка базы Python не повторить)
+    if column in COLUMN_TYPES.get(table, {}):
+        return column
+    return f'{column} COLLATE "C"'
+
+
+def _order_by(table, columns, descending):
+    direction = ' DESC' if descending else ''
+    return ', '.join(_collated(table, column) + direction for column in columns)
+
+
+def ordered_query(table, query, column=None, descending=False):
+    # Тот же запрос с порядком строк окна (для выгрузки)
+    return f"SELECT * FROM ({query}) AS shown ORDER BY {_order_by(table, order_columns(table, column), descending)}"
+
+
+def page_parts(table, column, descending):
+    # Части результата, каждая читается по индексу (столбец сортировки, ключ): строки с
+    # заполненным столбцом и строки с NULL (сравнение строк с NULL не работает). NULL идут
+    # последними при сортировке по возрастанию и первыми по убыванию, как в ORDER BY.
+    # Часть - (условие, столбцы порядка, состоит ли она из строк с NULL)
+    columns = order_columns(table, column)
+    if column is None or column in TABLE_KEYS[table]:
+        return [(None, columns, False)]
+    filled = (f"{column} IS NOT NULL", columns, False)
+    empty = (f"{column} IS NULL", columns[1:], True)
+    return [empty, filled] if descending else [filled, empty]
+
+
+def page_sql(query, table, columns, descending, count, condition=None, seek=None):
+    # Запрос страницы результата query в порядке columns. seek - оператор сравнения с
+    # последней полученной строкой ('>', '>=', ...; ее значения столбцов columns - последние
+    # параметры запроса), None для первой страницы
+    conditions = [condition] if condition else []
+    if seek is not None:
+        placeholders = ', '.join(['%s'] * len(columns))
+        compared = ', '.join(_collated(table, column) for column in columns)
+        conditions.append(f"({compared}) {seek} ({placeholders})")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT * FROM ({query}) AS page{where} ORDER BY {_order_by(table, columns, descending)} LIMIT {int(count)}"
+
+
+def sort_index_sql(table):
+    # Индексы (столбец, первичный ключ) для сортировки по каждому столбцу, с теми же правилами
+    # сравнения строк, что в ORDER BY (_collated). Индекс первичного ключа построен с правилами
+    # базы и для порядка по ключу не подходит, поэтому индекс есть и для первого столбца ключа.
+    # По убыванию индексы читаются с конца
+    statements = []
+    for column in TABLE_COLUMNS[table]:
+        columns = order_columns(table, None if column == TABLE_KEYS[table][0] else column)
+        statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{column}_sort_c "
+                          f"ON public.{table} ({', '.join(_collated(table, part) for part in columns)})")
+    return statements
+
+
+def old_sort_index_sql(table):
+    # Индексы сортировки с правилами базы, построенные до sort_index_sql с COLLATE "C"
+    return [f"DROP INDEX CONCURRENTLY IF EXISTS public.{table}_{column}_sort"
+            for column in TABLE_COLUMNS[table] if column != TABLE_KEYS[table][0]]
+
+
+def install_indexes(connection):
+    cursor = connection.cursor()
+    for table in TABLE_COLUMNS:
+        for statement in sort_index_sql(table):
+            cursor.execute(statement)
+        cursor.execute(f"ANALYZE public.{table}")
+    connection.commit()
+    cursor.close()
+
+
+class PageStream:
+    # Постраничная выдача результата запроса в порядке сортировки окна, с тем же интерфейсом,
+    # что у RowStream. Каждая страница - отдельный запрос, продолжающий с последней полученной
+    # строки (WHERE (столбец, ключ) > (...) ORDER BY ... LIMIT): по индексу он читает только
+    # саму страницу, поэтому сотая страница стоит столько же, сколько первая, а соединение
+    # занято только на время запроса страницы.
+    # start_key - начало ключа строки (кортеж), с которой начать выдачу ("перейти к ключу")
+    def __init__(self, query, params, table, column=None, descending=False, start_key=None, itersize=PAGE_SIZE):
+        self.query = query
+        self.params = list(params or ())
+        self.table = table
+        self.itersize = itersize
+        self.exhausted = False
+        self.cancelled = False
+        self._columns = TABLE_COLUMNS[table]
+        self._sort_column = column
+        self._descending = descending
+        self._phases = page_parts(table, column, descending)
+        self._phase = 0
+        # Значения столбцов порядка последней строки и включать ли саму эту строку
+        self._after = None
+        self._inclusive = False
+        self._start_key = start_key
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def fetch(self, count=None):
+        if self.cancelled:
+            self.close()
+        if self.exhausted:
+            return []
+        count = count or self.itersize
+        if self._start_key is not None:
+            self._seek_to_key(self._start_key)
+            self._start_key = None
+        rows = []
+        while len(rows) < count and self._phase < len(self._phases):
+            wanted = count - len(rows)
+            page = self._fetch_page(wanted)
+            rows += page
+            if len(page) < wanted:
+                # Часть результата дочитана, следующая начинается со своей первой строки
+                self._phase += 1
+                self._after = None
+                self._inclusive = False
+        if self._phase == len(self._phases):
+            self.close()
+        return rows
+
+    def columns(self):
+        return list(self._columns)
+
+    def cancel(self):
+        # Можно вызывать из другого потока: прерывает выполняющийся на сервере запрос
+        with self._lock:
+            self.cancelled = True
+            if self._connection is not None and not self._connection.closed:
+                self._connection.cancel()
+
+    def close(self):
+        self.exhausted = True
+
+    def _fetch_page(self, count):
+        condition, columns, _ = self._phases[self._phase]
+        params = list(self.params)
+        seek = None
+        if self._after is not None:
+            seek = ('<' if self._descending else '>') + ('=' if self._inclusive else '')
+            params += self._after
+        query = page_sql(self.query, self.table, columns, self._descending, count, condition, seek)
+        rows = self._execute(query, params)
+        if rows:
+            self._after = self._order_values(rows[-1], columns)
+            self._inclusive = False
+        return rows
+
+    def _seek_to_key(self, key):
+        # Первая в порядке окна строка с этим началом ключа; выдача начнется с нее
+        key_columns = TABLE_KEYS[self.table][:len(key)]
+        condition = ' AND '.join(f"{column} = %s" for column in key_columns)
+        order = order_columns(self.table, self._sort_column)
+        rows = self._execute(f"SELECT * FROM ({self.query}) AS shown WHERE {condition} "
+                             f"ORDER BY {_order_by(self.table, order, self._descending)} LIMIT 1", self.params + list(key))
+        if not rows:
+            self.close()
+            raise LookupError(f'Запись с ключом {KEY_SEPARATOR.join(key)} не найдена')
+        row = rows[0]
+        is_null = row[self._columns.index(order[0])] is None
+        for phase, (condition, columns, nulls) in enumerate(self._phases):
+            if condition is None or nulls == is_null:
+                self._phase = phase
+                self._after = self._order_values(row, columns)
+                self._inclusive = True
+                return
+
+    def _order_values(self, row, columns):
+        return [row[self._columns.index(column)] for column in columns]
+
+    def _execute(self, query, params):
+        connection = acquire_connection()
+        try:
+            with self._lock:
+                self._connection = connection
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            with self._lock:
+                self._connection = None
+            release_connection(connection)
+
+
+class JumpBar(QWidget):
+    # Поле "Перейти к ключу" над таблицей окна. Если все строки окна уже загружены, нужная
+    # строка выделяется сразу; иначе таблица загружается заново, начиная с этой строки
+    def __init__(self, table, parent=None):
+        super().__init__(parent)
+        self.table = table
+        model = table.model()
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel("Перейти к ключу:"))
+
+        self.edit = QLineEdit()
+        self.edit.setPlaceholderText(f'{KEY_SEPARATOR} '.join(
+            model.headerData(column, Qt.Orientation.Horizontal) for column in model.key_columns()))
+        self.edit.returnPressed.connect(self.jump)
+        layout.addWidget(self.edit)
+
+        btn_jump = QPushButton("Перейти")
+        btn_jump.clicked.connect(self.jump)
+        layout.addWidget(btn_jump)
+
+        self.setLayout(layout)
+
+    def jump(self):
+        key = tuple(part.strip() for part in self.edit.text().split(KEY_SEPARATOR))
+        while key and not key[-1]:
+            key = key[:-1]
+        if not key or not all(key):
+            QMessageBox.warning(self, 'Ошибка', 'Введите значение ключа')
+            return
+        model = self.table.model()
+        row_index = model.jump_to(key)
+        if row_index is None:
+            # Строки загружаются с сервера, начиная с найденной
+            return
+        if row_index == -1:
+            QMessageBox.warning(self, 'Ошибка', f'Запись с ключом {KEY_SEPARATOR.join(key)} не найдена')
+            return
+        self.table.selectRow(row_index)
+        self.table.scrollTo(model.index(row_index, 0))
+
+
+if __name__ == '__main__':
+    # Создание индексов для сортировки: python paging.py
+    with pooled_connection() as connection:
+        install_indexes(connection)
+    print('Индексы для сортировки созданы')
@@ -0,0 +1,244 @@
+import json
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtWidgets import QStatusBar
+from psycopg2 import extensions
+
+# Операции дольше этого времени (мс) отмечаются в строке состояния окон
+SLOW_OPERATION_MS = 500
+# Показывать ли строку состояния с медленными операциями
+SHOW_SLOW_OPERATIONS = False
+# Файл трассировки (по одной записи JSON в строке); None - не записывать
+TRACE_PATH = None
+# Верхние границы интервалов гистограмм задержек (мс); последний интервал - все, что дольше
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# Сколько символов текста запроса хранить (execute_values подставляет значения в текст)
+SQL_TEMPLATE_LENGTH = 300
+# Сколько секунд сообщение о медленной операции остается в строке состояния
+SLOW_MESSAGE_TIMEOUT = 10
+
+_SPACES_RE = re.compile(r'\s+')
+# Метка окна перед изменением (notifications.origin_sql): своя у каждого окна, в замер не входит
+_ORIGIN_RE = re.compile(r"^\s*SELECT set_config\('[\w.]+', '[^']*', true\);\s*")
+
+
+def sql_template(query):
+    # Текст запроса без значений параметров (они передаются отдельно), в одну строку
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return _SPACES_RE.sub(' ', _ORIGIN_RE.sub('', str(query))).strip()[:SQL_TEMPLATE_LENGTH]
+
+
+def param_count(params):
+    if params is None:
+        return 0
+    return len(params) if isinstance(params, (list, tuple, dict)) else 1
+
+
+class Histogram:
+    # Число операций в каждом интервале HISTOGRAM_BOUNDS_MS, сумма и максимум
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, share):
+        # Верхняя граница интервала, в который попадает перцентиль (не больше максимума)
+        wanted = share * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                if index < len(HISTOGRAM_BOUNDS_MS):
+                    return min(HISTOGRAM_BOUNDS_MS[index], round(self.max_ms, 2))
+                break
+        return round(self.max_ms, 2)
+
+    def summary(self):
+        return {'count': self.count, 'mean_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+                'p50_ms': self.percentile(0.5), 'p90_ms': self.percentile(0.9), 'p99_ms': self.percentile(0.99),
+                'max_ms': round(self.max_ms, 2)}
+
+
+class QueryLog(QObject):
+    # Замеры запросов приложения: гистограммы задержек по тексту запроса в памяти и, если
+    # задан файл, трассировка для разбора после работы (python query_log.py файл).
+    # Запись - словарь: kind ('query' - выполнение запроса и получение его строк, 'page' -
+    # очередная порция строк серверного курсора, 'render' - добавление строк в таблицу окна),
+    # sql, params, rows, server_ms, fetch_ms, render_ms, total_ms, thread, time.
+    # Записи приходят из разных потоков, сигналы доставляются в поток интерфейса
+
+    # Запись дольше порога threshold_ms
+    slow_operation = pyqtSignal(object)
+
+    def __init__(self, threshold_ms=SLOW_OPERATION_MS, trace_path=TRACE_PATH):
+        super().__init__()
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+        # (kind, sql) -> Histogram общего времени
+        self._histograms = {}
+        self._trace = None
+        self.set_trace_path(trace_path)
+
+    def set_trace_path(self, path):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+            self._trace = open(path, 'a', encoding='utf-8') if path else None
+
+    def record(self, entry):
+        entry['total_ms'] = round(entry.get('server_ms', 0) + entry.get('fetch_ms', 0) + entry.get('render_ms', 0), 3)
+        entry['thread'] = threading.current_thread().name
+        entry['time'] = time.time()
+        with self._lock:
+            key = (entry['kind'], entry['sql'])
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.add(entry['total_ms'])
+            if self._trace is not None:
+                self._trace.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self._trace.flush()
+        if entry['total_ms'] >= self.threshold_ms:
+            self.slow_operation.emit(entry)
+
+    def record_render(self, query, rows, seconds):
+        # Время добавления полученных строк в модель таблицы (вместе с обновлением представления)
+        self.record({'kind': 'render', 'sql': sql_template(query), 'params': 0, 'rows': rows,
+                     'render_ms': round(seconds * 1000, 3)})
+
+    def summary(self):
+        # [(kind, sql, сводка гистограммы)] по убыванию общего времени
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda item: item[1].total_ms, reverse=True)
+            return [(kind, sql, histogram.summary()) for (kind, sql), histogram in items]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+query_log = QueryLog()
+
+
+class TimedCursor(extensions.cursor):
+    # Курсор соединений пула (connection.get_pool): каждый execute замеряется и попадает в
+    # query_log. Время сервера - выполнение execute (для обычного курсора в нем же приходят все
+    # строки), время получения - вызовы fetch*. Замер запроса завершается, когда строки
+    # прочитаны до конца, при следующем execute или при закрытии курсора. У серверного
+    # (именованного) курсора каждая порция строк записывается отдельно (kind='page')
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entry = None
+
+    def execute(self, query, vars=None):
+        self._finish()
+        entry = {'kind': 'query', 'sql': sql_template(query), 'params': param_count(vars), 'rows': 0,
+                 'server_ms': 0.0, 'fetch_ms': 0.0}
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            entry['server_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self._entry = entry
+            if self.name is not None:
+                # Серверный курсор только объявлен, строки придут порциями
+                self._finish()
+                self._entry = {'kind': 'page', 'sql': entry['sql'], 'params': entry['params'], 'rows': 0,
+                               'server_ms': 0.0, 'fetch_ms': 0.0}
+            elif self.description is None:
+                # Запрос без результата (INSERT/UPDATE/DELETE без RETURNING и т.п.)
+                entry['rows'] = max(self.rowcount, 0)
+                self._finish()
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        self._count(0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._count(len(rows), self.name is not None or len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._count(len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._entry is not None:
+                self._entry['fetch_ms'] = round(self._entry['fetch_ms'] + (time.perf_counter() - start) * 1000, 3)
+
+    def _count(self, rows, finished):
+        entry = self._entry
+        if entry is None:
+            return
+        entry['rows'] += rows
+        if finished:
+            self._finish()
+            if self.name is not None and rows:
+                # Следующая порция строк серверного курсора - отдельная запись
+                self._entry = dict(entry, rows=0, fetch_ms=0.0)
+
+    def _finish(self):
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            query_log.record(entry)
+
+
+class SlowOperationBar(QStatusBar):
+    # Строка состояния окна: последняя операция дольше query_log.threshold_ms.
+    # Показывается, если включен SHOW_SLOW_OPERATIONS
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSizeGripEnabled(False)
+        self.setVisible(SHOW_SLOW_OPERATIONS)
+        if SHOW_SLOW_OPERATIONS:
+            query_log.slow_operation.connect(self.show_operation)
+
+    def show_operation(self, entry):
+        parts = [f"{name} {entry[f'{name}_ms']:.0f} мс" for name in ('server', 'fetch', 'render')
+                 if entry.get(f'{name}_ms')]
+        self.showMessage(f"Медленная операция: {entry['total_ms']:.0f} мс ({', '.join(parts)}; "
+                         f"строк {entry['rows']}): {entry['sql'][:120]}", SLOW_MESSAGE_TIMEOUT * 1000)
+
+
+def summarize_trace(path):
+    # Сводка файла трассировки по тексту запроса: гистограммы общего времени
+    histograms = {}
+    with open(path, encoding='utf-8') as trace:
+        for line in trace:
+            entry = json.loads(line)
+            key = (entry['kind'], entry['sql'])
+            histograms.setdefault(key, Histogram()).add(entry['total_ms'])
+    return sorted(histograms.items(), key=lambda item: item[1].total_ms, reverse=True)
+
+
+if __name__ == '__main__':
+    # Разбор трассировки: python query_log.py файл [кол-во запросов]
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for (kind, sql), histogram in summarize_trace(sys.argv[1])[:limit]:
+        summary = histogram.summary()
+        print(f"{histogram.total_ms:10.0f} мс всего  {summary['count']:>7} раз  p50 {summary['p50_ms']:>6} мс  "
+              f"p99 {summary['p99_ms']:>6} мс  макс {summary['max_ms']:>9} мс  {kind:<6} {sql[:100]}")
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from connection import pooled_connection
+from workers import BackgroundTask, start_task
+
+# Сколько секунд загруженный набор ключей считается актуальным
+CACHE_TTL = 300
+
+# Справочные таблицы: ключевой столбец и столбцы, значения которых нужны при проверках
+REFERENCE_TABLES = {
+    'apartment': ('cod_num_hom', ('num_of_flrs', 'num_of_flts', 'square')),
+    'owner': ('uid', ()),
+    'builder': ('inn_org', ()),
+    'repair_work': ('cod_rep_work', ()),
+}
+
+
+class ReferenceCache:
+    # Ключи справочных таблиц в памяти процесса для проверки внешних ссылок без запроса к базе.
+    # Полный набор ключей загружается в фоне; пока его нет, ключ проверяется точечным запросом.
+    # У каждой таблицы своя версия: сброс всей таблицы увеличивает ее, и загрузка, начатая
+    # до сброса, не попадает в кеш. Сброс одного ключа убирает только его и увеличивает номер
+    # сброса этого ключа: значение, прочитанное до сброса, в кеш уже не записывается.
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # таблица -> (время загрузки, версия, {ключ: значения столбцов})
+        self._entries = {}
+        self._versions = dict.fromkeys(REFERENCE_TABLES, 0)
+        # таблица -> {ключ: сколько раз ключ сбрасывался} с последнего сброса всей таблицы
+        self._generations = {table: {} for table in REFERENCE_TABLES}
+        # таблица -> фоновая задача загрузки, которая еще не завершилась
+        self._reloads = {}
+
+    def version(self, table):
+        with self._lock:
+            return self._versions[table]
+
+    def invalidate(self, table, key=None):
+        # Без ключа сбрасывается вся таблица
+        with self._lock:
+            if key is None:
+                self._versions[table] += 1
+                self._entries.pop(table, None)
+                self._generations[table] = {}
+                return
+            key = str(key)
+            generations = self._generations[table]
+            generations[key] = generations.get(key, 0) + 1
+            entry = self._entries.get(table)
+            if entry is not None:
+                entry[2].pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            for table in self._versions:
+                self._versions[table] += 1
+                self._generations[table] = {}
+            self._entries.clear()
+
+    def contains(self, table, key):
+        return self.get(table, key) is not None
+
+    def get(self, table, key):
+        # Значения справочных столбцов по ключу (пустой кортеж, если их нет) или None
+        key = str(key)
+        keys = self._keys(table)
+        if keys is not None and key in keys:
+            return keys[key]
+        # Набор еще загружается или ключ добавлен после загрузки: проверяем точечно
+        return self._lookup(table, key)
+
+    def loaded(self, table):
+        # Загружен ли актуальный набор ключей таблицы; если нет, он загружается в фоне. Пока
+        # набора нет, проверка по кешу стоила бы точечного запроса на каждый ключ
+        return self._keys(table) is not None
+
+    def _keys(self, table):
+        # Актуальный набор ключей или None; устаревший набор перезагружается в фоне
+        with self._lock:
+            entry = self._entries.get(table)
+            version = self._versions[table]
+            if entry is not None and entry[1] == version and time.monotonic() - entry[0] < self.ttl:
+                return entry[2]
+            if table in self._reloads:
+                return None
+            generations = dict(self._generations[table])
+            task = self._reloads[table] = BackgroundTask(self._reload, table, version, generations)
+        start_task(task)
+        return None
+
+    def _reload(self, task, table, version, generations):
+        try:
+            key_column, value_columns = REFERENCE_TABLES[table]
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(f"SELECT {', '.join((key_column,) + value_columns)} FROM public.{table}")
+                keys = {str(row[0]): tuple(row[1:]) for row in cursor.fetchall()}
+                cursor.close()
+            with self._lock:
+                if self._versions[table] == version:
+                    # Ключи, сброшенные во время загрузки, могли быть прочитаны до изменения
+                    for key, generation in self._generations[table].items():
+                        if generations.get(key, 0) != generation:
+                            keys.pop(key, None)
+                    self._entries[table] = (time.monotonic(), version, keys)
+        finally:
+            with self._lock:
+                self._reloads.pop(table, None)
+
+    def _lookup(self, table, key):
+        key_column, value_columns = REFERENCE_TABLES[table]
+        with self._lock:
+            version = self._versions[table]
+            generation = self._generations[table].get(key, 0)
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT {', '.join((key_column,) + value_columns)} FROM public.{table} "
+                           f"WHERE {key_column} = %s", (key,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            return None
+
+        values = tuple(row[1:])
+        with self._lock:
+            # Уведомление об изменении ключа могло прийти, пока шел запрос: тогда значение
+            # устарело и в кеш не записывается
+            entry = self._entries.get(table)
+            if (entry is not None and self._versions[table] == version
+                    and self._generations[table].get(key, 0) == generation):
+                entry[2][key] = values
+        return values
+
+
+# Общий кеш на весь процесс
+reference_cache = ReferenceCache()
@@ -1,8 +1,16 @@
 import psycopg2
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QMessageBox, QDialog
-from connection import connect_to_database
-from error import ( contains_only_cor_text, has_correct_length, is_empty,
-                   contains_only_numb)
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QDialog
+from bulk_dialogs import export_dialog, import_csv_dialog
+from connection import pooled_connection
+from notifications import LiveUpdater, origin_sql
+from reference_cache import reference_cache
+from staging import EditBuffer, EditBufferBar
+from table_model import TableModel, create_table_view, selected_row_numbers
+from error import validate_record
+from filters import FilterBar
+from paging import JumpBar
+from query_log import SlowOperationBar
 
 
 class RepairWorkWindow(QWidget):
@@ -16,11 +24,33 @@ class RepairWorkWindow(QWidget):
         layout = QVBoxLayout()
 
         # Создаем таблицу для отображения данных
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(['Код работы', 'Тип работы'])
+        self.model = TableModel(['Код работы', 'Тип работы'])
+        self.table = create_table_view(self.model)
+        # Строки загружаются с сервера страницами в порядке сортировки, выбранной щелчком по заголовку
+        self.model.enable_paging('repair_work')
+        self.model.load_failed.connect(self.show_load_error)
+        self.model.loading_changed.connect(self.on_loading_changed)
+        # Подгоняем ширину столбцов, когда пришли первые строки
+        self.model.loaded.connect(self.table.resizeColumnsToContents)
+        # Изменения, сделанные на других рабочих местах, приходят через LISTEN/NOTIFY
+        self.live_updates = LiveUpdater(self.model, 'repair_work', self.refresh_data, self)
+        # Поля фильтра по столбцам: строки отбираются запросом на сервере
+        self.filters = FilterBar('repair_work', self.model)
+        self.filters.changed.connect(self.refresh_data)
+        layout.addWidget(self.filters)
+        self.jump_bar = JumpBar(self.table)
+        layout.addWidget(self.jump_bar)
         layout.addWidget(self.table)
 
+        self.lbl_loading = QLabel("Загрузка данных...")
+        self.lbl_loading.setVisible(False)
+        layout.addWidget(self.lbl_loading)
+
+        # Отложенное сохранение: правки копятся и записываются в базу одной транзакцией
+        self.edits = EditBuffer(self.model, 'repair_work', self.live_updates.origin, self)
+        self.edits_bar = EditBufferBar(self.edits)
+        layout.addWidget(self.edits_bar)
+
         # Кнопка для обновления данных в таблице
         btn_refresh = QPushButton("Обновить данные")
         btn_refresh.clicked.connect(self.refresh_data)
@@ -41,37 +71,50 @@ class RepairWorkWindow(QWidget):
         btn_upt.clicked.connect(self.edit_record)
         layout.addWidget(btn_upt)
 
-        self.setLayout(layout)
+        # Кнопка для загрузки записей из CSV-файла
+        btn_import = QPushButton("Импорт из CSV")
+        btn_import.clicked.connect(lambda: import_csv_dialog(self, 'repair_work', self.refresh_data))
+        layout.addWidget(btn_import)
 
-        # Обновляем данные при открытии окна
-        self.refresh_data()
+        # Кнопка для выгрузки таблицы в файл
+        btn_export = QPushButton("Экспорт")
+        btn_export.clicked.connect(lambda: export_dialog(self, 'repair_work', self.model))
+        layout.addWidget(btn_export)
 
-    def refresh_data(self):
-        # Подключаемся к базе данных и получаем данные
+        # Запросы дольше порога из query_log.py (если строка состояния включена)
+        self.slow_operations = SlowOperationBar(self)
+        layout.addWidget(self.slow_operations)
 
-        try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM public.repair_work")
-            rows = cursor.fetchall()
+        self.setLayout(layout)
 
-            # Очищаем таблицу перед обновлением данных
-            self.table.setRowCount(0)
+        # Данные запрашиваются после показа окна: окно появляется сразу, строки приходят в фоне
+        QTimer.singleShot(0, self.refresh_data)
 
-            # Заполняем таблицу данными
-            for row_index, row_data in enumerate(rows):
-                self.table.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.table.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))
+    def refresh_data(self):
+        # Запрос выполняется в фоновом потоке, незавершенная загрузка при этом отменяется.
+        # Строки приходят с сервера порциями по мере прокрутки таблицы, отбор по полям фильтра
+        # выполняет сервер
+        try:
+            query, params = self.filters.query()
+        except ValueError as error:
+            QMessageBox.warning(self, 'Ошибка', str(error))
+            return
+        self.model.load(query, params)
 
-            # Подгоняем ширину столбцов после обновления данных
-            self.table.resizeColumnsToContents()
+    def on_loading_changed(self, loading):
+        self.lbl_loading.setVisible(loading)
 
-            cursor.close()
-            connection.close()
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{error}')
 
-        except psycopg2.Error as error:
-            QMessageBox.warning(self, 'Ошибка', f'Ошибка при получении данных из базы данных:\n{str(error)}')
+    def closeEvent(self, event):
+        if not self.edits_bar.confirm_close():
+            event.ignore()
+            return
+        # Прерываем запрос и освобождаем соединение, занятое недочитанным потоком строк
+        self.model.close_stream()
+        self.live_updates.stop()
+        super().closeEvent(event)
 
     def add_record(self):
         # Окно для ввода новой записи
@@ -104,47 +147,44 @@ class RepairWorkWindow(QWidget):
         dialog.exec()
 
     def insert_record(self, cod_rep_work, type_of_work, dialog):
-        if is_empty(cod_rep_work):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы не может быть пустым.')
-            return
-        if not contains_only_numb(cod_rep_work):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы должен содержать только цифры.')
-            return
-        if not has_correct_length(cod_rep_work, 12, True):
-            QMessageBox.warning(self, 'Ошибка', 'Код работы должен быть длиной 12 символов.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('repair_work', {'cod_rep_work': cod_rep_work, 'type_of_work': type_of_work})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
 
-        if is_empty(type_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы не может быть пустым.')
-            return
-        if not contains_only_cor_text(type_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы содержит некорректные символы.')
-            return
-        if not has_correct_length(type_of_work, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы должен быть длиной не более 50 символов.')
-            return
         try:
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            # Проверка уникальности UID
-            cursor.execute("SELECT * FROM public.repair_work WHERE cod_rep_work = %s", (cod_rep_work,))
-            if cursor.fetchone() is not None:
-                QMessageBox.warning(self, 'Ошибка', 'Тип работы с этим кодом уже есть в базе данных')
+            # В режиме отложенного сохранения запись только добавляется в буфер
+            if self.edits.enabled:
+                self.edits.stage_insert((cod_rep_work, type_of_work))
+                dialog.close()
                 return
 
-            # Выполняем SQL-запрос для добавления записи
-            cursor.execute("""
-                    INSERT INTO public.repair_work (cod_rep_work, type_of_work)
-                    VALUES (%s, %s)
-                """, (cod_rep_work, type_of_work))
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+
+                # Проверка уникальности UID
+                cursor.execute("SELECT * FROM public.repair_work WHERE cod_rep_work = %s", (cod_rep_work,))
+                if cursor.fetchone() is not None:
+                    QMessageBox.warning(self, 'Ошибка', 'Тип работы с этим кодом уже есть в базе данных')
+                    return
+
+                # Выполняем SQL-запрос для добавления записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                        INSERT INTO public.repair_work (cod_rep_work, type_of_work)
+                        VALUES (%s, %s)
+                        RETURNING *
+                    """, (cod_rep_work, type_of_work))
+                row = cursor.fetchone()
+
+                connection.commit()
+                cursor.close()
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('repair_work', cod_rep_work)
 
-            # Обновляем данные в таблице
-            self.refresh_data()
+            # Добавляем в таблицу только новую строку
+            self.model.insert_row(row)
 
             # Закрываем окно добавления записи
             dialog.close()
@@ -155,41 +195,55 @@ class RepairWorkWindow(QWidget):
             QMessageBox.warning(self, 'Ошибка', f'Ошибка при добавлении записи в базу данных:\n{str(error)}')
 
     def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        selected_rows = selected_row_numbers(self.table)
+        if not selected_rows:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления')
             return
 
-        cod_rep_work = self.table.item(selected_row, 0).text()
+        keys = [self.model.text(selected_row, 0) for selected_row in selected_rows]
+        if len(keys) == 1:
+            question = f'Вы уверены, что хотите удалить запись с кодом работы {keys[0]}?'
+        else:
+            question = f'Вы уверены, что хотите удалить выбранные записи ({len(keys)})?'
 
-        reply = QMessageBox.question(self, 'Подтверждение',
-                                     f'Вы уверены, что хотите удалить запись с кодом работы {cod_rep_work}?',
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
+        reply = QMessageBox.question(self, 'Подтверждение', question,
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                connection = connect_to_database()
-                cursor = connection.cursor()
-                cursor.execute("DELETE FROM public.repair_work WHERE cod_rep_work = %s", (cod_rep_work,))
-                connection.commit()
-                cursor.close()
-                connection.close()
-                # Обновляем данные в таблице
-                self.refresh_data()
-                QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                # Все выбранные записи удаляются одним запросом в одной транзакции
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(origin_sql(self.live_updates.origin) + "DELETE FROM public.repair_work WHERE cod_rep_work IN %s", (tuple(keys),))
+                    deleted = cursor.rowcount
+                    connection.commit()
+                    cursor.close()
+
+                # Ключи справочника в кеше больше не актуальны
+                for key in keys:
+                    reference_cache.invalidate('repair_work', key)
+
+                # Убираем из таблицы только удаленные строки
+                self.model.remove_rows([(key,) for key in keys])
+
+                if len(keys) == 1:
+                    QMessageBox.information(self, 'Успех', 'Запись успешно удалена')
+                else:
+                    QMessageBox.information(self, 'Успех', f'Удалено записей: {deleted}')
 
             except (Exception, psycopg2.Error) as error:
                 QMessageBox.warning(self, 'Ошибка', f'Ошибка при удалении записи из базы данных:\n{str(error)}')
 
     def edit_record(self):
         # Получаем выбранную строку
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1:
             QMessageBox.warning(self, 'Ошибка', 'Выберите запись для редактирования')
             return
 
         # Получаем данные выбранной строки
-        cod_rep_work = self.table.item(selected_row, 0).text()
-        type_of_work = self.table.item(selected_row, 1).text()
+        cod_rep_work = self.model.text(selected_row, 0)
+        type_of_work = self.model.text(selected_row, 1)
 
         # Окно для редактирования записи
         dialog = QDialog(self)
@@ -222,33 +276,47 @@ class RepairWorkWindow(QWidget):
         dialog.exec()
 
     def update_record(self, cod_rep_work, type_of_work, dialog):
-        if is_empty(type_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы не может быть пустым.')
-            return
-        if not contains_only_cor_text(type_of_work):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы содержит некорректные символы.')
-            return
-        if not has_correct_length(type_of_work, 50):
-            QMessageBox.warning(self, 'Ошибка', 'Тип работы должен быть длиной не более 50 символов.')
+        # Проверяем все поля сразу и показываем все найденные ошибки
+        errors = validate_record('repair_work', {'type_of_work': type_of_work})
+        if errors:
+            QMessageBox.warning(self, 'Ошибка', '\n'.join(errors))
             return
+
         try:
+            # В режиме отложенного сохранения запись только изменяется в буфере
+            if self.edits.enabled:
+                self.edits.stage_update((cod_rep_work, type_of_work))
+                dialog.close()
+                return
+
             # Подключаемся к базе данных
-            connection = connect_to_database()
-            cursor = connection.cursor()
-
-            # Выполняем SQL-запрос для изменения записи
-            cursor.execute("""
-                    UPDATE public.repair_work
-                    SET type_of_work = %s
-                    WHERE cod_rep_work = %s
-                """, (type_of_work, cod_rep_work))
-
-            connection.commit()
-            cursor.close()
-            connection.close()
-
-            # Обновляем данные в таблице
-            self.refresh_data()
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+
+                # Выполняем SQL-запрос для изменения записи
+                cursor.execute(origin_sql(self.live_updates.origin) + """
+                        UPDATE public.repair_work
+                        SET type_of_work = %s
+                        WHERE cod_rep_work = %s
+                        RETURNING *
+                    """, (type_of_work, cod_rep_work))
+                row = cursor.fetchone()
+
+                connection.commit()
+                cursor.close()
+
+            # Ключи справочника в кеше больше не актуальны
+            reference_cache.invalidate('repair_work', cod_rep_work)
+
+            if row is None:
+                # Строку удалили после загрузки таблицы
+                self.model.remove_rows([(cod_rep_work,)])
+                dialog.close()
+                QMessageBox.warning(self, 'Ошибка', 'Запись не найдена в базе данных')
+                return
+
+            # Обновляем в таблице только измененную строку
+            self.model.update_row(row)
 
             # Закрываем окно редактирования записи
             dialog.close()
@@ -0,0 +1,378 @@
+import json
+import re
+import sys
+
+import psycopg2
+
+from connection import pooled_connection
+from apartment_summary import ACTIVITY_CHANGED_SQL, summary_sql
+from error import ANY, COD, DATE, TABLE_SPECS, TEXT
+from filters import filter_index_sql, filtered_query
+from notifications import TRIGGER_FUNCTION_SQL, trigger_sql
+from paging import PAGE_SIZE, old_sort_index_sql, page_parts, page_sql, sort_index_sql
+from tables import TABLE_COLUMNS, TABLE_KEYS, key_filter
+
+# Таблица с номерами примененных изменений схемы
+MIGRATIONS_TABLE = 'public.schema_migrations'
+# Ключ блокировки, под которой изменения применяются: при одновременном запуске нескольких
+# рабочих мест схему обновляет одно, остальные ждут и находят изменения уже примененными
+MIGRATION_LOCK = 2024_0621
+# Команда построения индекса из filters.py, paging.py и этого модуля: имя индекса и определение
+_INDEX_RE = re.compile(r'CREATE INDEX IF NOT EXISTS (\w+) ')
+# Команды, которые нельзя выполнять в транзакции или которые не должны держать ее открытой
+_OUTSIDE_TRANSACTION = ('ANALYZE ', 'DROP INDEX CONCURRENTLY ')
+
+# Столбцы таблиц с типами. Таблицы создаются, только если их еще нет
+TABLE_DDL = {
+    'apartment': """
+        cod_num_hom varchar(20) NOT NULL,
+        adress varchar(125) NOT NULL,
+        year date NOT NULL,
+        num_of_flrs integer NOT NULL,
+        num_of_flts integer NOT NULL,
+        square numeric NOT NULL""",
+    'owner': """
+        uid varchar(10) NOT NULL,
+        fio varchar(50) NOT NULL,
+        ph_numb varchar(11) NOT NULL""",
+    'builder': """
+        inn_org varchar(12) NOT NULL,
+        name_of_org varchar(50) NOT NULL,
+        ph_numb varchar(11) NOT NULL,
+        adress varchar(125) NOT NULL""",
+    'repair_work': """
+        cod_rep_work varchar(12) NOT NULL,
+        type_of_work varchar(50) NOT NULL""",
+    'flat': """
+        cod_flt varchar(20) NOT NULL,
+        owner_uid varchar(10) NOT NULL,
+        aprtmt_uid varchar(20) NOT NULL,
+        nom_flt integer NOT NULL,
+        floor_flt integer NOT NULL,
+        square_flt numeric NOT NULL""",
+    'current_repair': """
+        cod_rep_work varchar(12) NOT NULL,
+        inn_org varchar(12) NOT NULL,
+        cod_num_hom varchar(20) NOT NULL,
+        name_of_work varchar(50) NOT NULL,
+        date_start date NOT NULL,
+        date_end date NOT NULL""",
+}
+
+# Внешние ключи: (таблица, столбец, справочная таблица, ее столбец). Запись справочника,
+# на которую есть ссылки, не удаляется (NO ACTION, как до появления этого модуля)
+FOREIGN_KEYS = [
+    ('flat', 'owner_uid', 'owner', 'uid'),
+    ('flat', 'aprtmt_uid', 'apartment', 'cod_num_hom'),
+    ('current_repair', 'cod_rep_work', 'repair_work', 'cod_rep_work'),
+    ('current_repair', 'inn_org', 'builder', 'inn_org'),
+    ('current_repair', 'cod_num_hom', 'apartment', 'cod_num_hom'),
+]
+
+
+def _tables_sql():
+    return [f"CREATE TABLE IF NOT EXISTS public.{table} ({columns},\n"
+            f"        PRIMARY KEY ({', '.join(TABLE_KEYS[table])}))"
+            for table, columns in TABLE_DDL.items()]
+
+
+def _constraints_sql():
+    # Для таблиц, созданных до этого модуля: первичный ключ и внешние ключи добавляются, если
+    # их нет. NOT VALID - уже имеющиеся строки не проверяются, чтобы старые данные не мешали
+    # запуску; новые и измененные строки проверяются
+    statements = []
+    for table, keys in TABLE_KEYS.items():
+        statements.append(f"""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                               WHERE conrelid = 'public.{table}'::regclass AND contype = 'p') THEN
+                    ALTER TABLE public.{table} ADD PRIMARY KEY ({', '.join(keys)});
+                END IF;
+            END $$""")
+    for table, column, referenced, referenced_column in FOREIGN_KEYS:
+        statements.append(f"""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_constraint AS c
+                               JOIN pg_attribute AS a ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+                               WHERE c.conrelid = 'public.{table}'::regclass AND c.contype = 'f'
+                                 AND a.attname = '{column}') THEN
+                    ALTER TABLE public.{table} ADD CONSTRAINT {table}_{column}_fkey FOREIGN KEY ({column})
+                        REFERENCES public.{referenced} ({referenced_column}) ON DELETE CASCADE NOT VALID;
+                END IF;
+            END $$""")
+    return statements
+
+
+def _no_cascade_sql():
+    # Изменение 2 добавляло внешние ключи с ON DELETE CASCADE: удаление дома удаляло его квартиры
+    # и ремонты. Такие ключи пересоздаются без каскада, прежнее поведение окон (удаление записи
+    # справочника, на которую есть ссылки, не проходит) возвращается
+    statements = []
+    for table, column, referenced, referenced_column in FOREIGN_KEYS:
+        statements.append(f"""
+            DO $$ BEGIN
+                IF EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = 'public.{table}'::regclass AND conname = '{table}_{column}_fkey'
+                             AND confdeltype = 'c') THEN
+                    ALTER TABLE public.{table} DROP CONSTRAINT {table}_{column}_fkey;
+                    ALTER TABLE public.{table} ADD CONSTRAINT {table}_{column}_fkey FOREIGN KEY ({column})
+                        REFERENCES public.{referenced} ({referenced_column}) NOT VALID;
+                END IF;
+            END $$""")
+    return statements
+
+
+def _foreign_key_indexes_sql():
+    # Индекс по ссылающемуся столбцу: без него проверка ссылок при удалении записи
+    # справочника читает всю таблицу. Столбец, с которого начинается
+    # первичный ключ, индекса не требует
+    return [f"CREATE INDEX IF NOT EXISTS {table}_{column}_fk ON public.{table} ({column})"
+            for table, column, _, _ in FOREIGN_KEYS if TABLE_KEYS[table][0] != column]
+
+
+def _filter_indexes_sql():
+    statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for table in TABLE_COLUMNS:
+        statements += filter_index_sql(table)
+    return statements
+
+
+def _sort_indexes_sql():
+    statements = []
+    for table in TABLE_COLUMNS:
+        statements += sort_index_sql(table)
+    return statements
+
+
+def _collated_sort_indexes_sql():
+    # Индексы сортировки изменения 5 строились с правилами сравнения базы, а окна сортируют
+    # строки с COLLATE "C": новые индексы строятся, прежние удаляются
+    statements = _sort_indexes_sql()
+    for table in TABLE_COLUMNS:
+        statements += old_sort_index_sql(table)
+    return statements
+
+
+def _triggers_sql():
+    return [TRIGGER_FUNCTION_SQL] + [trigger_sql(table) for table in TABLE_KEYS]
+
+
+def _analyze_sql():
+    return [f"ANALYZE public.{table}" for table in TABLE_COLUMNS]
+
+
+# Изменения схемы по порядку: (номер, название, функция, возвращающая команды). Примененное
+# изменение не меняется: исправления добавляются следующим номером. Команды индексов и
+# триггеров берутся из filters.py, paging.py и notifications.py и повторяемы (IF NOT EXISTS,
+# CREATE OR REPLACE): после их изменения добавляется изменение с той же функцией под новым номером
+MIGRATIONS = [
+    (1, 'таблицы', _tables_sql),
+    (2, 'первичные и внешние ключи', _constraints_sql),
+    (3, 'индексы внешних ключей', _foreign_key_indexes_sql),
+    (4, 'индексы фильтров', _filter_indexes_sql),
+    (5, 'индексы сортировки', _sort_indexes_sql),
+    (6, 'триггеры уведомлений', _triggers_sql),
+    (7, 'статистика планировщика', _analyze_sql),
+    (8, 'сводка по домам', summary_sql),
+    (9, 'метка окна в уведомлениях', _triggers_sql),
+    (10, 'внешние ключи без каскадного удаления', _no_cascade_sql),
+    (11, 'индексы сортировки по кодам символов', _collated_sort_indexes_sql),
+    (12, 'сводка по домам: новые дома и TRUNCATE', summary_sql),
+]
+
+
+def migrate(connection):
+    # Применяет недостающие изменения, каждое своей транзакцией; возвращает названия примененных.
+    # Запускается отдельно от приложения (python schema.py): построение индексов на заполненных
+    # таблицах занимает время. Индексы строятся CONCURRENTLY, вне транзакции, и не блокируют запись
+    cursor = connection.cursor()
+    connection.autocommit = True
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+        try:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+                           "version integer PRIMARY KEY, name text NOT NULL, "
+                           "applied_at timestamptz NOT NULL DEFAULT now())")
+            cursor.execute(f"SELECT version FROM {MIGRATIONS_TABLE}")
+            applied = {version for version, in cursor.fetchall()}
+            done = []
+            for version, name, statements in MIGRATIONS:
+                if version not in applied:
+                    _apply(connection, cursor, version, name, statements())
+                    done.append(name)
+            return done
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+    finally:
+        connection.autocommit = False
+        cursor.close()
+
+
+def _apply(connection, cursor, version, name, statements):
+    # Команды изменения выполняются одной транзакцией, кроме построения и удаления индексов
+    # и ANALYZE: они выполняются между транзакциями. Номер изменения записывается последним, поэтому
+    # прерванное изменение при следующем запуске повторяется (все команды повторяемы)
+    connection.autocommit = False
+    try:
+        for statement in statements:
+            index = _INDEX_RE.match(statement)
+            if index is None and not statement.startswith(_OUTSIDE_TRANSACTION):
+                cursor.execute(statement)
+                continue
+            connection.commit()
+            connection.autocommit = True
+            if index is not None:
+                _create_index_concurrently(cursor, index.group(1), statement[index.end():])
+            else:
+                cursor.execute(statement)
+            connection.autocommit = False
+        cursor.execute(f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (%s, %s)", (version, name))
+        connection.commit()
+    except Exception:
+        if not connection.autocommit:
+            connection.rollback()
+        raise
+    finally:
+        connection.autocommit = True
+
+
+def _create_index_concurrently(cursor, name, definition):
+    # Прерванное построение CONCURRENTLY оставляет неготовый индекс: IF NOT EXISTS его бы
+    # пропустил, поэтому такой индекс удаляется и строится заново
+    cursor.execute("SELECT NOT i.indisvalid FROM pg_index AS i JOIN pg_class AS c ON c.oid = i.indexrelid "
+                   "JOIN pg_namespace AS n ON n.oid = c.relnamespace "
+                   "WHERE n.nspname = 'public' AND c.relname = %s", (name,))
+    invalid = cursor.fetchone()
+    if invalid is not None and invalid[0]:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+    cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+
+def pending_migrations(task=None):
+    # Названия непримененных изменений; для BackgroundTask при запуске приложения
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (MIGRATIONS_TABLE,))
+        applied = set()
+        if cursor.fetchone()[0]:
+            cursor.execute(f"SELECT version FROM {MIGRATIONS_TABLE}")
+            applied = {version for version, in cursor.fetchall()}
+        connection.rollback()
+        cursor.close()
+    return [name for version, name, _ in MIGRATIONS if version not in applied]
+
+
+# Значения параметров для EXPLAIN по видам столбцов (таблицы могут быть пустыми)
+_SAMPLE_VALUES = {COD: '77:01:0000000:1', DATE: '2000-01-01', TEXT: 'абв', ANY: 'абв'}
+# Значения фильтров по видам столбцов (синтаксис см. FILTER_HELP)
+_SAMPLE_FILTERS = {COD: '77:01*', DATE: '2000-01-01..2000-12-31', TEXT: 'абв', ANY: 'абв'}
+
+
+def _sample(field):
+    if field.kind in _SAMPLE_VALUES:
+        return _SAMPLE_VALUES[field.kind]
+    # Числа и идентификаторы фиксированной длины
+    return '1' * (field.length if field.exact else 1)
+
+
+def window_queries():
+    # Запросы, которые выполняют окна: (описание, запрос, параметры). Поиск по началу
+    # неключевых чисел и дат (столбец::text LIKE) индексом не обслуживается и не проверяется
+    queries = []
+    for table, columns in TABLE_COLUMNS.items():
+        fields = {field.name: field for field in TABLE_SPECS[table]}
+        sample = {column: _sample(fields[column]) for column in columns}
+        keys = TABLE_KEYS[table]
+        key_values = tuple(sample[column] for column in keys)
+        condition, params = key_filter(table, [key_values])
+
+        queries.append((f'{table}: строки по ключам', f"SELECT * FROM public.{table} WHERE {condition}", params))
+        queries.append((f'{table}: изменение', f"UPDATE public.{table} SET {columns[-1]} = {columns[-1]} "
+                                                 f"WHERE {' AND '.join(f'{key} = %s' for key in keys)}", key_values))
+        queries.append((f'{table}: удаление', f"DELETE FROM public.{table} WHERE {condition}", params))
+
+        base = f"SELECT * FROM public.{table}"
+        for column in (None,) + tuple(column for column in columns if column != keys[0]):
+            for descending in (False, True):
+                order = f"{column or 'ключ'}{' по убыванию' if descending else ''}"
+                for part_condition, part_columns, _ in page_parts(table, column, descending):
+                    queries.append((f'{table}: первая страница, {order}',
+                                    page_sql(base, table, part_columns, descending, PAGE_SIZE, part_condition), []))
+                    queries.append((f'{table}: следующая страница, {order}',
+                                    page_sql(base, table, part_columns, descending, PAGE_SIZE, part_condition,
+                                             '<' if descending else '>'),
+                                    [sample[part_column] for part_column in part_columns]))
+
+        for field in TABLE_SPECS[table]:
+            text = _SAMPLE_FILTERS.get(field.kind, '1..10')
+            if field.kind not in _SAMPLE_FILTERS and field.exact:
+                text = sample[field.name][:3] + '*'
+            query, params = filtered_query(table, {field.name: text})
+            queries.append((f'{table}: фильтр {field.name} "{text}"', query, params))
+
+    for table, column, referenced, referenced_column in FOREIGN_KEYS:
+        field = next(field for field in TABLE_SPECS[table] if field.name == column)
+        queries.append((f'{table}.{column}: проверка ссылок при удалении из {referenced}',
+                        f"SELECT 1 FROM public.{table} WHERE {column} = %s", [_sample(field)]))
+        queries.append((f'{referenced}: проверка существования {referenced_column}',
+                        f"SELECT 1 FROM public.{referenced} WHERE {referenced_column} = %s FOR KEY SHARE",
+                        [_sample(field)]))
+
+    queries.append(('current_repair: дома, у которых начался или закончился ремонт (сводка по домам)',
+                     ACTIVITY_CHANGED_SQL, {'first': _SAMPLE_VALUES[DATE], 'last': _SAMPLE_VALUES[DATE]}))
+    return queries
+
+
+def _sequential_scans(plan):
+    # Таблицы приложения, которые план читает целиком
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in TABLE_COLUMNS:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found += _sequential_scans(child)
+    return found
+
+
+def check_indexes(connection):
+    # EXPLAIN каждого запроса окон при выключенном последовательном чтении: если план все
+    # равно читает таблицу целиком, подходящего индекса нет. Возвращает [(описание, таблицы)]
+    problems = []
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for description, query, params in window_queries():
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            tables = _sequential_scans(plan[0]['Plan'])
+            if tables:
+                problems.append((description, sorted(set(tables))))
+    finally:
+        # EXPLAIN без ANALYZE ничего не изменяет, но настройка действует только до конца транзакции
+        connection.rollback()
+        cursor.close()
+    return problems
+
+
+if __name__ == '__main__':
+    # Применение изменений схемы: python schema.py
+    # Проверка, что запросы окон используют индексы: python schema.py check
+    if len(sys.argv) > 1 and sys.argv[1] != 'check':
+        print('Использование: python schema.py [check]')
+        sys.exit(2)
+    try:
+        with pooled_connection() as db_connection:
+            applied_names = migrate(db_connection)
+            print('Применены изменения схемы: ' + ', '.join(applied_names) if applied_names
+                  else 'Схема базы данных актуальна')
+            if len(sys.argv) > 1:
+                check_problems = check_indexes(db_connection)
+                checked = len(window_queries())
+                for check_description, scanned in check_problems:
+                    print(f'Без индекса: {check_description} (читается целиком: {", ".join(scanned)})')
+                print(f'Проверено запросов: {checked}, без индекса: {len(check_problems)}')
+                sys.exit(1 if check_problems else 0)
+    except psycopg2.Error as db_error:
+        print(f'Ошибка базы данных: {db_error}')
+        sys.exit(1)
@@ -0,0 +1,324 @@
+import psycopg2
+from psycopg2.extras import execute_values
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtWidgets import QCheckBox, QHBoxLayout, QLabel, QMessageBox, QPushButton, QWidget
+
+from connection import pooled_connection
+from notifications import origin_sql
+from reference_cache import REFERENCE_TABLES, reference_cache
+from tables import TABLE_COLUMNS, TABLE_KEYS, key_filter, typed_row
+from workers import BackgroundTask, start_task
+
+# Сколько строк отправлять серверу одним запросом при применении изменений
+APPLY_PAGE_SIZE = 500
+# Сколько ошибок перечислять в сообщении после применения
+MAX_SHOWN_ERRORS = 10
+
+# Проверки, которые окна выполняют в запросе добавления и изменения, для пакетной записи:
+# соединение строки v со справочником, условие на ее значения и текст ошибки. Отсутствие
+# записи справочника проверяет внешний ключ (LEFT JOIN не отбрасывает такие строки)
+ROW_CHECKS = {
+    'flat': ("LEFT JOIN public.apartment AS a ON a.cod_num_hom = v.aprtmt_uid",
+             "(a.cod_num_hom IS NULL OR v.nom_flt <= a.num_of_flts AND v.floor_flt <= a.num_of_flrs "
+             "AND v.square_flt <= a.square)",
+             'Номер квартиры, этаж или площадь превышают значения дома'),
+}
+
+# Тексты ошибок нарушения ключей при пакетной записи, по имени ограничения (schema.py)
+CONSTRAINT_MESSAGES = {
+    'flat_pkey': 'Квартира с этим кадастровым номером уже есть в базе данных',
+    'flat_owner_uid_fkey': 'Владелеца квартиры с этим UID нет базе данных',
+    'flat_aprtmt_uid_fkey': 'МКД с этим кадастровым номером нет в базе данных',
+    'current_repair_pkey': 'Текущий ремонт с этим UID уже существует',
+    'current_repair_cod_rep_work_fkey': 'Ремонтной работы с этим кодом нет в базе данных',
+    'current_repair_inn_org_fkey': 'Строительной организации с таким ИНН нет в базе данных',
+    'current_repair_cod_num_hom_fkey': 'МКД с этим кадастровым номером нет в базе данных',
+}
+
+
+class EditBuffer(QObject):
+    # Отложенное сохранение: добавленные и измененные записи копятся в памяти, видны
+    # в таблице как несохраненные и записываются в базу одной транзакцией по apply().
+    # Число несохраненных записей
+    changed = pyqtSignal(int)
+    # Запись закончена: сколько записей отправлено и {ключ: текст ошибки} для несохраненных
+    applied = pyqtSignal(int, object)
+    # Транзакция не прошла целиком (например, нет соединения с базой)
+    apply_failed = pyqtSignal(str)
+
+    def __init__(self, model, table, origin=None, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.table = table
+        # Метка изменений окна (notifications.origin_sql)
+        self.origin = origin
+        self.enabled = False
+        # ключ -> строка в том виде, в каком она уйдет в базу
+        self._inserts = {}
+        self._updates = {}
+        # ключ -> строка до изменения, чтобы вернуть ее при отмене
+        self._originals = {}
+        # Фоновая запись в базу, пока она идет
+        self._task = None
+        # Добавленных записей нет в базе, после перезагрузки таблицы показываем их снова
+        model.loaded.connect(self._restore_inserts)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def pending_count(self):
+        return len(self._inserts) + len(self._updates)
+
+    def stage_insert(self, row):
+        # Значения приводятся к типам столбцов: строка сравнивается с загруженными при сортировке
+        row = typed_row(self.table, row)
+        key = self.model.key_of(row)
+        self._remember_original(key)
+        self._inserts[key] = row
+        self.model.set_pending(row)
+        self.changed.emit(self.pending_count())
+
+    def stage_update(self, row):
+        row = typed_row(self.table, row)
+        key = self.model.key_of(row)
+        if key in self._inserts:
+            # Правка еще не сохраненной записи просто заменяет добавляемую строку
+            self._inserts[key] = row
+        else:
+            self._remember_original(key)
+            self._updates[key] = row
+        self.model.set_pending(row)
+        self.changed.emit(self.pending_count())
+
+    def discard(self):
+        self.model.clear_pending(list(self._inserts) + list(self._updates))
+        self.model.remove_rows(self._inserts)
+        for row in self._originals.values():
+            self.model.update_row(row)
+        self._inserts.clear()
+        self._updates.clear()
+        self._originals.clear()
+        self.changed.emit(0)
+
+    def is_applying(self):
+        return self._task is not None
+
+    def apply(self):
+        # Записывает все изменения одной транзакцией в фоновом потоке. Если пакетная запись
+        # не прошла, строки повторяются по одной (каждая под своей точкой сохранения), чтобы
+        # сохранить остальные и сообщить, какие именно не прошли. По окончании - сигнал applied
+        # с {ключ: текст ошибки}; эти записи остаются в буфере
+        if self._task is not None:
+            return
+        inserts = dict(self._inserts)
+        updates = dict(self._updates)
+        task = BackgroundTask(self._write, list(inserts.values()), list(updates.values()))
+        task.signals.finished.connect(lambda result: self._finish_apply(inserts, updates, result))
+        task.signals.failed.connect(self._fail_apply)
+        self._task = task
+        self.changed.emit(self.pending_count())
+        start_task(task)
+
+    def _write(self, task, inserts, updates):
+        # Выполняется в фоновом потоке
+        with pooled_connection() as connection:
+            task.watch(connection)
+            try:
+                cursor = connection.cursor()
+                try:
+                    saved, failed = self._write_batch(cursor, inserts, updates)
+                except psycopg2.Error:
+                    connection.rollback()
+                    saved, failed = self._write_each(cursor, inserts, updates)
+                connection.commit()
+                cursor.close()
+            finally:
+                task.watch(None)
+        return saved, failed
+
+    def _finish_apply(self, inserts, updates, result):
+        self._task = None
+        saved, failed = result
+        saved_keys = [self.model.key_of(row) for row in saved]
+        for key in saved_keys:
+            # Запись, измененная еще раз во время сохранения, остается в буфере изменением
+            staged = self._inserts.get(key, self._updates.get(key))
+            if staged is not None and staged not in (inserts.get(key), updates.get(key)):
+                self._inserts.pop(key, None)
+                self._updates[key] = staged
+                continue
+            self._inserts.pop(key, None)
+            self._updates.pop(key, None)
+            self._originals.pop(key, None)
+            self.model.clear_pending([key])
+        for row in saved:
+            if not self.model.is_pending(self.model.key_of(row)):
+                self.model.update_row(row)
+        if self.table in REFERENCE_TABLES:
+            for key in saved_keys:
+                reference_cache.invalidate(self.table, key[0])
+        self.changed.emit(self.pending_count())
+        self.applied.emit(len(inserts) + len(updates), failed)
+
+    def _fail_apply(self, message):
+        self._task = None
+        self.changed.emit(self.pending_count())
+        self.apply_failed.emit(message)
+
+    def _remember_original(self, key):
+        if key in self._originals:
+            return
+        row_index = self.model.find_row(key)
+        if row_index != -1:
+            self._originals[key] = self.model.row(row_index)
+
+    def _check_sql(self):
+        # Соединение со справочником и условие проверки строки v (ROW_CHECKS)
+        check = ROW_CHECKS.get(self.table)
+        return (check[0], check[1]) if check is not None else ('', 'true')
+
+    def _insert_sql(self):
+        columns = ', '.join(TABLE_COLUMNS[self.table])
+        join, condition = self._check_sql()
+        # Метка окна уходит в том же запросе, что и изменение (и ставится заново после отката)
+        return (origin_sql(self.origin) + f"INSERT INTO public.{self.table} ({columns}) "
+                f"SELECT {', '.join(f'v.{column}' for column in TABLE_COLUMNS[self.table])} "
+                f"FROM (VALUES %s) AS v ({columns}) {join} WHERE {condition} RETURNING *")
+
+    def _update_sql(self):
+        keys = TABLE_KEYS[self.table]
+        values = [column for column in TABLE_COLUMNS[self.table] if column not in keys]
+        join, condition = self._check_sql()
+        return (origin_sql(self.origin) + f"UPDATE public.{self.table} AS t SET {', '.join(f'{column} = v.{column}' for column in values)} "
+                f"FROM (VALUES %s) AS v ({', '.join(TABLE_COLUMNS[self.table])}) {join} "
+                f"WHERE {' AND '.join(f't.{key} = v.{key}' for key in keys)} AND {condition} RETURNING t.*")
+
+    def _write_batch(self, cursor, inserts, updates):
+        saved = []
+        failed = {}
+        if inserts:
+            rows = execute_values(cursor, self._insert_sql(), inserts, page_size=APPLY_PAGE_SIZE, fetch=True)
+            saved += rows
+            failed.update(self._rejected(cursor, inserts, rows, False))
+        if updates:
+            rows = execute_values(cursor, self._update_sql(), updates, page_size=APPLY_PAGE_SIZE, fetch=True)
+            saved += rows
+            failed.update(self._rejected(cursor, updates, rows, True))
+        return saved, failed
+
+    def _write_each(self, cursor, inserts, updates):
+        saved = []
+        failed = {}
+        statements = [(self._insert_sql(), row, False) for row in inserts]
+        statements += [(self._update_sql(), row, True) for row in updates]
+        for sql, row, update in statements:
+            cursor.execute("SAVEPOINT staged_row")
+            try:
+                rows = execute_values(cursor, sql, [row], fetch=True)
+            except psycopg2.Error as error:
+                cursor.execute("ROLLBACK TO SAVEPOINT staged_row")
+                failed[self.model.key_of(row)] = _error_message(error)
+                continue
+            cursor.execute("RELEASE SAVEPOINT staged_row")
+            saved += rows
+            failed.update(self._rejected(cursor, [row], rows, update))
+        return saved, failed
+
+    def _rejected(self, cursor, rows, written, update):
+        # {ключ: текст ошибки} для строк, которых нет среди записанных: изменяемой строки
+        # нет в базе или строка не прошла проверку ROW_CHECKS
+        keys = {self.model.key_of(row) for row in rows} - {self.model.key_of(row) for row in written}
+        if not keys:
+            return {}
+        check = ROW_CHECKS.get(self.table)
+        existing = set()
+        if update and check is not None:
+            condition, params = key_filter(self.table, list(keys))
+            cursor.execute(f"SELECT {', '.join(TABLE_KEYS[self.table])} FROM public.{self.table} "
+                           f"WHERE {condition}", params)
+            existing = {tuple(str(value) for value in key) for key in cursor.fetchall()}
+        return {key: check[2] if check is not None and (key in existing or not update)
+                else 'Запись не найдена в базе данных' for key in keys}
+
+    def _restore_inserts(self):
+        for row in self._inserts.values():
+            self.model.insert_row(row)
+
+
+def _error_message(error):
+    return CONSTRAINT_MESSAGES.get(error.diag.constraint_name) or error.diag.message_primary or str(error)
+
+
+class EditBufferBar(QWidget):
+    # Переключатель отложенного сохранения и кнопки "Применить"/"Отменить" для окна таблицы
+    def __init__(self, buffer, parent=None):
+        super().__init__(parent)
+        self.buffer = buffer
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.chk_enabled = QCheckBox("Отложенное сохранение")
+        self.chk_enabled.toggled.connect(buffer.set_enabled)
+        layout.addWidget(self.chk_enabled)
+
+        self.lbl_pending = QLabel()
+        layout.addWidget(self.lbl_pending)
+        layout.addStretch()
+
+        self.btn_apply = QPushButton("Применить изменения")
+        self.btn_apply.clicked.connect(self.apply)
+        layout.addWidget(self.btn_apply)
+
+        self.btn_discard = QPushButton("Отменить изменения")
+        self.btn_discard.clicked.connect(self.discard)
+        layout.addWidget(self.btn_discard)
+
+        self.setLayout(layout)
+        buffer.changed.connect(self.on_changed)
+        buffer.applied.connect(self.on_applied)
+        buffer.apply_failed.connect(self.on_apply_failed)
+        self.on_changed(0)
+
+    def on_changed(self, count):
+        applying = self.buffer.is_applying()
+        if applying:
+            self.lbl_pending.setText("Сохранение изменений...")
+        else:
+            self.lbl_pending.setText(f"Несохраненных записей: {count}" if count else "")
+        self.btn_apply.setEnabled(count > 0 and not applying)
+        self.btn_discard.setEnabled(count > 0 and not applying)
+
+    def apply(self):
+        self.buffer.apply()
+
+    def on_apply_failed(self, message):
+        QMessageBox.warning(self, 'Ошибка', f'Ошибка при сохранении изменений в базе данных:\n{message}')
+
+    def on_applied(self, count, failed):
+        if failed:
+            details = '\n'.join(f"{', '.join(key)}: {message}"
+                                for key, message in list(failed.items())[:MAX_SHOWN_ERRORS])
+            QMessageBox.warning(self, 'Ошибка', f'Сохранено записей: {count - len(failed)}\n'
+                                                f'Не удалось сохранить: {len(failed)}\n\n{details}')
+        else:
+            QMessageBox.information(self, 'Успех', f'Изменения сохранены ({count})')
+
+    def discard(self):
+        reply = QMessageBox.question(self, 'Подтверждение',
+                                     f'Отменить несохраненные изменения ({self.buffer.pending_count()})?',
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.buffer.discard()
+
+    def confirm_close(self):
+        # False, если пользователь передумал закрывать окно с несохраненными изменениями
+        if not self.buffer.pending_count():
+            return True
+        reply = QMessageBox.question(self, 'Подтверждение',
+                                     f'Есть несохраненные изменения ({self.buffer.pending_count()}). '
+                                     f'Закрыть окно без сохранения?',
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
+        return reply == QMessageBox.StandardButton.Yes
@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from PyQt6.QtCore import QObject, Qt, QTimer, pyqtSignal
+
+from query_log import Histogram
+
+# Период контрольного таймера в потоке интерфейса (мс)
+HEARTBEAT_MS = 50
+# Цикл событий, не обработавший таймер дольше этого времени (мс), считается зависшим
+STALL_THRESHOLD_MS = 200
+# Как часто снимать стек потока интерфейса во время зависания (мс)
+SAMPLE_INTERVAL_MS = 10
+# Файл со стеками зависаний в свернутом формате (flamegraph.pl, speedscope, inferno)
+FOLDED_PATH = 'ui_stalls.folded'
+
+
+def folded_stack(frame):
+    # Стек от корня к вершине: "файл:функция;файл:функция;..."
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StallWatchdog(QObject):
+    # Сторож цикла событий. Таймер в потоке интерфейса отмечает каждое свое срабатывание,
+    # отдельный поток проверяет отметку: если ее не было дольше порога, значит поток интерфейса
+    # занят (долгий запрос, разбор строк и т.п.), и его стек снимается каждые SAMPLE_INTERVAL_MS.
+    # Каждому снимку приписывается время с предыдущего (первому - с пропущенного срабатывания таймера),
+    # одинаковые стеки суммируются; после каждого зависания файл FOLDED_PATH перезаписывается,
+    # число в строке - миллисекунды.
+    # Опоздание таймера (задержка цикла событий) копится в гистограмме.
+    # Модальные окна (QMessageBox) крутят свой цикл событий и зависанием не считаются
+
+    # Зависание закончилось: длительность (мс) и стек, снятый чаще других
+    stalled = pyqtSignal(float, str)
+
+    def __init__(self, path=FOLDED_PATH, threshold_ms=STALL_THRESHOLD_MS, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.latency = Histogram()
+        self.stall_count = 0
+        self._stacks = Counter()
+        self._stall_stacks = Counter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._main_thread = threading.main_thread().ident
+        self._last_beat = time.monotonic()
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(HEARTBEAT_MS)
+        self._timer.timeout.connect(self._beat)
+        self._thread = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._timer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stopping.set()
+        self._thread.join()
+        self.write()
+
+    def write(self):
+        with self._lock:
+            lines = [f'{stack} {count}\n' for stack, count in self._stacks.most_common()]
+        with open(self.path, 'w', encoding='utf-8') as folded:
+            folded.writelines(lines)
+
+    def _beat(self):
+        now = time.monotonic()
+        with self._lock:
+            late = now - self._last_beat - HEARTBEAT_MS / 1000
+            self._last_beat = now
+            stall_stacks, self._stall_stacks = self._stall_stacks, Counter()
+        self.latency.add(max(late, 0) * 1000)
+        if late >= self.threshold:
+            self.stall_count += 1
+            top = stall_stacks.most_common(1)[0][0] if stall_stacks else ''
+            self.stalled.emit(late * 1000, top)
+
+    def _watch(self):
+        # Время предыдущего снимка текущего зависания (None - зависания нет)
+        sampled = None
+        while not self._stopping.wait(SAMPLE_INTERVAL_MS / 1000):
+            now = time.monotonic()
+            with self._lock:
+                last_beat = self._last_beat
+            if now - last_beat - HEARTBEAT_MS / 1000 < self.threshold:
+                if sampled is not None:
+                    sampled = None
+                    self.write()
+                continue
+            frame = sys._current_frames().get(self._main_thread)
+            if frame is None:
+                continue
+            stack = folded_stack(frame)
+            del frame
+            weight = max(1, round((now - (sampled if sampled is not None else last_beat + HEARTBEAT_MS / 1000)) * 1000))
+            sampled = now
+            with self._lock:
+                self._stacks[stack] += weight
+                self._stall_stacks[stack] += weight
+
+
+def start_watchdog(app):
+    # Сторож на все время работы приложения; о зависаниях пишет в stderr
+    watchdog = StallWatchdog(parent=app)
+    watchdog.stalled.connect(lambda ms, stack: print(
+        f'Интерфейс не отвечал {ms:.0f} мс: {" <- ".join(reversed(stack.split(";")[-3:]))}', file=sys.stderr))
+    app.aboutToQuit.connect(watchdog.stop)
+    watchdog.start()
+    return watchdog
+
+
+if __name__ == '__main__':
+    # Самые частые стеки зависаний: python stall_watchdog.py [файл] [кол-во]
+    path = sys.argv[1] if len(sys.argv) > 1 else FOLDED_PATH
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    stacks = []
+    with open(path, encoding='utf-8') as folded:
+        for line in folded:
+            stack, count = line.rstrip('\n').rsplit(' ', 1)
+            stacks.append((int(count), stack))
+    for count, stack in sorted(stacks, reverse=True)[:limit]:
+        print(f'{count:8} мс  {" <- ".join(reversed(stack.split(";")[-4:]))}')
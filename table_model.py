@@ -0,0 +1,491 @@
+import gc
+import time
+from contextlib import contextmanager
+from functools import partial
+from operator import itemgetter
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QAbstractItemView, QTableView
+from connection import RowStream
+from local_index import LocalIndex
+from paging import PageStream, ordered_query
+from query_log import query_log
+from tables import TABLE_COLUMNS
+from workers import BackgroundTask, start_task
+
+# Сколько строк просматривать при подгонке ширины столбцов
+RESIZE_PRECISION = 200
+# Цвет строк с несохраненными изменениями
+PENDING_COLOR = QColor(255, 243, 205)
+# Для таблиц больше этого размера индекс загруженных строк не строится, фильтр выполняет сервер
+LOCAL_INDEX_MAX_ROWS = 300_000
+
+
+@contextmanager
+def _gc_paused():
+    # Порция строк и индекс - десятки тысяч новых объектов: без паузы сборщик мусора запускает
+    # на них проходы поколений посреди добавления. Отключение действует только на время блока
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class TableModel(QAbstractTableModel):
+    # Модель хранит строки как кортежи из курсора, без виджетов на каждую ячейку.
+    # Текст ячейки формируется только когда представление запрашивает data().
+    # Строки читаются в фоновом потоке, модель получает их сигналами.
+
+    # Ошибка загрузки строк (fetchMore вызывается представлением, а не окном)
+    load_failed = pyqtSignal(str)
+    # Идет ли сейчас запрос к серверу
+    loading_changed = pyqtSignal(bool)
+    # Первая порция строк после load() получена
+    loaded = pyqtSignal()
+
+    def __init__(self, headers, key_columns=(0,), parent=None):
+        super().__init__(parent)
+        self._headers = list(headers)
+        # Номера столбцов первичного ключа: по ним находятся строки для точечного обновления
+        self._key_columns = tuple(key_columns)
+        self._rows = []
+        # Номер строки по ключу, строится лениво и сбрасывается при вставке/удалении
+        self._key_index = None
+        # Порядок строк, который нужно сохранять при вставке (столбец, по убыванию)
+        self._sort_column = None
+        self._sort_descending = False
+        # Порядок, в котором строки получены при загрузке (в нем же их хранит индекс)
+        self._loaded_order = (None, False)
+        self._stream = None
+        self._task = None
+        self._first_chunk = False
+        # Строки с несохраненными изменениями по ключу: показываются вместо строк из базы
+        self._pending = {}
+        # Запрос, результат которого сейчас показан (для выгрузки тех же строк)
+        self._query = None
+        self._params = None
+        # Индекс загруженных строк для фильтра без запроса к серверу (см. enable_local_index)
+        self._index_fields = None
+        self._local_index = None
+        # Условия фильтра по загруженным строкам и равносильный ему запрос; пока фильтр
+        # включен, _rows содержит только подходящие строки, а все строки хранит индекс
+        self._local_filter = None
+        self._local_query = None
+        # Таблица базы, строки которой загружаются страницами в порядке сортировки (см. enable_paging),
+        # и начало ключа строки, с которой начата загрузка ("перейти к ключу")
+        self._table = None
+        self._start_key = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(self._rows[index.row()][index.column()])
+        if role == Qt.ItemDataRole.BackgroundRole and self._pending:
+            if self.key_of(self._rows[index.row()]) in self._pending:
+                return PENDING_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self._headers[section]
+        if self._pending and self.key_of(self._rows[section]) in self._pending:
+            return f'* {section + 1}'
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._task is not None:
+            return False
+        return self._stream is not None and not self._stream.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._start_fetch(self._stream)
+
+    def set_rows(self, rows):
+        self.close_stream()
+        self.beginResetModel()
+        self._rows = rows if isinstance(rows, list) else list(rows)
+        self._key_index = None
+        self._local_filter = None
+        self._local_query = None
+        self._start_key = None
+        self._loaded_order = (self._sort_column, self._sort_descending)
+        if self._index_fields is not None:
+            self._local_index = LocalIndex(self._index_fields, self.key_of)
+            self._index_rows(self._rows)
+            self._prepare_index()
+        self.endResetModel()
+
+    def load(self, query, params=None, start_key=None):
+        # Незавершенная загрузка отменяется, первая порция новой запрашивается в фоне.
+        # start_key - начало ключа строки, с которой начать (только при enable_paging)
+        self.set_rows([])
+        self._query = query
+        self._params = params
+        self._start_key = start_key
+        self._first_chunk = True
+        self._start_fetch(None, query, params)
+
+    def enable_paging(self, table):
+        # Строки таблицы table загружаются страницами в порядке сортировки окна (paging.py)
+        self._table = table
+
+    def key_columns(self):
+        return self._key_columns
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # Вызывается представлением при щелчке по заголовку; column=-1 - порядок по ключу.
+        # Если все строки запроса уже загружены, они переставляются на месте, иначе
+        # загрузка начинается заново с ORDER BY на сервере
+        column = column if column >= 0 else None
+        descending = order == Qt.SortOrder.DescendingOrder
+        if (column, descending) == (self._sort_column, self._sort_descending):
+            return
+        self._sort_column = column
+        self._sort_descending = descending
+        if self.all_rows_loaded() and len(self._rows) <= LOCAL_INDEX_MAX_ROWS:
+            self.beginResetModel()
+            self._rows.sort(key=self._sort_key, reverse=descending)
+            self._key_index = None
+            self.endResetModel()
+        elif self._query is not None:
+            self.load(self._query, self._params)
+
+    def jump_to(self, key):
+        # Номер показанной строки с этим началом ключа (-1, если ее нет), если все строки уже
+        # загружены. Иначе загрузка начинается заново с этой строки и возвращается None
+        key = tuple(str(value) for value in key)
+        if self.all_rows_loaded() or self._table is None or self._query is None:
+            if len(key) == len(self._key_columns):
+                return self.find_row(key)
+            for row_index, row in enumerate(self._rows):
+                if self.key_of(row)[:len(key)] == key:
+                    return row_index
+            return -1
+        self.load(self._query, self._params, start_key=key)
+        return None
+
+    def all_rows_loaded(self):
+        # Загружены все строки запроса, а не часть, начатая с "перейти к ключу"
+        if self._task is not None or self._first_chunk or self._start_key is not None:
+            return False
+        return self._stream is None or self._stream.exhausted
+
+    def current_query(self):
+        # Запрос, возвращающий показанные строки в порядке окна, с учетом фильтра по загруженным строкам
+        query, params = self._local_query if self._local_filter is not None else (self._query, self._params)
+        if self._table is not None and query is not None:
+            column = TABLE_COLUMNS[self._table][self._sort_column] if self._sort_column is not None else None
+            query = ordered_query(self._table, query, column, self._sort_descending)
+        return query, params
+
+    def source_query(self):
+        # Запрос, которым строки загружены с сервера
+        return self._query, self._params
+
+    def enable_local_index(self, fields):
+        # fields - правила столбцов из error.TABLE_SPECS. Индекс строится по мере загрузки строк
+        self._index_fields = tuple(fields)
+        self._local_index = LocalIndex(self._index_fields, self.key_of)
+        self._index_rows(self._rows)
+
+    def local_filter_available(self):
+        # Все строки запроса загружены и проиндексированы
+        return self._local_index is not None and self.all_rows_loaded()
+
+    def set_local_filter(self, values, query=None, params=None):
+        # Показывает только загруженные строки, подходящие под значения полей фильтра
+        # {столбец: текст} (условия те же, что в filters.py). query и params - тот же фильтр
+        # в виде запроса, для выгрузки показанных строк. ValueError, если значение неверно
+        conditions = self._local_index.compile(values)
+        rows = self._local_index.search(conditions)
+        if (self._sort_column, self._sort_descending) != self._loaded_order:
+            rows.sort(key=self._sort_key, reverse=self._sort_descending)
+        self.beginResetModel()
+        self._rows = rows
+        self._key_index = None
+        self._local_filter = conditions or None
+        self._local_query = (query, params) if conditions else None
+        self.endResetModel()
+
+    def _index_rows(self, rows):
+        if self._local_index is None or not rows:
+            return
+        if len(self._local_index) + len(rows) > LOCAL_INDEX_MAX_ROWS:
+            # Индекс больших таблиц занимал бы слишком много памяти
+            self._local_index = None
+            return
+        self._local_index.add_rows(rows)
+
+    def _prepare_index(self):
+        # Вызывается, когда загружены все строки
+        if self._local_index is None:
+            return
+        with _gc_paused():
+            self._local_index.prepare()
+
+    def _filter_accepts(self, row):
+        return self._local_filter is None or self._local_index.matches(self._local_filter, row)
+
+    def is_loading(self):
+        return self._task is not None
+
+    def close_stream(self):
+        if self._task is not None:
+            # Поток строк занят фоновой задачей, она сама закроет его после отмены
+            self._task.cancel()
+            self._task = None
+            self.loading_changed.emit(False)
+        elif self._stream is not None:
+            self._stream.close()
+        self._stream = None
+
+    def _start_fetch(self, stream, query=None, params=None):
+        open_stream = None
+        if stream is None:
+            if self._table is None:
+                open_stream = partial(RowStream, query, params)
+            else:
+                column = TABLE_COLUMNS[self._table][self._sort_column] if self._sort_column is not None else None
+                open_stream = partial(PageStream, query, params, self._table, column, self._sort_descending,
+                                      self._start_key)
+        task = BackgroundTask(_fetch_chunk, stream, open_stream)
+        task.signals.finished.connect(lambda result, task=task: self._chunk_loaded(task, result))
+        task.signals.failed.connect(lambda message, task=task: self._chunk_failed(task, message))
+        task.signals.cancelled.connect(lambda task=task: self._chunk_failed(task, None))
+        self._task = task
+        self.loading_changed.emit(True)
+        start_task(task)
+
+    def _chunk_loaded(self, task, result):
+        stream, rows = result
+        if task is not self._task:
+            # Результат отмененной загрузки
+            stream.close()
+            return
+        self._task = None
+        self._stream = stream
+        # Время показа строк попадает в замеры запросов рядом со временем их получения
+        start = time.perf_counter()
+        self.append_rows(rows)
+        query_log.record_render(stream.query, len(rows), time.perf_counter() - start)
+        if stream.exhausted:
+            self._prepare_index()
+        self.loading_changed.emit(False)
+        if self._first_chunk:
+            self._first_chunk = False
+            self.loaded.emit()
+
+    def _chunk_failed(self, task, message):
+        if task is not self._task:
+            return
+        self._task = None
+        self._stream = None
+        self.loading_changed.emit(False)
+        if message is not None:
+            self.load_failed.emit(message)
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        with _gc_paused():
+            self._append_rows(rows)
+
+    def _append_rows(self, rows):
+        if self._table is not None and self._rows:
+            # Строка, вставленная или измененная после загрузки предыдущей страницы, уже показана
+            rows = [row for row in rows if self.find_row(self.key_of(row)) == -1]
+            if not rows:
+                return
+        if self._pending:
+            rows = [self._pending.get(self.key_of(row), row) for row in rows]
+        self._index_rows(rows)
+        if self._local_filter is not None:
+            rows = [row for row in rows if self._filter_accepts(row)]
+            if not rows:
+                return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        if self._key_index is not None:
+            for row_index in range(first, len(self._rows)):
+                self._key_index[self.key_of(self._rows[row_index])] = row_index
+        self.endInsertRows()
+
+    def key_of(self, row):
+        return tuple(str(row[column]) for column in self._key_columns)
+
+    def find_row(self, key):
+        # key - кортеж значений ключевых столбцов (сравниваются как строки)
+        if self._key_index is None:
+            # Ключи собираются по столбцам, без вызова key_of для каждой строки
+            keys = zip(*(map(str, map(itemgetter(column), self._rows)) for column in self._key_columns))
+            self._key_index = dict(zip(keys, range(len(self._rows))))
+        return self._key_index.get(tuple(str(value) for value in key), -1)
+
+    def insert_row(self, row):
+        # Строка, возвращенная INSERT ... RETURNING *; уже показанная строка просто обновляется
+        row = tuple(row)
+        if self.find_row(self.key_of(row)) != -1:
+            self.update_row(row)
+            return
+        if self._local_index is not None:
+            self._local_index.update_row(row)
+        # Строка, скрытая фильтром по загруженным строкам, только попадает в индекс
+        if not self._filter_accepts(row):
+            return
+        position = self._insert_position(row)
+        if position == len(self._rows) and self._table is not None and not self.all_rows_loaded():
+            # Строка после последней загруженной придет со следующей страницей
+            return
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.insert(position, row)
+        if position == len(self._rows) - 1 and self._key_index is not None:
+            self._key_index[self.key_of(row)] = position
+        else:
+            self._key_index = None
+        self.endInsertRows()
+
+    def update_row(self, row):
+        # Строка, возвращенная UPDATE ... RETURNING *
+        row = tuple(row)
+        row_index = self.find_row(self.key_of(row))
+        if row_index == -1:
+            self.insert_row(row)
+            return
+        if self._local_index is not None:
+            self._local_index.update_row(row)
+        if not self._filter_accepts(row):
+            self._remove_shown([row_index])
+            return
+        self._rows[row_index] = row
+        self.dataChanged.emit(self.index(row_index, 0), self.index(row_index, self.columnCount() - 1))
+
+    def remove_rows(self, keys):
+        if self._local_index is not None:
+            self._local_index.remove_rows(keys)
+        self._remove_shown({self.find_row(key) for key in keys} - {-1})
+
+    def _remove_shown(self, row_indexes):
+        row_indexes = sorted(row_indexes, reverse=True)
+        if not row_indexes:
+            return
+        # Удаляем подряд идущие строки одним диапазоном, начиная с конца таблицы
+        start = end = row_indexes[0]
+        for row_index in row_indexes[1:] + [None]:
+            if row_index is not None and row_index == start - 1:
+                start = row_index
+                continue
+            self.beginRemoveRows(QModelIndex(), start, end)
+            del self._rows[start:end + 1]
+            self.endRemoveRows()
+            if row_index is not None:
+                start = end = row_index
+        self._key_index = None
+
+    def set_pending(self, row):
+        # Строка показывается как несохраненная, в том числе после перезагрузки таблицы
+        row = tuple(row)
+        key = self.key_of(row)
+        self._pending[key] = row
+        self.update_row(row)
+        self._pending_changed(key)
+
+    def clear_pending(self, keys):
+        for key in keys:
+            if self._pending.pop(tuple(str(value) for value in key), None) is not None:
+                self._pending_changed(key)
+
+    def is_pending(self, key):
+        return tuple(str(value) for value in key) in self._pending
+
+    def _pending_changed(self, key):
+        row_index = self.find_row(key)
+        if row_index != -1:
+            self.dataChanged.emit(self.index(row_index, 0), self.index(row_index, self.columnCount() - 1))
+            self.headerDataChanged.emit(Qt.Orientation.Vertical, row_index, row_index)
+
+    def _sort_key(self, row):
+        # Порядок строк как в ORDER BY окна: столбец сортировки, затем ключ
+        key = [_sort_value(row[column]) for column in self._key_columns]
+        if self._sort_column is not None:
+            key.insert(0, _sort_value(row[self._sort_column]))
+        return key
+
+    def _insert_position(self, row):
+        if self._sort_column is None and self._table is None:
+            return len(self._rows)
+        # Строки в модели уже упорядочены, место для новой ищем двоичным поиском
+        value = self._sort_key(row)
+        low, high = 0, len(self._rows)
+        while low < high:
+            middle = (low + high) // 2
+            current = self._sort_key(self._rows[middle])
+            if (current > value) if self._sort_descending else (current < value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def row(self, row_index):
+        return self._rows[row_index]
+
+    def text(self, row_index, column):
+        return str(self._rows[row_index][column])
+
+
+def _sort_value(value):
+    # NULL сортируется последним, как в PostgreSQL при ORDER BY ... ASC. Строки сравниваются
+    # по кодам символов, как на сервере (paging._collated)
+    return (value is None, value if value is not None else 0)
+
+
+def _fetch_chunk(task, stream, open_stream):
+    # Выполняется в фоновом потоке
+    if stream is None:
+        stream = open_stream()
+    task.watch(stream)
+    rows = stream.fetch()
+    if task.is_cancelled:
+        stream.close()
+    return stream, rows
+
+
+def create_table_view(model):
+    table = QTableView()
+    table.setModel(model)
+    table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+    # Несколько строк выделяются через Ctrl/Shift, например для удаления одним запросом
+    table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+    # Ширина столбцов считается по первым строкам, а не по всей таблице
+    table.horizontalHeader().setResizeContentsPrecision(RESIZE_PRECISION)
+    table.verticalHeader().setResizeContentsPrecision(RESIZE_PRECISION)
+    # Щелчок по заголовку столбца сортирует строки (TableModel.sort), третий щелчок
+    # возвращает порядок по ключу
+    header = table.horizontalHeader()
+    header.setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+    header.setSortIndicatorClearable(True)
+    table.setSortingEnabled(True)
+    return table
+
+
+def selected_row_numbers(table):
+    # Номера выделенных строк представления по возрастанию
+    return sorted(index.row() for index in table.selectionModel().selectedRows())
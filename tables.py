@@ -0,0 +1,44 @@
+from datetime import date
+from decimal import Decimal
+
+# Описание таблиц базы: столбцы в порядке SELECT * и столбцы первичного ключа
+TABLE_COLUMNS = {
+    'apartment': ('cod_num_hom', 'adress', 'year', 'num_of_flrs', 'num_of_flts', 'square'),
+    'flat': ('cod_flt', 'owner_uid', 'aprtmt_uid', 'nom_flt', 'floor_flt', 'square_flt'),
+    'owner': ('uid', 'fio', 'ph_numb'),
+    'builder': ('inn_org', 'name_of_org', 'ph_numb', 'adress'),
+    'repair_work': ('cod_rep_work', 'type_of_work'),
+    'current_repair': ('cod_rep_work', 'inn_org', 'cod_num_hom', 'name_of_work', 'date_start', 'date_end'),
+}
+
+TABLE_KEYS = {
+    'apartment': ('cod_num_hom',),
+    'flat': ('cod_flt',),
+    'owner': ('uid',),
+    'builder': ('inn_org',),
+    'repair_work': ('cod_rep_work',),
+    'current_repair': ('cod_rep_work', 'inn_org', 'cod_num_hom'),
+}
+
+# Столбцы нестроковых типов (schema.TABLE_DDL) и типы Python, в которых их возвращает psycopg2
+COLUMN_TYPES = {
+    'apartment': {'year': date.fromisoformat, 'num_of_flrs': int, 'num_of_flts': int, 'square': Decimal},
+    'flat': {'nom_flt': int, 'floor_flt': int, 'square_flt': Decimal},
+    'current_repair': {'date_start': date.fromisoformat, 'date_end': date.fromisoformat},
+}
+
+
+def typed_row(table, row):
+    # Строка из полей ввода с значениями тех же типов, что у строк, прочитанных из базы.
+    # Значения должны быть уже проверены (error.validate_record)
+    types = COLUMN_TYPES.get(table, {})
+    return tuple(types[column](value) if column in types and isinstance(value, str) else value
+                 for column, value in zip(TABLE_COLUMNS[table], row))
+
+
+def key_filter(table, keys):
+    # Условие WHERE и параметр для выборки строк по списку ключей (кортежей значений)
+    key_columns = TABLE_KEYS[table]
+    if len(key_columns) == 1:
+        return f"{key_columns[0]} IN %s", (tuple(key[0] for key in keys),)
+    return f"({', '.join(key_columns)}) IN %s", (tuple(tuple(key) for key in keys),)
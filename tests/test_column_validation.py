@@ -0,0 +1,49 @@
+# Проверка списка значений на NumPy (error.check_column) дает те же коды, что проверка по
+# одному значению, в том числе для значений на границе частей столбца
+import pytest
+
+import error
+from error import ANY, COD, DATE, DOUBLE, NUMB, TABLE_SPECS, TEXT, Field, check_column
+
+pytest.importorskip('numpy')
+
+VALUES = [
+    '', '0', '123', '0123456789', '12345678901', '-1', '1.5', '-1.5', '1.', '.5', '-', '1-2', '1.2.3',
+    '1..2', '--1', '77:01:0000001', ':', '1:a', '2024-02-29', '2023-02-29', '2000-02-29', '1900-02-29',
+    '0000-01-01', '2024-13-01', '2024-00-10', '2024-01-32', '2024-1-01', '2024-01-01x', '123\n',
+    '2024-01-01\n', '١٢٣', '٢٠٢٤-٠١-٠١', 'Дом 5', 'a@b', 'текст', 'x' * 130,
+]
+
+FIELDS = [field for fields in TABLE_SPECS.values() for field in fields] + [
+    Field('', kind) for kind in (ANY, NUMB, DOUBLE, TEXT, COD, DATE)
+] + [Field('', DOUBLE, 4, True), Field('', NUMB, 3)]
+
+
+def per_value(field, values):
+    return [field.error_code(value) for value in values]
+
+
+@pytest.mark.parametrize('chunk', [1, 7, error.COLUMN_CHUNK])
+def test_matches_per_value(monkeypatch, chunk):
+    monkeypatch.setattr(error, 'COLUMN_CHUNK', chunk)
+    for field in FIELDS:
+        mask, codes = check_column(field, VALUES)
+        expected = per_value(field, VALUES)
+        assert codes == expected, field.name or field.kind
+        assert mask == [code == error.COLUMN_OK for code in expected]
+
+
+def test_ascii_only_column():
+    values = [value for value in VALUES if value.isascii()]
+    for field in FIELDS:
+        assert check_column(field, values)[1] == per_value(field, values)
+
+
+def test_separator_inside_value():
+    field = Field('', NUMB)
+    values = ['12', '1\x002', '']
+    assert check_column(field, values)[1] == per_value(field, values)
+
+
+def test_empty_column():
+    assert check_column(Field('', NUMB), []) == ([], [])
@@ -0,0 +1,149 @@
+# Запросы страниц paging.py: текст SQL, порядок параметров и выдача PageStream по страницам.
+# Запросы выполняются в SQLite с правилом сравнения "C" по кодам символов, как на сервере
+import sqlite3
+
+import pytest
+
+from paging import PageStream, page_parts, page_sql
+from table_model import _sort_value
+from tables import TABLE_COLUMNS
+
+FLAT_ROWS = [
+    ('01', 'b', 'h1', 1, 1, 30),
+    ('02', None, 'h1', 2, 1, 31),
+    ('03', 'B', 'h1', 3, 1, 32),
+    ('04', 'а', 'h2', 4, 2, 33),
+    ('05', None, 'h2', 5, 2, 34),
+    ('06', 'b', 'h2', 6, 2, 35),
+    ('07', 'a', 'h2', 7, 3, 36),
+    ('08', None, 'h3', 8, 3, 37),
+    ('09', 'B', 'h3', 9, 3, 38),
+]
+
+
+def test_page_parts_split_nulls():
+    assert page_parts('flat', 'owner_uid', False) == [
+        ('owner_uid IS NOT NULL', ('owner_uid', 'cod_flt'), False),
+        ('owner_uid IS NULL', ('cod_flt',), True),
+    ]
+    assert page_parts('flat', 'owner_uid', True) == [
+        ('owner_uid IS NULL', ('cod_flt',), True),
+        ('owner_uid IS NOT NULL', ('owner_uid', 'cod_flt'), False),
+    ]
+    assert page_parts('flat', None, False) == [(None, ('cod_flt',), False)]
+
+
+def test_page_sql_first_page():
+    assert page_sql('SELECT * FROM flat', 'flat', ('owner_uid', 'cod_flt'), False, 3, 'owner_uid IS NOT NULL') == (
+        'SELECT * FROM (SELECT * FROM flat) AS page WHERE owner_uid IS NOT NULL '
+        'ORDER BY owner_uid COLLATE "C", cod_flt COLLATE "C" LIMIT 3')
+
+
+def test_page_sql_next_page_descending():
+    assert page_sql('SELECT * FROM flat', 'flat', ('square_flt', 'cod_flt'), True, 3, None, '<') == (
+        'SELECT * FROM (SELECT * FROM flat) AS page WHERE (square_flt, cod_flt COLLATE "C") < (%s, %s) '
+        'ORDER BY square_flt DESC, cod_flt COLLATE "C" DESC LIMIT 3')
+
+
+class SqlitePageStream(PageStream):
+    # Запросы страниц выполняются в SQLite; выполненные запросы с параметрами запоминаются
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.database = database
+        self.executed = []
+
+    def _execute(self, query, params):
+        self.executed.append((query, list(params)))
+        return self.database.execute(query.replace('%s', '?'), params).fetchall()
+
+
+@pytest.fixture
+def database():
+    database = sqlite3.connect(':memory:')
+    database.create_collation('C', lambda left, right: (left > right) - (left < right))
+    database.execute(f"CREATE TABLE flat ({', '.join(TABLE_COLUMNS['flat'])})")
+    database.executemany('INSERT INTO flat VALUES (?, ?, ?, ?, ?, ?)', FLAT_ROWS)
+    yield database
+    database.close()
+
+
+def read_all(stream, count):
+    rows = []
+    while not stream.exhausted:
+        rows += stream.fetch(count)
+    return rows
+
+
+def expected(column, descending):
+    # Порядок TableModel.sort: столбец сортировки, затем ключ; NULL последними по возрастанию
+    index = TABLE_COLUMNS['flat'].index(column)
+    return sorted(FLAT_ROWS, key=lambda row: (_sort_value(row[index]), row[0]), reverse=descending)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('count', [1, 2, 3, 4, 20])
+def test_stream_matches_local_order(database, descending, count):
+    stream = SqlitePageStream(database, 'SELECT * FROM flat', [], 'flat', 'owner_uid', descending, itersize=count)
+    assert read_all(stream, count) == expected('owner_uid', descending)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_stream_by_key(database, descending):
+    stream = SqlitePageStream(database, 'SELECT * FROM flat', [], 'flat', None, descending)
+    assert read_all(stream, 4) == sorted(FLAT_ROWS, reverse=descending)
+
+
+def test_page_boundary_params_ascending(database):
+    # Страница кончается перед строками с NULL: следующий запрос продолжает заполненную часть
+    # после последней строки, затем часть с NULL читается с начала
+    stream = SqlitePageStream(database, 'SELECT * FROM flat WHERE aprtmt_uid <> %s', ['h9'],
+                              'flat', 'owner_uid', False)
+    assert [row[0] for row in stream.fetch(3)] == ['03', '09', '07']
+    assert [row[0] for row in stream.fetch(3)] == ['01', '06', '04']
+    assert [row[0] for row in stream.fetch(3)] == ['02', '05', '08']
+    # Полная страница не показывает, что строк больше нет: это выясняет следующий запрос
+    assert not stream.exhausted
+    assert stream.fetch(3) == []
+    assert stream.exhausted
+    assert [params for _, params in stream.executed] == [
+        ['h9'],
+        ['h9', 'a', '07'],
+        ['h9', 'а', '04'],
+        ['h9'],
+        ['h9', '08'],
+    ]
+    assert '(owner_uid COLLATE "C", cod_flt COLLATE "C") > (%s, %s)' in stream.executed[1][0]
+    assert 'owner_uid IS NULL' in stream.executed[3][0]
+
+
+def test_page_boundary_params_descending(database):
+    # По убыванию строки с NULL идут первыми; граница страницы внутри них
+    stream = SqlitePageStream(database, 'SELECT * FROM flat', [], 'flat', 'owner_uid', True)
+    assert [row[0] for row in stream.fetch(2)] == ['08', '05']
+    assert [row[0] for row in stream.fetch(2)] == ['02', '04']
+    assert [row[0] for row in stream.fetch(6)] == ['06', '01', '07', '09', '03']
+    assert stream.exhausted
+    assert [params for _, params in stream.executed] == [
+        [],
+        ['05'],
+        [],
+        ['а', '04'],
+    ]
+    assert 'owner_uid IS NULL AND (cod_flt COLLATE "C") < (%s)' in stream.executed[1][0]
+    assert 'ORDER BY owner_uid COLLATE "C" DESC, cod_flt COLLATE "C" DESC' in stream.executed[3][0]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_start_key_continues_from_row(database, descending):
+    stream = SqlitePageStream(database, 'SELECT * FROM flat', [], 'flat', 'owner_uid', descending,
+                              start_key=('06',))
+    order = expected('owner_uid', descending)
+    start = [row[0] for row in order].index('06')
+    assert read_all(stream, 2) == order[start:]
+
+
+def test_start_key_missing(database):
+    stream = SqlitePageStream(database, 'SELECT * FROM flat', [], 'flat', 'owner_uid', False, start_key=('99',))
+    with pytest.raises(LookupError):
+        stream.fetch()
+    assert stream.exhausted
@@ -0,0 +1,60 @@
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from psycopg2 import extensions
+
+
+class TaskSignals(QObject):
+    # Сигналы создаются в потоке интерфейса, поэтому слоты вызываются в нем же
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    # Промежуточное состояние долгой задачи (например, число загруженных строк)
+    progress = pyqtSignal(object)
+
+
+class BackgroundTask(QRunnable):
+    # Выполняет fn(task, *args) в пуле потоков Qt и передает результат сигналами.
+    # Функция может зарегистрировать через watch() объект с методом cancel()
+    # (соединение или поток строк), чтобы запрос можно было прервать из интерфейса.
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = TaskSignals()
+        self.is_cancelled = False
+        self._watched = None
+
+    def watch(self, cancellable):
+        # watch(None) снимает наблюдение, например когда соединение возвращено в пул
+        self._watched = cancellable
+        if cancellable is not None and self.is_cancelled:
+            cancellable.cancel()
+
+    def cancel(self):
+        self.is_cancelled = True
+        watched = self._watched
+        if watched is not None:
+            try:
+                watched.cancel()
+            except Exception:
+                pass
+
+    def run(self):
+        try:
+            result = self.fn(self, *self.args)
+        except extensions.QueryCanceledError:
+            self.signals.cancelled.emit()
+            return
+        except Exception as error:
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(str(error))
+            return
+        if self.is_cancelled:
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
+
+
+def start_task(task):
+    QThreadPool.globalInstance().start(task)